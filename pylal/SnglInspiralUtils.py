@@ -25,6 +25,7 @@
 import copy
 
 from pylal import SearchSummaryUtils
+from pylal import trigstream
 from pylal.xlal.datatypes.ligotimegps import LIGOTimeGPS
 from glue.ligolw import ligolw
 from glue.ligolw import table
@@ -73,14 +74,20 @@ class SnglInspiralID_old(object):
     return lsctables.SnglInspiralID(a * 1000000000 + row.get_id_parts()[1] * 100000 + b)
 
 
-def ReadSnglInspiralFromFiles(fileList, verbose=False, filterFunc=None):
+def ReadSnglInspiralFromFiles(fileList, verbose=False, filterFunc=None,
+                              start=None, end=None, nprocs=1):
   """
   Read the SnglInspiralTables from a list of files.
   If filterFunc is not None, only keep triggers for which filterFunc
   evaluates to True.  Ex.: filterFunc=lambda sng: sng.snr >= 6.0
+  Triggers are filtered as each file is parsed, so those that are
+  dropped are never held in memory.
 
   @param fileList: list of input files
   @param verbose: print progress
+  @param start: if given, only keep triggers ending at or after start
+  @param end: if given, only keep triggers ending before end
+  @param nprocs: number of worker processes reading the files
   """
   # NOTE: this function no longer carries out event ID mangling (AKA
   # reassignment). Please adjust calling codes accordingly!
@@ -93,23 +100,9 @@ def ReadSnglInspiralFromFiles(fileList, verbose=False, filterFunc=None):
   # runs, coinc finding should be done one file at a time - see the
   # readCoincInspiralFromFiles function in CoincInspiralUtils.py
 
-  sngls = lsctables.New(lsctables.SnglInspiralTable, \
-      columns=lsctables.SnglInspiralTable.loadcolumns)
-
-  lsctables.use_in(ExtractSnglInspiralTableLIGOLWContentHandler)
-  for i,file in enumerate(fileList):
-    if verbose: print str(i+1)+"/"+str(len(fileList))+": "
-    xmldoc = utils.load_filename(file, verbose=verbose, contenthandler=ExtractSnglInspiralTableLIGOLWContentHandler)
-    try:
-      sngl_table = table.get_table(xmldoc, lsctables.SnglInspiralTable.tableName)
-      if filterFunc is not None:
-        iterutils.inplace_filter(filterFunc, sngl_table)
-    except ValueError: #some xml files have no sngl table, that's OK
-      sngl_table = None
-    if sngl_table: sngls.extend(sngl_table)
-    xmldoc.unlink()    #free memory
-
-  return sngls
+  return trigstream.read_triggers(fileList, \
+      lsctables.SnglInspiralTable.tableName, start=start, end=end, \
+      filterfunc=filterFunc, nprocs=nprocs, verbose=verbose)
 
 
 def ReadSnglInspiralSlidesFromFiles(fileList, shiftVector, vetoFile=None,
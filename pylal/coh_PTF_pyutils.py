@@ -25,6 +25,7 @@ import math
 import re
 
 from pylal import grbsummary, antenna, InspiralUtils, SimInspiralUtils
+from pylal import vetoindex
 from lal import PI as LAL_PI
 from lal import MTSUN_SI as LAL_MTSUN_SI
 
@@ -553,6 +554,35 @@ def apply_null_snr_veto(mi_table, null_snr=6.0, snr=20.0, grad=0.2,\
         out.extend(numpy.asarray(mi_table)[keep])
         return out
 
+def _veto_mask(self, seglist, time_slide_table=None):
+    """Return a boolean array, True for those rows of self lying inside
+    any elements of seglist.
+
+    If time_slide_table is not None, any time shifts will be undone and each
+    detector checked individually
+    """
+    index = vetoindex.VetoIndex(seglist)
+    times = numpy.asarray([float(row.get_end()) for row in self])
+    if not time_slide_table:
+        return index.mask(times)
+    slides = time_slide_table.as_dict()
+    for id_,vector in slides.items():
+        idx = str(id_).split(":")[-1]
+        slides["multi_inspiral:time_slide_id:%s" % idx] = vector
+        del slides[id_]
+    # group the rows by time slide and participating detectors, so that
+    # each group can be tested with one array operation per detector
+    groups = {}
+    for i,row in enumerate(self):
+        groups.setdefault((str(row.time_slide_id), row.ifos), []).append(i)
+    mask = numpy.zeros(len(times), dtype=bool)
+    for (slide_id,ifos),rows in groups.iteritems():
+        rows = numpy.asarray(rows)
+        ifos = self[rows[0]].get_ifos()
+        for ifo in ifos:
+            mask[rows] |= index.mask(times[rows], slides[slide_id][ifo])
+    return mask
+
 def veto(self, seglist, time_slide_table=None):
     """Return a MultiInspiralTable with those row from self not lying
     inside (i.e. not vetoed by) any elements of seglist.
@@ -560,31 +590,9 @@ def veto(self, seglist, time_slide_table=None):
     If time_slide_table is not None, any time shifts will be undone and each
     detector checked individually
     """
-    seglist = type(seglist)([type(seg)(*map(float, seg)) for seg in seglist])
+    mask = _veto_mask(self, seglist, time_slide_table=time_slide_table)
     keep = table.new_from_template(self)
-    if time_slide_table:
-        slides = time_slide_table.as_dict()
-        for id_,vector in slides.iteritems():
-            idx = str(id_).split(":")[-1]
-            slides["multi_inspiral:time_slide_id:%s" % idx] = vector
-            del slides[id_]
-        for row in self:
-            ifos = row.get_ifos()
-            for i,ifo in enumerate(ifos):
-                ifo_time = float(row.get_end() +
-                                 slides[str(row.time_slide_id)][ifo])
-                if ifo_time in seglist:
-                    i = -1
-                    break
-            if i != -1:
-                keep.append(row)
-    else:
-        for row in self:
-            time = float(row.get_end())
-            if time in seglist:
-                continue
-            else:
-                keep.append(row)
+    keep.extend(row for row,vetoed in zip(self, mask) if not vetoed)
     return keep
 
 
@@ -595,26 +603,7 @@ def vetoed(self, seglist, time_slide_table=None):
     If time_slide_table is not None, any time shifts will be undone and each
     detector checked individually
     """
-    seglist = type(seglist)(map(float, seglist))
+    mask = _veto_mask(self, seglist, time_slide_table=time_slide_table)
     vetoed = table.new_from_template(self)
-    if time_slide_table:
-        slides = time_slide_table.as_dict()
-        for id_,vector in slides.iteritems():
-            idx = str(id_).split(":")[-1]
-            slides["multi_inspiral:time_slide_id:%s" % idx] = vector
-            del slides[id_]
-        slides = get_slide_vectors(time_slide_table)
-        for row in self:
-            ifos = row.get_ifos()
-            for i,ifo in enumerate(ifos):
-                ifo_time = (float(row.get_end()) -
-                            slides[str(row.time_slide_id)][ifo])
-                if ifo_time in seglist:
-                    vetoed.append(row)
-                    break
-    else:
-        for row in self:
-            time = float(row.get_end())
-            if time in seglist:
-                vetoed.append(row)
+    vetoed.extend(row for row,vetoed_ in zip(self, mask) if vetoed_)
     return vetoed
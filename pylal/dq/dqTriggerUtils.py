@@ -6,7 +6,10 @@
 
 from __future__ import division
 import sys,os,re,math,datetime,glob,copy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from socket import getfqdn
+from StringIO import StringIO
 
 from glue.ligolw import ligolw,table,lsctables,utils
 from glue.ligolw.utils import process as ligolw_process
@@ -19,6 +22,9 @@ from lal.gpstime import LIGOTimeGPS,gps_to_utc,utc_to_gps
 
 from glue import git_version
 
+from pylal import vetoindex
+from pylal import trigstream
+
 from scipy import special
 import numpy
 
@@ -33,6 +39,7 @@ This module provides a bank of useful functions for manipulating triggers and tr
 # global regular expressions
 trigsep = re.compile('[\t\s,]+')
 _cchar_regex = re.compile('[-#%<!()_\[\]-{}:;\'\"\ ]')
+_comment_regex = re.compile('[#%]')
 
 # =============================================================================
 # Define ETG options
@@ -593,48 +600,22 @@ def fromtrigxml(file,tablename='sngl_inspiral:table',start=None,end=None,\
   """
 
   # set times
-  if not start:
-    start=0
-  if not end:
-    end=9999999999
-
-  span = segments.segment(start,end)
-
-  # set columns
-  if columns!=None:
-    if re.search('sngl_burst', tablename):
-      lsctables.SnglBurstTable.loadcolumns = columns
-    elif re.search('sngl_inspiral', tablename):
-      lsctables.SnglInspiralTable.loadcolumns = columns
-    if re.search('multi_burst', tablename):
-      lsctables.MultiBurstTable.loadcolumns = columns
-    elif re.search('multi_inspiral', tablename):
-      lsctables.MultiInspiralTable.loadcolumns = columns
+  start = start or None
+  end = end or None
 
   # set tablename
   if not tablename.endswith(':table'):
     tablename = ':'.join([tablename,'table'])
 
-  # crack open xml file
-  xmldoc,digest = utils.load_fileobj(file,gz=file.name.endswith('gz'))
-  alltriggers = table.get_table(xmldoc,tablename)
-
-  triggers = table.new_from_template(alltriggers)
-  append = triggers.append
-
-  get_time = def_get_time(triggers.tableName)
-  # parse triggers in time
-  for row in alltriggers:
-    if float(get_time(row)) in span:
-      append(row)
+  # stream the table from the file, keeping only the requested columns and
+  # the triggers in [start, end) as they are parsed
+  triggers = trigstream.load_triggers(file, tablename, start=start, end=end,\
+                                      columns=columns)
 
   # sort table in time
+  get_time = def_get_time(triggers.tableName)
   triggers.sort(key=lambda trig: float(get_time(trig)))
 
-  # reset columns
-  if columns:
-    type(triggers).loadcolumns = None
-
   return triggers
 
 # =============================================================================
@@ -692,13 +673,47 @@ def fromtrigfile(file,etg,start=None,end=None,ifo=None,channel=None,\
 # =============================================================================
 
 def fromLALCache(cache, etg, start=None, end=None, columns=None,\
-                 virgo=False, verbose=False, snr=False):
+                 virgo=False, verbose=False, snr=False, nprocs=1,\
+                 threads=False):
 
   """
     Extract triggers froa given ETG from all files in a glue.lal.Cache object.
     Returns a glue.ligolw.Table relevant to the given trigger generator etg.
+
+    Text files in formats supported by arrayfromtrigfile are parsed into
+    arrays first, by nprocs worker processes (or threads if threads=True),
+    and their rows are built once all files are read.
   """
 
+  trigs = SnglTriggerTable(etg, columns=columns)
+
+  # read text files through the columnar reader
+  if _trigarray_etg(etg) is not None:
+    xml = re.compile('(xml|xml.gz)\Z')
+    txtcache = [e for e in cache if not xml.search(e.path)]
+    if txtcache:
+      array = arrayfromLALCache(txtcache, etg, start=start, end=end,\
+                                columns=columns, virgo=virgo,\
+                                verbose=verbose, snr=snr, nprocs=nprocs,\
+                                threads=threads)
+      trigs.extend(totrigtable(array, etg, columns=columns))
+      cache = [e for e in cache if xml.search(e.path)]
+      if not cache:
+        return trigs
+
+  # read xml files in parallel
+  if nprocs > 1 and cache:
+    xmltrigs = trigstream.read_triggers([e.path for e in cache],\
+                                        trigs.tableName, start=start or None,\
+                                        end=end or None, columns=columns,\
+                                        sort=True, nprocs=nprocs,\
+                                        verbose=verbose)
+    if snr:
+      trigs.extend(t for t in xmltrigs if t.snr > snr)
+    else:
+      trigs.extend(xmltrigs)
+    return trigs
+
   # set up counter
   if verbose:
     sys.stdout.write("Extracting %s triggers from %d files...     "\
@@ -707,8 +722,6 @@ def fromLALCache(cache, etg, start=None, end=None, columns=None,\
     delete = '\b\b\b'
     num = len(cache)/100
 
-  trigs = SnglTriggerTable(etg, columns=columns)
-
   # load files
   for i,e in enumerate(cache):
     if re.search('(xml|xml.gz)\Z', e.path):
@@ -1128,7 +1141,8 @@ def cluster(triggers,params=[('time',1)],rank='snr'):
 
   """
     Cluster the lsctable triggers in the each of the pairs (column,width),
-    using the rank column.
+    using the rank column. The clusters are found with numpy on the column
+    arrays, and only the loudest trigger in each cluster is copied.
 
     Arguments:
 
@@ -1146,8 +1160,6 @@ def cluster(triggers,params=[('time',1)],rank='snr'):
 
   outtrigs = table.new_from_template(triggers)
 
-  j = 0
-
   cols = [p[0] for p in params]
   coldata = dict((p, get_column(triggers, p)) for p in cols+[rank])
   # need bandwidth and duration for all burst triggers
@@ -1166,95 +1178,83 @@ def cluster(triggers,params=[('time',1)],rank='snr'):
   for key in coldata.keys():
     coldata[key] = coldata[key].astype(float)
 
+  if not len(triggers):
+    return outtrigs
+
   # for each parameter break the clusters generated using the previous
   # parameter into smaller clusters by sorting triggers and clustering
-  # when all parameters have been used, pick the loudest in each cluster
-
-  clusters = [range(len(triggers))]
-
-  while j < len(params):
-
-    col,width = params[j]
-
-    newclusters = []
-
-    for k,subcluster in enumerate(clusters):
-
-      # sort triggers incluster parameter
-      subcluster.sort(key=lambda i: coldata[col][i])
-      subsubcluster = []
-
-      for i in subcluster:
-
-        # get value of param
-        if col=='time':
-	  valueStop = coldata['stop_time'][i]
-          valueStart = coldata['start_time'][i]
-        elif col=='peak_frequency':
-          valueStop = coldata['fhigh'][i]
-          valueStart = coldata['flow'][i]
-        else:
-          valueStop = coldata[col][i]
-          valueStart = valueStop
-
-        # if subcluster is empty, simply add the first trigger
-        if not subsubcluster:
-          subsubcluster = [i]
-          prevStop = valueStop
-          prevStart = valueStart
-          continue
-
-        # if current trig is inside width, append to cluster
-        if (valueStart-prevStop)<width:
-          subsubcluster.append(i)
-
-        # if not the subcluster is complete, append it to list and start again
-        else:
-          newclusters.append(subsubcluster)
-          subsubcluster=[i]
-
-        prevStart = valueStart
-        prevStop = valueStop
-
-      # append final subsubcluster
-      newclusters.append(subsubcluster)
-
-    clusters = copy.deepcopy(newclusters)
-    j += 1
-
-  # process clusters
-  for cluster in clusters:
-    if len(cluster)==1:
-      outtrigs.append(copy.deepcopy(triggers[cluster[0]]))
-    elif len(cluster) > 1:
-      carray = numpy.asarray(cluster)
-      cluster.sort(key=lambda i: coldata[rank][i], reverse=True)
-      t = copy.deepcopy(triggers[cluster[0]])    
-      # reset burst params for a clustered event
-      if _burst_regex.search(triggers.tableName):
-        # record most significant trigger
-        t.ms_start_time = t.start_time
-        t.ms_start_time_ns = t.start_time_ns
-        t.ms_stop_time = t.stop_time
-        t.ms_stop_time_ns = t.stop_time_ns
-        t.ms_duration = t.duration
-        t.ms_bandwidth = t.bandwidth
-        t.ms_flow = t.flow
-        t.ms_fhigh = t.fhigh
-        t.ms_snr = t.snr
-        # record cluster
-        start = LIGOTimeGPS(min(coldata['start_time'][carray]))
-        t.start_time = start.seconds
-        t.start_time_ns = start.nanoseconds
-        stop = LIGOTimeGPS(max(coldata['stop_time'][carray]))
-        t.stop_time = stop.seconds
-        t.stop_time_ns = stop.nanoseconds
-        t.duration = float(t.get_stop()-t.get_start())
-        t.flow = min(coldata['flow'][carray])
-        t.fhigh = max(coldata['fhigh'][carray])
-        t.bandwidth = t.fhigh-t.flow
-        t.tfvolume = t.bandwidth * t.duration
-      outtrigs.append(t)
+  # when all parameters have been used, pick the loudest in each cluster.
+  # order holds the trigger indices grouped by cluster, and label the
+  # cluster number of each entry in order
+
+  order = numpy.arange(len(triggers))
+  label = numpy.zeros(len(triggers), dtype=int)
+
+  for col,width in params:
+
+    # sort triggers in cluster parameter within each cluster, the sort is
+    # stable so ties keep their current order
+    perm = numpy.lexsort((coldata[col][order], label))
+    order = order[perm]
+    label = label[perm]
+
+    # get extent of param
+    if col=='time':
+      valueStart = coldata['start_time'][order]
+      valueStop = coldata['stop_time'][order]
+    elif col=='peak_frequency':
+      valueStart = coldata['flow'][order]
+      valueStop = coldata['fhigh'][order]
+    else:
+      valueStart = valueStop = coldata[col][order]
+
+    # a new cluster starts with each trigger not inside width of the
+    # previous one, or at the start of an existing cluster
+    newcluster = ~((valueStart[1:]-valueStop[:-1])<width) |\
+                 (label[1:]!=label[:-1])
+    label = numpy.concatenate(([0], numpy.cumsum(newcluster)))
+
+  # process clusters: the loudest trigger in each is the first in order
+  # with the highest rank
+  perm = numpy.lexsort((-coldata[rank][order], label))
+  first = numpy.flatnonzero(numpy.concatenate(([True],\
+                                               label[1:]!=label[:-1])))
+  loudest = order[perm][first]
+  size = numpy.diff(numpy.concatenate((first, [len(order)])))
+
+  if _burst_regex.search(triggers.tableName):
+    start = numpy.minimum.reduceat(coldata['start_time'][order], first)
+    stop = numpy.maximum.reduceat(coldata['stop_time'][order], first)
+    flow = numpy.minimum.reduceat(coldata['flow'][order], first)
+    fhigh = numpy.maximum.reduceat(coldata['fhigh'][order], first)
+
+  for k,i in enumerate(loudest):
+    t = copy.copy(triggers[i])
+    # reset burst params for a clustered event
+    if size[k] > 1 and _burst_regex.search(triggers.tableName):
+      # record most significant trigger
+      t.ms_start_time = t.start_time
+      t.ms_start_time_ns = t.start_time_ns
+      t.ms_stop_time = t.stop_time
+      t.ms_stop_time_ns = t.stop_time_ns
+      t.ms_duration = t.duration
+      t.ms_bandwidth = t.bandwidth
+      t.ms_flow = t.flow
+      t.ms_fhigh = t.fhigh
+      t.ms_snr = t.snr
+      # record cluster
+      tstart = LIGOTimeGPS(float(start[k]))
+      t.start_time = tstart.seconds
+      t.start_time_ns = tstart.nanoseconds
+      tstop = LIGOTimeGPS(float(stop[k]))
+      t.stop_time = tstop.seconds
+      t.stop_time_ns = tstop.nanoseconds
+      t.duration = float(t.get_stop()-t.get_start())
+      t.flow = float(flow[k])
+      t.fhigh = float(fhigh[k])
+      t.bandwidth = t.fhigh-t.flow
+      t.tfvolume = t.bandwidth * t.duration
+    outtrigs.append(t)
 
   # resort trigs in first parameter
   outtrigs.sort(key=lambda t: get(t, cols[0]))
@@ -1315,6 +1315,33 @@ def autocorr(triggers,column='time',timeStep=0.02,timeRange=60):
 # Get coincidences between two tables
 # =============================================================================
 
+def coinc_segments(time2, dt=1, timeshift=0):
+
+  """
+    Returns arrays of the start and end times of the coalesced segments
+    [t-dt+timeshift, t+dt+timeshift) around the times t in time2, i.e. the
+    segments of the segmentlist built and coalesced in get_coincs, without
+    constructing a segment per time.
+  """
+
+  time2 = numpy.asarray(time2, dtype=float)
+  lo = time2-dt+timeshift
+  hi = time2+dt+timeshift
+  order = lo.argsort(kind='mergesort')
+  lo = lo[order]
+  hi = numpy.maximum.accumulate(hi[order])
+
+  # a segment starts wherever the next start is beyond the end of
+  # everything before it
+  first = numpy.flatnonzero(numpy.concatenate(([True], lo[1:] > hi[:-1])))
+  last = numpy.concatenate((first[1:]-1, [len(lo)-1]))
+  starts = lo[first]
+  ends = hi[last]
+
+  # empty segments are discarded by coalescing
+  keep = starts != ends
+  return starts[keep],ends[keep]
+
 def get_coincs(table1, table2, dt=1, returnsegs=False, timeshift=0):
 
   """
@@ -1325,13 +1352,18 @@ def get_coincs(table1, table2, dt=1, returnsegs=False, timeshift=0):
   t1 = get_column(table1, 'time')
   t2 = get_column(table2, 'time')
 
-  coincsegs  = segments.segmentlist(segments.segment(t-dt+timeshift, t+dt+timeshift) for t in t2)\
-                   .coalesce()
-  coincsegs.sort()
+  starts,ends = coinc_segments(t2, dt=dt, timeshift=timeshift)
+  if len(starts):
+    k = starts.searchsorted(t1, side='right')-1
+    coinc = (k>=0) & (t1 < ends[numpy.maximum(k, 0)])
+  else:
+    coinc = numpy.zeros(len(t1), dtype=bool)
   coinctrigs = table.new_from_template(table1)
-  coinctrigs.extend(t for i,t in enumerate(table1) if t1[i] in coincsegs)
+  coinctrigs.extend(t for i,t in enumerate(table1) if coinc[i])
 
   if returnsegs:
+    coincsegs = segments.segmentlist(segments.segment(seg) for seg in\
+                                     zip(starts.tolist(), ends.tolist()))
     return coinctrigs,coincsegs
   else:
     return coinctrigs
@@ -1367,18 +1399,34 @@ def get_number_coincs(table1, table2, dt=1, timeshift=0, tabletype='trigger'):
   else:
     raise ValueError("Unrecognized table type for coincidence number: %s" % tabletype)
 
-  time1.sort()
-  time2.sort()
+  return get_number_coincs_timeshifts(time1, time2, dt=dt,\
+                                      timeshifts=[timeshift])[0]
+
+def get_number_coincs_timeshifts(time1, time2, dt=1, timeshifts=[0]):
+
+  """
+    Returns an array holding, for each of the given timeshifts, the number of
+    times in time1 within +-dt of a time in time2 shifted by that timeshift.
+
+    The time arrays are sorted once, after which the count for each timeshift
+    is one numpy.searchsorted for the first window each time in time1 could
+    fall in, so scanning thousands of timeshifts for a pair of channels is a
+    single call.
+  """
 
-  i2 = 0
-  ncoinc = 0
-  for i1,t1 in enumerate(time1):
-    while  i2 < len(time2) and t1 > time2[i2]+timeshift+dt:
-      i2 = i2 + 1
-    if i2 >= len(time2):
-      break
-    if t1 >= time2[i2]+timeshift-dt:
-      ncoinc = ncoinc + 1
+  time1 = numpy.sort(numpy.asarray(time1, dtype=float))
+  time2 = numpy.sort(numpy.asarray(time2, dtype=float))
+
+  ncoinc = numpy.zeros(len(timeshifts), dtype=int)
+  if not len(time2):
+    return ncoinc
+
+  for k,timeshift in enumerate(timeshifts):
+    shifted = time2+timeshift
+    # index of the first window whose end is not before each time
+    i2 = (shifted+dt).searchsorted(time1, side='left')
+    found = i2 < len(time2)
+    ncoinc[k] = (time1[found] >= (shifted-dt)[i2[found]]).sum()
 
   return ncoinc
 
@@ -1421,6 +1469,52 @@ def coinc_significance_times(gwtrigtime, auxtrigtime, window=1, livetime=None):
   return significance
 
 
+# ==============================================================================
+# Calculate poisson significance of time coincidences over many time shifts
+# ==============================================================================
+
+def coinc_significance_timeshifts(gwtrigtime, auxtrigtime, timeshifts, window=1,\
+                                  livetime=None):
+
+  """
+    Returns a tuple of arrays holding the number of coincidences and their
+    significance, as computed by coinc_significance_times, for the auxiliary
+    trigger times shifted by each of the given timeshifts.
+  """
+
+  # get livetime
+  if not livetime:
+    start    = min(gwtrigtime)
+    end      = max(gwtrigtime)
+    livetime = end-start
+
+  # calculate probability of a GW trigger falling within the window
+  gwprob = len(gwtrigtime) * 2.0 * float(window) / float(livetime)
+
+  # calculate mean of Poisson distribution
+  mu = gwprob * len(auxtrigtime)
+
+  # get coincidences
+  ncoinc = get_number_coincs_timeshifts(gwtrigtime, auxtrigtime, dt=window,\
+                                        timeshifts=timeshifts)
+
+  significance = numpy.zeros(len(ncoinc))
+  # if no coincidences, significance is zero
+  found = ncoinc>=1
+  g = special.gammainc(ncoinc[found], mu)
+  sig = numpy.empty(len(g))
+  # if significance would blow up, use other formula (ref. hveto_significance.m)
+  small = g == 0
+  n = ncoinc[found][small]
+  sig[small] = -n * math.log10(mu) + \
+               mu * math.log10(math.exp(1)) +\
+               special.gammaln(n + 1) / math.log(10)
+  # otherwise use the standard formula
+  sig[~small] = -numpy.log10(g[~small])
+  significance[found] = sig
+
+  return ncoinc,significance
+
 # ==============================================================================
 # Calculate poisson significance of trigger coincidences
 # ==============================================================================
@@ -1545,11 +1639,15 @@ def veto(self, seglist, inverse=False):
 
   get_time = def_get_time(self.tableName)
 
+  # test all trigger times against the segment boundaries at once
+  times = numpy.fromiter((float(get_time(t)) for t in self), dtype=float,\
+                         count=len(self))
+  mask = vetoindex.VetoIndex(seglist).mask(times)
+  if not inverse:
+    mask = ~mask
+
   keep = table.new_from_template(self)
-  if inverse:
-    keep.extend(t for t in self if float(get_time(t)) in seglist)
-  else:
-    keep.extend(t for t in self if float(get_time(t)) not in seglist)
+  keep.extend(t for t,m in zip(self, mask) if m)
 
   return keep
 
@@ -1596,130 +1694,9 @@ def fromomegafile(fname, start=None, end=None, ifo=None, channel=None,\
         list of columnnames to populate in table
   """
 
-  # set columns
-  if columns==None: columns = lsctables.SnglBurst.__slots__
-  if start or end:
-    if not start:
-      start = 0
-    if not end:
-      end   = numpy.inf
-    span = segments.segment(start, end)
-    if 'peak_time' not in columns: columns.append('peak_time')
-    if 'peak_time_ns' not in columns: columns.append('peak_time_ns')
-    check_time = True
-  else:
-    check_time = False
-
-  if 'snr' in columns and not 'amplitude' in columns:
-    columns.append('amplitude')
-
-  # generate table
-  out = SnglTriggerTable('omega', columns=columns)
-
-  # force filename not file object
-  if hasattr(fname, 'readline'):
-    fh = fname
-  else:
-    fh = open(fname, 'r')
-
-  dat = loadtxt(fh)
-
-  if not hasattr(fname, 'readline'):
-    fh.close()
-
-  if numpy.shape(dat) == (0,):
-    return out
-
-  if virgo:
-    start, stop, peak, freq, bandwidth, cln, cle, snr = dat
-    duration = stop-start
-    amplitude = snr**2/2
-    omega_clusters = False
-  if len(dat)==11:
-    peak, freq, duration, bandwidth, amplitude, cls, cle, cln, av_freq, av_bandwidth, err_freq = dat
-    omega_clusters = True
-  else:
-    if len(dat)==8:
-      peak, freq, duration, bandwidth, amplitude, cls, cle, cln = dat
-      omega_clusters = True
-    elif len(dat)==5:
-      peak, freq, duration, bandwidth, amplitude = dat
-      omega_clusters = False
-    else:
-      raise ValueError("Wrong number of columns in omega format file. "\
-                         "Cannot read.")
-    av_freq = freq
-    av_bandwidth = bandwidth
-    err_freq = av_bandwidth/av_freq
-
-  numtrigs = len(peak)
-  attr_map = dict()
-
-  if 'start_time' in columns or 'start_time_ns' in columns:
-    start = map(LIGOTimeGPS, peak - duration/2)
-    attr_map['start_time'], attr_map['start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in start])
-  if 'stop_time' in columns or 'stop_time_ns' in columns:
-    stop = map(LIGOTimeGPS, peak + duration/2)
-    attr_map['stop_time'], attr_map['stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in stop])
-  if 'peak_time' in columns or 'peak_time_ns' in columns:
-    peak = map(LIGOTimeGPS, peak)
-    attr_map['peak_time'], attr_map['peak_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in peak])
-
-  if 'ms_start_time' in columns or 'ms_start_time_ns' in columns:
-    ms_start = map(LIGOTimeGPS, peak-duration/2)
-    attr_map['ms_start_time'], attr_map['ms_start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_start])
-  if 'ms_stop_time' in columns or 'ms_stop_time_ns' in columns:
-    ms_stop = map(LIGOTimeGPS, peak+duration/2)
-    attr_map['ms_stop_time'], attr_map['ms_stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_stop])
-
-  if 'central_freq' in columns:   attr_map['central_freq']   = freq
-  if 'peak_frequency' in columns: attr_map['peak_frequency'] = av_freq
-  if 'peak_frequency_error' in columns: attr_map['peak_frequency_error'] = err_freq
-  if 'bandwidth' in columns:      attr_map['bandwidth']      = av_bandwidth
-  if 'ms_bandwidth' in columns:   attr_map['ms_bandwidth']   = bandwidth
-  if 'flow' in columns:           attr_map['flow']           = freq-bandwidth/2
-  if 'fhigh' in columns:          attr_map['fhigh']          = freq+bandwidth/2
-  if 'ms_flow' in columns:        attr_map['ms_flow']        = freq-bandwidth/2
-  if 'ms_fhigh' in columns:       attr_map['ms_fhigh']       = freq+bandwidth/2
-
-  if 'duration' in columns:       attr_map['duration']       = duration
-  if 'ms_duration' in columns:    attr_map['ms_duration']    = duration
-  if 'snr' in columns:            attr_map['snr']         = (2*amplitude)**(1/2)
-  if 'ms_snr' in columns:         attr_map['ms_snr']      = (2*amplitude)**(1/2)
-
-  if 'cluster_size' in columns or 'param_one_value' in columns:
-    attr_map['param_one_name'] = ['cluster_size'] * numtrigs
-    if omega_clusters:
-      attr_map['param_one_value'] = cls
-    else:
-      attr_map['param_one_value'] = [numpy.NaN] * numtrigs
-  if 'cluster_norm_energy' in columns or 'param_two_value' in columns:
-    attr_map['param_two_name'] = ['cluster_norm_energy'] * numtrigs
-    if omega_clusters:
-      attr_map['param_two_value'] = cls
-    else:
-      attr_map['param_two_value'] = [numpy.NaN] * numtrigs
-  if 'cluster_size' in columns or 'param_three_value' in columns:
-    attr_map['param_three_name'] = ['cluster_number'] * numtrigs
-    if omega_clusters:
-      attr_map['param_three_value'] = cls
-    else:
-      attr_map['param_three_value'] = [numpy.NaN] * numtrigs
-
-  cols   = attr_map.keys()
-  append = out.append
-  for i in range(numtrigs):
-    t = lsctables.SnglBurst()
-    for c in cols: setattr(t, c, attr_map[c][i])
-    if not check_time or (check_time and float(t.get_peak()) in span):
-      append(t)
-  
-  return out
+  array = arrayfromtrigfile(fname, 'omega', start=start, end=end,\
+                            columns=columns, virgo=virgo)
+  return totrigtable(array, 'omega', ifo=ifo, channel=channel, columns=columns)
 
 def fromkwfile(fname, start=None, end=None, ifo=None, channel=None,\
                columns=None):
@@ -1751,111 +1728,8 @@ def fromkwfile(fname, start=None, end=None, ifo=None, channel=None,\
         list of columnnames to populate in table
   """
 
-  # set columns
-  if columns==None: columns = lsctables.SnglBurst.__slots__
-  if start or end:
-    if not start:
-      start = 0
-    if not end:
-      end   = numpy.inf
-    span = segments.segment(start, end)
-    if 'peak_time' not in columns: columns.append('peak_time')
-    if 'peak_time_ns' not in columns: columns.append('peak_time_ns')
-    check_time = True
-  else:
-    check_time = False
-
-  # generate table
-  out = SnglTriggerTable('kw', columns=columns)
-
-  # force filename not file object
-  if hasattr(fname, 'readline'):
-    fh = fname
-  else:
-    fh = open(fname, 'r')
-
-  # load data from file
-  dat = loadtxt(fh, usecols=[0,1,2,3,4,5,6,7])
-
-  # close file if we opened it
-  if not hasattr(fname, 'readline'):
-    fh.close()
-
-  if numpy.shape(dat) == (0,):
-    return out
-
-  if len(dat)==8:
-    st, stop, peak, freq, energy, amplitude, n_pix, sig = dat
-  else:
-    raise ValueError("Wrong number of columns in KW format file. "\
-                     "Cannot read.")
-
-  numtrigs = len(peak)
-
-  attr_map = dict()
-
-  if 'duration' in columns:       attr_map['duration']       = stop-st
-  if 'ms_duration' in columns:    attr_map['ms_duration']    = stop-st
-
-  if 'start_time' in columns or 'start_time_ns' in columns:
-    start = map(LIGOTimeGPS, st)
-    attr_map['start_time'], attr_map['start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in start])
-  if 'stop_time' in columns or 'stop_time_ns' in columns:
-    stop = map(LIGOTimeGPS, stop)
-    attr_map['stop_time'], attr_map['stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in stop])
-  if 'peak_time' in columns or 'peak_time_ns' in columns:
-    peak = map(LIGOTimeGPS, peak)
-    attr_map['peak_time'], attr_map['peak_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in peak])
-
-  if 'ms_start_time' in columns or 'ms_start_time_ns' in columns:
-    ms_start = map(LIGOTimeGPS, st)
-    attr_map['ms_start_time'], attr_map['ms_start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_start])
-  if 'ms_stop_time' in columns or 'ms_stop_time_ns' in columns:
-    ms_stop = map(LIGOTimeGPS, stop)
-    attr_map['ms_stop_time'], attr_map['ms_stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_stop])
-
-  if 'central_freq' in columns:   attr_map['central_freq']   = freq
-  if 'peak_frequency' in columns: attr_map['peak_frequency'] = freq
-  if 'bandwidth' in columns:      attr_map['bandwidth'] = numpy.zeros(len(freq))
-  if 'ms_bandwidth' in columns: attr_map['ms_bandwidth'] = attr_map['bandwidth']
-  if 'flow' in columns:           attr_map['flow']           = freq
-  if 'fhigh' in columns:          attr_map['fhigh']          = freq
-  if 'ms_flow' in columns:        attr_map['ms_flow']        = freq
-  if 'ms_fhigh' in columns:       attr_map['ms_fhigh']       = freq
-
-  if 'duration' in columns:       attr_map['duration']       = stop-st
-  if 'ms_duration' in columns:    attr_map['ms_duration']    = stop-st
-  if 'snr' in columns:         attr_map['snr']     = (amplitude-n_pix)**(1/2)
-  if 'ms_snr' in columns:      attr_map['ms_snr']  = (amplitude-n_pix)**(1/2)
-  if 'confidence' in columns:      attr_map['confidence']  = sig
-  
-  if 'n_pix' in columns or 'param_one_value' in columns:
-    attr_map['param_one_name'] = ['n_pix'] * numtrigs
-    attr_map['param_one_value'] = n_pix
-  """
-  if 'significance' in columns or 'param_two_value' in columns:
-    attr_map['param_two_name'] = ['significance'] * numtrigs
-    attr_map['param_two_value'] = sig
-  """
-
-  cols   = attr_map.keys()
-  append = out.append
-  for i in range(numtrigs):
-    t = lsctables.SnglBurst()
-    for c in cols: setattr(t, c, attr_map[c][i])
-    if ifo!=None:
-      t.ifo = ifo
-    if channel!=None:
-      t.channel = channel
-    if not check_time or (check_time and t.get_peak() in span):
-      append(t)
-  
-  return out
+  array = arrayfromtrigfile(fname, 'kw', start=start, end=end, columns=columns)
+  return totrigtable(array, 'kw', ifo=ifo, channel=channel, columns=columns)
 
 def fromomegaspectrumfile(fname, start=None, end=None, ifo=None, channel=None,\
                           columns=None):
@@ -2119,128 +1993,9 @@ def fromhacrfile(fname, start=None, end=None, ifo=None, channel=None,\
         list of columnnames to populate in table
   """
 
-  # set columns
-  if columns==None: columns = lsctables.SnglBurst.__slots__
-  if start or end:
-    if not start:
-      start = 0
-    if not end:
-      end   = numpy.inf
-    span = segments.segment(start, end)
-    if 'peak_time' not in columns: columns.append('peak_time')
-    if 'peak_time_ns' not in columns: columns.append('peak_time_ns')
-    check_time = True
-  else:
-    check_time = False
-
-  # generate table
-  out = SnglTriggerTable('hacr', columns=columns)
-
-  # force filename not file object
-  if hasattr(fname, 'readline'):
-    fh = fname
-  else:
-    fh = open(fname, 'r')
-      
-  # load data from file
-  dat = loadtxt(fh)
-
-  # close file if we opened it
-  if not hasattr(fname, 'readline'):
-    fh.close()
-
-  if numpy.shape(dat) == (0,):
-    return out
-  elif numpy.shape(dat) == (8,):
-    peak_time, peak_time_offset, freq, bandwidth, duration, n_pix, snr,\
-    totPower = map(lambda n: numpy.asarray([n]), dat)
-  elif len(dat)==8:
-    peak_time, peak_time_offset, freq, bandwidth, duration, n_pix, snr,\
-    totPower = dat
-  else:
-    raise ValueError("Wrong number of columns in HACR format file. "\
-                     "Cannot read.")
-
-  numtrigs = len(peak_time)
-
-  if columns==None: columns = lsctables.SnglBurst.__slots__   
-  if start or end:
-    if not start:
-      start = 0
-    if not end:
-      end   = numpy.inf
-    span = segments.segment(start, end)
-    if 'peak_time' not in columns: columns.append('peak_time')
-    if 'peak_time_ns' not in columns: columns.append('peak_time_ns')
-    check_time = True
-  else:
-    check_time = False
-
-  attr_map = dict()
-
-  peak = peak_time+peak_time_offset
-  if 'start_time' in columns or 'start_time_ns' in columns:
-    start = map(LIGOTimeGPS, peak-duration/2)
-    attr_map['start_time'], attr_map['start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in start])
-  if 'stop_time' in columns or 'stop_time_ns' in columns:
-    stop = map(LIGOTimeGPS, peak+duration/2)
-    attr_map['stop_time'], attr_map['stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in stop])
-  if 'peak_time' in columns or 'peak_time_ns' in columns:
-    peak = map(LIGOTimeGPS, peak)
-    attr_map['peak_time'], attr_map['peak_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in peak])
-
-  if 'ms_start_time' in columns or 'ms_start_time_ns' in columns:
-    ms_start = map(LIGOTimeGPS, peak-duration/2)
-    attr_map['ms_start_time'], attr_map['ms_start_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_start])
-  if 'ms_stop_time' in columns or 'ms_stop_time_ns' in columns:
-    ms_stop = map(LIGOTimeGPS, peak+duration/2)
-    attr_map['ms_stop_time'], attr_map['ms_stop_time_ns'] =\
-        zip(*[(s.seconds, s.nanoseconds) for s in ms_stop])
-
-  if 'duration' in columns:       attr_map['duration']       = duration
-  if 'ms_duration' in columns:    attr_map['ms_duration']    = duration
-  if 'central_freq' in columns:   attr_map['central_freq']   = freq
-  if 'peak_frequency' in columns: attr_map['peak_frequency'] = freq
-  if 'peak_frequency_error' in columns: attr_map['peak_frequency_error'] = bandwidth/freq
-
-  if 'flow' in columns:           attr_map['flow']           = freq-bandwidth/2
-  if 'fhigh' in columns:          attr_map['fhigh']          = freq+bandwidth/2
-  if 'bandwidth' in columns:      attr_map['bandwidth']      = bandwidth
-  if 'ms_flow' in columns:        attr_map['ms_flow']        = freq-bandwidth/2
-  if 'ms_fhigh' in columns:       attr_map['ms_fhigh']       = freq+bandwidth/2
-  if 'ms_bandwidth' in columns:   attr_map['ms_bandwidth']   = bandwidth
-
-  if 'snr' in columns:            attr_map['snr']            = snr
-  if 'ms_snr' in columns:         attr_map['ms_snr']         = snr
-
-  if 'peak_time_offset' in columns or 'param_one_value' in columns\
-  or 'peak_time_ns' in columns:
-    attr_map['param_one_name'] = ['peak_time_offset'] * numtrigs
-    attr_map['param_one_value'] = peak_time_offset
-  if 'numPixels' in columns or 'param_two_value' in columns:
-    attr_map['param_two_name'] = ['numPixels'] * numtrigs
-    attr_map['param_two_value'] = n_pix
-  if 'totPower' in columns or 'param_three_value' in columns:
-    attr_map['param_three_name'] = ['totPower'] * numtrigs
-    attr_map['param_three_value'] = totPower
-
-  cols   = attr_map.keys()
-  append = out.append
-  for i in range(numtrigs):
-    t = lsctables.SnglBurst()
-    for c in cols: setattr(t, c, attr_map[c][i])
-    if ifo!=None:
-      t.ifo = ifo
-    if channel!=None:
-      t.channel = channel
-    if not check_time or (check_time and t.get_peak() in span):
-      append(t)
-  
-  return out
+  array = arrayfromtrigfile(fname, 'hacr', start=start, end=end,\
+                            columns=columns)
+  return totrigtable(array, 'hacr', ifo=ifo, channel=channel, columns=columns)
 
 def fromihopefile(fname, start=None, end=None, ifo=None, channel=None,\
                   columns=None):
@@ -2272,64 +2027,402 @@ def fromihopefile(fname, start=None, end=None, ifo=None, channel=None,\
         list of columnnames to populate in table
   """
 
-  # get columns
-  def_cols = dict(enumerate(['end_time','end_time_ns','ifo','snr','mass1',\
-                             'mass2', 'mtotal','eta','event_duration',\
-                             'template_duration','eff_distance','chisq',\
-                             'chisq_dof','bank_chisq','bank_chisq_dof',\
-                             'cont_chisq','cont_chisq_dof']))
+  array = arrayfromtrigfile(fname, 'ihope', start=start, end=end,\
+                            columns=columns)
+  return totrigtable(array, 'ihope', ifo=ifo, channel=channel, columns=columns)
 
-  if columns==None: columns = lsctables.SnglInspiral.__slots__   
-  if start or end:
-    if not start:
-      start = 0
-    if not end:
-      end   = numpy.inf
-    span = segments.segment(start, end)
-    if 'end_time' not in columns: columns.append('end_time')
-    if 'end_time_ns' not in columns: columns.append('end_time_ns')
-    check_time = True
+# =============================================================================
+# Columnar trigger arrays
+# =============================================================================
+
+# names given to the param_{one,two,three}_value columns by each ETG, these
+# are also accepted as aliases for the value columns in columns arguments
+_trigarray_params = {
+  'omega': [('param_one', 'cluster_size'), ('param_two', 'cluster_norm_energy'),\
+            ('param_three', 'cluster_number')],
+  'kw':    [('param_one', 'n_pix')],
+  'hacr':  [('param_one', 'peak_time_offset'), ('param_two', 'numPixels'),\
+            ('param_three', 'totPower')],
+  'ihope': [],
+}
+
+# ordered columns of the ihope CSV format
+_ihope_columns = ['end_time', 'end_time_ns', 'ifo', 'snr', 'mass1', 'mass2',\
+                  'mtotal', 'eta', 'event_duration', 'template_duration',\
+                  'eff_distance', 'chisq', 'chisq_dof', 'bank_chisq',\
+                  'bank_chisq_dof', 'cont_chisq', 'cont_chisq_dof']
+
+def _trigarray_etg(etg):
+
+  """
+    Returns the text format read by arrayfromtrigfile for the given etg, or
+    None if that ETG is not supported.
+  """
+
+  if re.search('omega(spectrum|dq)', etg, re.I):
+    return None
+  for key in ['omega', 'kw', 'hacr', 'ihope']:
+    if re.search(key, etg, re.I):
+      return key
+  return None
+
+def _gps_split(t):
+
+  """
+    Split the array of float GPS times t into integer seconds and nanoseconds,
+    rounding as LIGOTimeGPS(float) does.
+  """
+
+  t   = numpy.asarray(t, dtype=float)
+  sec = numpy.floor(t)
+  ns  = numpy.round((t-sec)*1e9)
+  carry = ns >= 1e9
+  sec[carry] += 1
+  ns[carry]  -= 1e9
+  return sec.astype(int), ns.astype(int)
+
+def _burst_columns(peak, start, stop):
+
+  """
+    Returns a dict of the time columns of a SnglBurst table for the given
+    arrays of float peak, start and stop times.
+  """
+
+  cols = dict()
+  cols['peak_time'], cols['peak_time_ns'] = _gps_split(peak)
+  cols['start_time'], cols['start_time_ns'] = _gps_split(start)
+  cols['stop_time'], cols['stop_time_ns'] = _gps_split(stop)
+  for c in ['start_time', 'start_time_ns', 'stop_time', 'stop_time_ns']:
+    cols['ms_%s' % c] = cols[c]
+  cols['duration'] = cols['ms_duration'] = stop-start
+  return cols
+
+def _omega_columns(fh, start=None, end=None, virgo=False):
+
+  """
+    Parse an Omega format text file into a dict of SnglBurst columns.
+  """
+
+  if virgo:
+    dat = loadarray(fh, timefunc=lambda c: c[2], start=start, end=end, ncols=8)
   else:
-    check_time = False
+    dat = loadarray(fh, timefunc=lambda c: c[0], start=start, end=end, ncols=5)
+
+  if virgo:
+    if len(dat)!=8:
+      raise ValueError("Wrong number of columns in omega format file. "\
+                       "Cannot read.")
+    st, stop, peak, freq, bandwidth, cln, cle, snr = dat
+    cls = numpy.repeat(numpy.nan, len(peak))
+    amplitude = snr**2/2
+    av_freq = freq
+    av_bandwidth = bandwidth
+    err_freq = bandwidth/freq
+  else:
+    if len(dat)==11:
+      peak, freq, duration, bandwidth, amplitude, cls, cle, cln, av_freq,\
+      av_bandwidth, err_freq = dat
+    elif len(dat)==8:
+      peak, freq, duration, bandwidth, amplitude, cls, cle, cln = dat
+    elif len(dat)==5:
+      peak, freq, duration, bandwidth, amplitude = dat
+      cls = cle = cln = numpy.repeat(numpy.nan, len(peak))
+    else:
+      raise ValueError("Wrong number of columns in omega format file. "\
+                       "Cannot read.")
+    if len(dat)!=11:
+      av_freq = freq
+      av_bandwidth = bandwidth
+      err_freq = av_bandwidth/av_freq
+    st   = peak-duration/2
+    stop = peak+duration/2
+
+  cols = _burst_columns(peak, st, stop)
+  cols['central_freq']         = freq
+  cols['peak_frequency']       = av_freq
+  cols['peak_frequency_error'] = err_freq
+  cols['bandwidth']            = av_bandwidth
+  cols['ms_bandwidth']         = bandwidth
+  cols['flow'] = cols['ms_flow']   = freq-bandwidth/2
+  cols['fhigh'] = cols['ms_fhigh'] = freq+bandwidth/2
+  cols['amplitude']            = amplitude
+  cols['snr'] = cols['ms_snr'] = (2*amplitude)**(1/2)
+  cols['param_one_value']      = cls
+  cols['param_two_value']      = cle
+  cols['param_three_value']    = cln
+
+  return cols
+
+def _kw_columns(fh, start=None, end=None):
+
+  """
+    Parse a KW format text file into a dict of SnglBurst columns.
+  """
+
+  dat = loadarray(fh, usecols=[0,1,2,3,4,5,6,7], timefunc=lambda c: c[2],\
+                  start=start, end=end)
+
+  st, stop, peak, freq, energy, amplitude, n_pix, sig = dat
+
+  cols = _burst_columns(peak, st, stop)
+  cols['central_freq'] = cols['peak_frequency'] = freq
+  cols['bandwidth'] = cols['ms_bandwidth'] = numpy.zeros(len(freq))
+  cols['flow'] = cols['fhigh'] = cols['ms_flow'] = cols['ms_fhigh'] = freq
+  cols['snr'] = cols['ms_snr'] = (amplitude-n_pix)**(1/2)
+  cols['confidence']      = sig
+  cols['param_one_value'] = n_pix
+
+  return cols
+
+def _hacr_columns(fh, start=None, end=None):
+
+  """
+    Parse a HACR format text file into a dict of SnglBurst columns.
+  """
+
+  dat = loadarray(fh, timefunc=lambda c: c[0]+c[1], start=start, end=end,\
+                  ncols=8)
+
+  if len(dat)!=8:
+    raise ValueError("Wrong number of columns in HACR format file. "\
+                     "Cannot read.")
+  peak_time, peak_time_offset, freq, bandwidth, duration, n_pix, snr,\
+  totPower = dat
+
+  peak = peak_time+peak_time_offset
+  cols = _burst_columns(peak, peak-duration/2, peak+duration/2)
+  cols['central_freq'] = cols['peak_frequency'] = freq
+  cols['peak_frequency_error'] = bandwidth/freq
+  cols['bandwidth'] = cols['ms_bandwidth'] = bandwidth
+  cols['flow'] = cols['ms_flow']   = freq-bandwidth/2
+  cols['fhigh'] = cols['ms_fhigh'] = freq+bandwidth/2
+  cols['snr'] = cols['ms_snr'] = snr
+  cols['param_one_value']   = peak_time_offset
+  cols['param_two_value']   = n_pix
+  cols['param_three_value'] = totPower
+
+  return cols
+
+def _ihope_columns_from(fh, start=None, end=None):
+
+  """
+    Parse an ihope format CSV file into a dict of SnglInspiral columns.
+  """
+
+  dat = loadarray(fh, strcols=[2], timefunc=lambda c: c[0]+c[1]*1e-9,\
+                  start=start, end=end, ncols=len(_ihope_columns))
+
+  cols = dict()
+  for c,col in zip(_ihope_columns, dat):
+    if c=='ifo':
+      cols[c] = col
+    elif c.endswith('_time') or c.endswith('_ns') or c.endswith('_dof'):
+      cols[c] = col.astype(int)
+    else:
+      cols[c] = col
+
+  return cols
+
+def arrayfromtrigfile(fname, etg, start=None, end=None, columns=None,\
+                      virgo=False):
+
+  """
+    Load triggers from an Omega, KW, HACR or ihope format text file into a
+    numpy structured array, without building any table rows.
+
+    The fields of the array are the columns of the SnglBurst (or SnglInspiral
+    for ihope) table that the format provides, with the same names and
+    meaning, so that totrigtable can build rows from it directly. Triggers
+    outside [start, end) are removed straight after parsing, before any of
+    the columns are computed.
+
+    Arguments :
+
+      fname : file or str
+        file object or filename path to read
+      etg : [ "omega" | "kw" | "hacr" | "ihope" ]
+        format of the text file
+
+    Keyword arguments :
+
+      start : float
+        minimum peak (end for ihope) time for returned triggers
+      end : float
+        maximum peak (end for ihope) time for returned triggers
+      columns : iterable
+        list of columnnames to include in the array, the param_*_name values
+        for the ETG (e.g. 'cluster_size') select their param_*_value columns
+      virgo : bool
+        read Omega files in Virgo format
+  """
+
+  key = _trigarray_etg(etg)
+  if key is None:
+    raise AttributeError("etg=%s not recognised by arrayfromtrigfile." % etg)
 
-  usecols = [t for t in def_cols if def_cols[t] in columns]
-  
   # force filename not file object
   if hasattr(fname, 'readline'):
     fh = fname
   else:
     fh = open(fname, 'r')
 
-  # load data from file
-  dat = loadtxt(fh, usecols)
+  if key=='omega':
+    cols = _omega_columns(fh, start=start, end=end, virgo=virgo)
+  elif key=='kw':
+    cols = _kw_columns(fh, start=start, end=end)
+  elif key=='hacr':
+    cols = _hacr_columns(fh, start=start, end=end)
+  elif key=='ihope':
+    cols = _ihope_columns_from(fh, start=start, end=end)
 
   # close file if we opened it
-  if not hasattr(fname, 'readlin'):
+  if not hasattr(fname, 'readline'):
     fh.close()
 
-  if usecols:
-    numtrigs = len(dat[0])
+  # select columns, keeping the table column order
+  if key=='ihope':
+    names = _ihope_columns
   else:
-    numtrigs = 0
+    names = lsctables.SnglBurst.__slots__
+  names = [c for c in names if c in cols]
+  if columns is not None:
+    columns = set(map(str.lower, map(str, columns)))
+    for p,alias in _trigarray_params[key]:
+      if alias.lower() in columns:
+        columns.add('%s_value' % p)
+    names = [c for c in names if c in columns]
 
-  # generate table
-  out = SnglTriggerTable('ihope', columns=columns)
+  array = numpy.empty(len(cols[names[0]]) if names else 0,\
+                      dtype=[(str(c), cols[c].dtype) for c in names])
+  for c in names:
+    array[c] = cols[c]
+
+  return array
+
+def _arrayfromtrigfile(args):
+
+  """
+    Unpack args for arrayfromtrigfile, for use with pool.imap.
+  """
+
+  fname, etg, start, end, columns, virgo = args
+  return arrayfromtrigfile(fname, etg, start=start, end=end, columns=columns,\
+                           virgo=virgo)
+
+def arrayfromLALCache(cache, etg, start=None, end=None, columns=None,\
+                      virgo=False, verbose=False, snr=False, nprocs=1,\
+                      threads=False):
+
+  """
+    Load triggers for the given etg from all text files in a glue.lal.Cache
+    object into a single numpy structured array, see arrayfromtrigfile.
+
+    If nprocs > 1 the files are parsed concurrently by a pool of that many
+    worker processes, or threads if threads=True. The returned triggers are
+    in cache order either way.
+  """
+
+  # make sure we can apply the SNR threshold
+  if snr and columns is not None and 'snr' not in columns:
+    columns = list(columns)+['snr']
+
+  args = [(e.path, etg, start, end, columns, virgo) for e in cache]
+
+  # set up counter
+  if verbose:
+    sys.stdout.write("Extracting %s triggers from %d files...     "\
+                     % (etg, len(cache)))
+    sys.stdout.flush()
+    delete = '\b\b\b'
+    num = len(cache)/100
+
+  if nprocs > 1:
+    if threads:
+      pool = ThreadPool(nprocs)
+    else:
+      pool = multiprocessing.Pool(nprocs)
+    results = pool.imap(_arrayfromtrigfile, args)
+  else:
+    pool = None
+    results = (_arrayfromtrigfile(a) for a in args)
+
+  arrays = []
+  try:
+    for i,array in enumerate(results):
+      # keep only triggers above SNR threshold if requested
+      if snr:
+        array = array[array['snr'] > snr]
+      arrays.append(array)
+
+      # print verbose message
+      if verbose and len(cache)>1:
+        progress = int((i+1)/num)
+        sys.stdout.write('%s%.2d%%' % (delete, progress))
+        sys.stdout.flush()
+  finally:
+    if pool is not None:
+      pool.close()
+      pool.join()
+
+  if verbose: sys.stdout.write("\n")
+
+  if not arrays:
+    return arrayfromtrigfile(StringIO(), etg, columns=columns)
+  # empty files can have string fields of a different width
+  nonempty = [a for a in arrays if len(a)]
+  if not nonempty:
+    return arrays[0]
+  return numpy.concatenate(nonempty)
+
+def totrigtable(array, etg, ifo=None, channel=None, columns=None):
+
+  """
+    Build the ligolw table for the given etg from a structured array made by
+    arrayfromtrigfile. One row is built for each trigger, filling those
+    columns present in both the array and the table.
+
+    Arguments :
+
+      array : numpy.ndarray
+        structured array of triggers
+      etg : str
+        ETG that produced the triggers
+
+    Keyword arguments :
+
+      ifo : str
+        name of IFO to fill in table
+      channel : str
+        name of channel to fill in table
+      columns : iterable
+        list of columnnames to populate in table
+  """
+
+  out = SnglTriggerTable(etg, columns=columns)
+  names = [c for c in array.dtype.names if c in out.columnnames]
+
+  # constant columns
+  const = []
+  key = _trigarray_etg(etg)
+  if key is not None:
+    for p,alias in _trigarray_params[key]:
+      if '%s_value' % p in names:
+        const.append(('%s_name' % p, alias))
+  if ifo!=None:
+    const.append(('ifo', ifo))
+  if channel!=None:
+    const.append(('channel', channel))
+
+  # convert to python types once per column
+  values = [array[c].tolist() for c in names]
+  RowType = out.RowType
+  append  = out.append
+  for row in zip(*values):
+    t = RowType()
+    for c,v in zip(names, row): setattr(t, c, v)
+    for c,v in const: setattr(t, c, v)
+    append(t)
 
-  cols   = numpy.arange(len(dat))
-  append = out.append
-  for i in range(numtrigs):
-    t = lsctables.SnglInspiral()
-    for c in cols:
-      setattr(t, def_cols[usecols[c]],\
-              int(data[c][i]) if re.search('time', def_cols[usecols[c]])\
-              else data[c][i])
-    if ifo!=None:
-      t.ifo = ifo
-    if channel!=None:
-      t.channel = channel
-    if not check_time or (check_time and t.get_peak() in span):
-      append(t)
-  
   return out
 
 # ==============================================================================
@@ -2384,3 +2477,63 @@ def loadtxt(fh, usecols=None):
       output.append(tuple(map(float, vals)))
   return numpy.squeeze(numpy.array(output, float)).T
 
+
+def loadarray(fh, usecols=None, strcols=[], timefunc=None, start=None,\
+              end=None, ncols=0):
+
+  """
+    Columnar version of loadtxt. Returns a list of numpy arrays, one for each
+    column in usecols (or all columns), parsing the numeric data of the whole
+    file in one call to numpy.fromstring.
+
+    Columns in strcols are returned as string arrays. If timefunc is given it
+    is called on the list of all columns to return the array of trigger
+    times, and only rows in [start, end) are kept. ncols sets the number of
+    columns returned for an empty file when usecols is not given.
+  """
+
+  lines = [l for l in fh.read().replace(',', ' ').splitlines()\
+           if l.strip() and not _comment_regex.match(l)]
+
+  # skip lines with a different number of columns to the first
+  counts = [len(l.split()) for l in lines]
+  nVals  = counts and counts[0] or (usecols and max(usecols)+1 or ncols)
+  nSkip = len(lines)-counts.count(nVals)
+  if nSkip:
+    sys.stderr.write("Warning, %d lines of file %s were skipped, uncorrect "\
+                     "column number\n" % (nSkip, fh))
+    lines = [l for l,n in zip(lines, counts) if n==nVals]
+
+  dat = None
+  if not strcols:
+    try:
+      dat = numpy.fromstring(' '.join(lines), dtype=float, sep=' ')
+    except ValueError:
+      dat = None
+    if dat is not None and dat.size == len(lines)*nVals:
+      dat = dat.reshape((len(lines), nVals)).T
+    else:
+      dat = None
+
+  # fall back to splitting into tokens if some columns are not numeric,
+  # only converting those columns that are needed
+  if dat is None:
+    tokens = numpy.array([l.split() for l in lines], dtype=str)\
+                  .reshape((len(lines), nVals))
+    dat = [tokens[:,j] if j in strcols\
+           else tokens[:,j].astype(float) if usecols is None or j in usecols\
+           else None for j in range(nVals)]
+
+  # restrict to [start, end) before taking the requested columns
+  if timefunc is not None and (start or end):
+    time = timefunc(dat)
+    keep = numpy.ones(len(time), dtype=bool)
+    if start:
+      keep &= time >= start
+    if end:
+      keep &= time < end
+    dat = [col[keep] if col is not None else None for col in dat]
+
+  if usecols is not None:
+    return [dat[j] for j in usecols]
+  return list(dat)
@@ -260,11 +260,18 @@ def compute_search_efficiency_in_bins(found, total, ndbins, sim_to_bins_function
 
 	input = rate.BinnedRatios(ndbins)
 
-	# increment the numerator with the missed injections
-	[input.incnumerator(sim_to_bins_function(sim)) for sim in found]
+	def coords(sims):
+		# one array of co-ordinates per dimension
+		points = [sim_to_bins_function(sim) for sim in sims]
+		if not points:
+			return tuple(numpy.zeros((0,)) for binning in ndbins)
+		return tuple(numpy.array(c) for c in zip(*points))
+
+	# increment the numerator with the found injections
+	input.fillnumerator(coords(found))
 
 	# increment the denominator with the total injections
-	[input.incdenominator(sim_to_bins_function(sim)) for sim in total]
+	input.filldenominator(coords(total))
 
 	# regularize by setting denoms to 1 to avoid nans
 	input.regularize()
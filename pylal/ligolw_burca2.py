@@ -24,6 +24,7 @@
 #
 
 
+import itertools
 import sys
 import traceback
 
@@ -52,10 +53,41 @@ __date__ = git_version.date
 #
 
 
-def assign_likelihood_ratios(connection, coinc_def_id, offset_vectors, vetoseglists, events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = False, params_func_extra_args = ()):
+def ln_likelihood_ratios(ln_likelihood_ratio_func, params_seq):
+	"""
+	Evaluate ln_likelihood_ratio_func() for each of a sequence of
+	parameter dictionaries, and return a list of the results.
+	Entries in params_seq that are None yield None.  If
+	ln_likelihood_ratio_func has a .batch() method (e.g., it is a
+	snglcoinc.LnLikelihoodRatio instance) all the parameters are
+	evaluated in one call to it.
+	"""
+	indexes = [n for n, params in enumerate(params_seq) if params is not None]
+	try:
+		batch = ln_likelihood_ratio_func.batch
+	except AttributeError:
+		values = [ln_likelihood_ratio_func(params_seq[n]) for n in indexes]
+	else:
+		values = batch([params_seq[n] for n in indexes]).tolist()
+	results = [None] * len(params_seq)
+	for n, value in zip(indexes, values):
+		results[n] = value
+	return results
+
+
+def assign_likelihood_ratios(connection, coinc_def_id, offset_vectors, vetoseglists, events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = False, params_func_extra_args = (), bulk_events_func = None, block_size = 1000):
 	"""
 	Assigns likelihood ratio values to coincidences.
+
+	If bulk_events_func is None, the likelihood ratios are assigned
+	by an UPDATE statement that calls back into Python once for each
+	coinc, and events_func() is used to retrieve each coinc's events.
+	Otherwise bulk_events_func() is used to retrieve the events of all
+	the coincs at once (see assign_likelihood_ratios_bulk()).
 	"""
+	if bulk_events_func is not None:
+		return assign_likelihood_ratios_bulk(connection, coinc_def_id, offset_vectors, vetoseglists, bulk_events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = verbose, params_func_extra_args = params_func_extra_args, block_size = block_size)
+
 	#
 	# Convert offset vector keys to strings so that we can use the
 	# dictionary inside an SQL query (they might be
@@ -110,10 +142,103 @@ WHERE
 	cursor.close()
 
 
-def assign_likelihood_ratios_xml(xmldoc, coinc_def_id, offset_vectors, vetoseglists, events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = False, params_func_extra_args = ()):
+def coinc_events(coincs, events):
+	"""
+	Merge a sequence of (coinc_event_id, time_slide_id) tuples with a
+	sequence of (coinc_event_id, event) tuples, both ordered by
+	coinc_event_id, and yield a (coinc_event_id, time_slide_id,
+	events) tuple for each coinc, where events is the list of the
+	coinc's events.  For internal use.
+	"""
+	events = itertools.groupby(events, lambda (coinc_event_id, event): coinc_event_id)
+	group = next(events, None)
+	for coinc_event_id, time_slide_id in coincs:
+		# skip events of coincs not in the list
+		while group is not None and group[0] < coinc_event_id:
+			group = next(events, None)
+		if group is not None and group[0] == coinc_event_id:
+			yield coinc_event_id, time_slide_id, [event for ignored, event in group[1]]
+			group = next(events, None)
+		else:
+			yield coinc_event_id, time_slide_id, []
+
+
+def assign_likelihood_ratios_bulk(connection, coinc_def_id, offset_vectors, vetoseglists, bulk_events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = False, params_func_extra_args = (), block_size = 1000):
+	"""
+	Assigns likelihood ratio values to coincidences without calling
+	into Python from SQLite.  The coincs and their time slide IDs are
+	retrieved with one query, and their events with another made by
+	bulk_events_func(cursor, coinc_def_id), which must return a
+	sequence of (coinc_event_id, event) tuples for all the coincs of
+	the given type ordered by coinc_event_id.  The likelihood ratios
+	are computed block_size coincs at a time (see
+	ln_likelihood_ratios()), and written back with a single
+	executemany() in one transaction.
+	"""
+	offset_vectors = dict((unicode(time_slide_id), offset_vector) for time_slide_id, offset_vector in offset_vectors.items())
+
+	if verbose:
+		print >>sys.stderr, "computing likelihood ratios ..."
+
+	coincs = connection.cursor().execute("""
+SELECT
+	coinc_event_id,
+	time_slide_id
+FROM
+	coinc_event
+WHERE
+	coinc_def_id == ?
+ORDER BY
+	coinc_event_id
+	""", (unicode(coinc_def_id),)).fetchall()
+	cursor = connection.cursor()
+
+	likelihoods = []
+	coincs = coinc_events(coincs, bulk_events_func(cursor, coinc_def_id))
+	while True:
+		block = list(itertools.islice(coincs, block_size))
+		if not block:
+			break
+		params_seq = [likelihood_params_func([event for event in events if veto_func(event, vetoseglists)], offset_vectors[time_slide_id], *params_func_extra_args) for coinc_event_id, time_slide_id, events in block]
+		likelihoods.extend(zip(ln_likelihood_ratios(ln_likelihood_ratio_func, params_seq), (coinc_event_id for coinc_event_id, time_slide_id, events in block)))
+	cursor.close()
+
+	if verbose:
+		print >>sys.stderr, "recording %d likelihood ratios ..." % len(likelihoods)
+	connection.cursor().executemany("""
+UPDATE
+	coinc_event
+SET
+	likelihood = ?
+WHERE
+	coinc_event_id == ?
+	""", likelihoods)
+
+	#
+	# Done
+	#
+
+	connection.commit()
+
+
+def assign_likelihood_ratios_xml(xmldoc, coinc_def_id, offset_vectors, vetoseglists, events_func, veto_func, ln_likelihood_ratio_func, likelihood_params_func, verbose = False, params_func_extra_args = (), block_size = 1000, bulk_events_func = None):
 	"""
 	Assigns likelihood ratio values to coincidences (XML version).
+	The likelihood ratios are computed for block_size coincidences at
+	a time (see ln_likelihood_ratios()).  If bulk_events_func is not
+	None, it is called once as bulk_events_func(xmldoc, coinc_def_id)
+	to retrieve a sequence of (coinc_event_id, event) tuples for all
+	the coincs, in any order, instead of calling events_func() for
+	each coinc (see sngl_burst_bulk_events_func_xml()).  Note that
+	the bulk functions of the SQLite version, which take a cursor,
+	cannot be used here.
 	"""
+	if bulk_events_func is not None:
+		index = {}
+		for coinc_event_id, event in bulk_events_func(xmldoc, coinc_def_id):
+			index.setdefault(coinc_event_id, []).append(event)
+		events_func = lambda cursor, coinc_event_id: index.get(coinc_event_id, ())
+
 	#
 	# Iterate over all coincs, assigning likelihood ratios.
 	#
@@ -125,13 +250,24 @@ def assign_likelihood_ratios_xml(xmldoc, coinc_def_id, offset_vectors, vetosegli
 	else:
 		progressbar = None
 
+	coinc_events = []
+	params_seq = []
+	def flush():
+		for coinc_event, likelihood in zip(coinc_events, ln_likelihood_ratios(ln_likelihood_ratio_func, params_seq)):
+			coinc_event.likelihood = likelihood
+		del coinc_events[:]
+		del params_seq[:]
+
 	for coinc_event in coinc_event_table:
 		if progressbar is not None:
 			progressbar.increment()
 		if coinc_event.coinc_def_id != coinc_def_id:
 			continue
-		params = likelihood_params_func([event for event in events_func(None, coinc_event.coinc_event_id) if veto_func(event, vetoseglists)], offset_vectors[coinc_event.time_slide_id], *params_func_extra_args)
-		coinc_event.likelihood = ln_likelihood_ratio_func(params) if params is not None else None
+		coinc_events.append(coinc_event)
+		params_seq.append(likelihood_params_func([event for event in events_func(None, coinc_event.coinc_event_id) if veto_func(event, vetoseglists)], offset_vectors[coinc_event.time_slide_id], *params_func_extra_args))
+		if len(coinc_events) >= block_size:
+			flush()
+	flush()
 
 	del progressbar
 
@@ -162,6 +298,36 @@ WHERE
 	""", (coinc_event_id,)))
 
 
+def sngl_burst_bulk_events_func(cursor, coinc_def_id, row_from_cols):
+	for row in cursor.execute("""
+SELECT
+	coinc_event_map.coinc_event_id,
+	sngl_burst.*
+FROM
+	sngl_burst
+	JOIN coinc_event_map ON (
+		coinc_event_map.table_name == 'sngl_burst'
+		AND coinc_event_map.event_id == sngl_burst.event_id
+	)
+	JOIN coinc_event ON (
+		coinc_event.coinc_event_id == coinc_event_map.coinc_event_id
+	)
+WHERE
+	coinc_event.coinc_def_id == ?
+ORDER BY
+	coinc_event_map.coinc_event_id
+	""", (unicode(coinc_def_id),)):
+		yield row[0], row_from_cols(row[1:])
+
+
+def sngl_burst_bulk_events_func_xml(xmldoc, coinc_def_id):
+	coinc_event_ids = set(row.coinc_event_id for row in lsctables.CoincTable.get_table(xmldoc) if row.coinc_def_id == coinc_def_id)
+	index = dict((row.event_id, row) for row in lsctables.SnglBurstTable.get_table(xmldoc))
+	for row in lsctables.CoincMapTable.get_table(xmldoc):
+		if row.table_name == "sngl_burst" and row.coinc_event_id in coinc_event_ids:
+			yield row.coinc_event_id, index[row.event_id]
+
+
 def sngl_burst_veto_func(event, vetoseglists):
 	# return True if event should be *retained*
 	return event.ifo not in vetoseglists or event.peak not in vetoseglists[event.ifo]
@@ -183,6 +349,7 @@ def ligolw_burca2(database, ln_likelihood_ratio, params_func, verbose = False, p
 		offset_vectors = database.time_slide_table.as_dict(),
 		vetoseglists = database.vetoseglists,
 		events_func = lambda cursor, coinc_event_id: sngl_burst_events_func(cursor, coinc_event_id, database.sngl_burst_table.row_from_cols),
+		bulk_events_func = lambda cursor, coinc_def_id: sngl_burst_bulk_events_func(cursor, coinc_def_id, database.sngl_burst_table.row_from_cols),
 		veto_func = sngl_burst_veto_func,
 		ln_likelihood_ratio_func = ln_likelihood_ratio,
 		likelihood_params_func = params_func,
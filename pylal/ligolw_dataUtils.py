@@ -13,6 +13,7 @@ or xml document.
 
 import sys, re, math
 import time, datetime
+import numpy
 
 from glue.ligolw.utils import print_tables
 from glue.ligolw import ligolw
@@ -319,6 +320,7 @@ class CompareDataRows:
         self.neededColumnsB = None
         self.diffFunc = None
         self.window = None
+        self._arrayCache = {}
 
     def set_classA( self, DataRowClass ):
         self.classA = DataRowClass
@@ -547,6 +549,142 @@ class CompareDataRows:
             ethincaVal = float('inf')
         return ethincaVal 
 
+    #
+    #   Array versions of the functions
+    #
+    #   The per-row values are computed once for each list of rows and
+    #   cached, keyed by the identity of the list, so the array functions
+    #   can be called on many small sets of pairs drawn from the same
+    #   lists. The lists must not be modified while the instance is in use.
+    #
+    def _cachedValues( self, rows, key, func ):
+        """
+        Returns func( rows ), computing it only the first time it is asked
+        for with this list of rows and key.
+        """
+        try:
+            cachedRows, values = self._arrayCache[(id(rows), key)]
+        except KeyError:
+            cachedRows = None
+        if cachedRows is not rows:
+            values = func( rows )
+            self._arrayCache[(id(rows), key)] = (rows, values)
+        return values
+
+    def _rowValues( self, rows, criteria ):
+        """
+        Returns a numpy array of the value of the given match criteria for
+        every row in rows. 'startTime' and 'endTime' are treated as in
+        diffRowARowB.
+        @rows: a list of DataRow instances
+        @criteria: a match criteria, e.g., self.matchCriteriaA
+        """
+        if criteria == 'startTime':
+            func = lambda rows: numpy.array([row.start_time + 1e-9*row.start_time_ns for row in rows], dtype = float)
+        elif criteria == 'endTime':
+            func = lambda rows: numpy.array([row.end_time + 1e-9*row.end_time_ns for row in rows], dtype = float)
+        else:
+            func = lambda rows: numpy.array([row.get_value( criteria ) for row in rows], dtype = float)
+        return self._cachedValues( rows, ('criteria', criteria), func )
+
+    def _simSiteValues( self, simRows, site ):
+        """
+        Returns a numpy array of the start or end time (depending on
+        self.matchCriteriaA) at the given site of every row in simRows.
+        @simRows: a list of DataRow instances from a simulation table
+        @site: the lower-case site prefix, e.g., 'h'
+        """
+        col = self.matchCriteriaA == 'startTime' and '%s_start_time' % site or '%s_end_time' % site
+        return self._cachedValues( simRows, ('site', col), lambda rows: numpy.array([getattr( row, col ) + 1e-9*getattr( row, '%s_ns' % col ) for row in rows], dtype = float) )
+
+    def _rowSites( self, rows ):
+        """
+        Returns a numpy array of the lower-case site prefix of the ifo of
+        every row in rows.
+        """
+        return self._cachedValues( rows, 'sites', lambda rows: numpy.array([row.ifo.lower()[0] for row in rows]) )
+
+    def diffRowARowBPairs( self, rowsA, rowsB, idxA, idxB ):
+        """
+        Array version of diffRowARowB. Returns the diffs between
+        rowsA[idxA[i]] and rowsB[idxB[i]] for all i. The match criteria are
+        evaluated once per row of each list, the first time the list is
+        seen, rather than once per pair.
+        @rowsA: a list of instances of self.classA
+        @rowsB: a list of instances of self.classB
+        @idxA: an array of indices into rowsA
+        @idxB: an array of indices into rowsB, the same length as idxA
+        """
+        a = self._rowValues( rowsA, self.matchCriteriaA )
+        b = self._rowValues( rowsB, self.matchCriteriaB )
+        return numpy.abs( a[idxA] - b[idxB] )
+
+    def diffSimSnglPairs( self, simRows, snglRows, simIdx, snglIdx ):
+        """
+        Array version of diffSimSngl; see diffRowARowBPairs. If the sim match
+        criteria is 'startTime' or 'endTime' the sim times are computed once
+        for each site that recorded a sngl.
+        """
+        if self.matchCriteriaA in ('startTime', 'endTime'):
+            sites = self._rowSites( snglRows )[snglIdx]
+            a = numpy.empty(len(simIdx), dtype = float)
+            for site in set(sites):
+                thisSite = sites == site
+                a[thisSite] = self._simSiteValues( simRows, site )[simIdx[thisSite]]
+        else:
+            a = self._rowValues( simRows, self.matchCriteriaA )[simIdx]
+        b = self._rowValues( snglRows, self.matchCriteriaB )[snglIdx]
+        return numpy.abs( a - b )
+
+    def eThincaSimPairs( self, simRows, snglRows, simIdx, snglIdx ):
+        """
+        Array version of eThincaSim. There is no array version of the lal
+        function, so it is called once per pair; the pairs should therefore
+        be narrowed down with other criteria first. Note: the simulation_id
+        and event_id of the rows that are in a pair are set to 0.
+        """
+        for i in set(simIdx):
+            simRows[i].simulation_id = 0
+        for j in set(snglIdx):
+            snglRows[j].event_id = 0
+        return numpy.array([tools.XLALEThincaParameterForInjection( simRows[i], snglRows[j] ) for i, j in zip(simIdx, snglIdx)], dtype = float)
+
+    def eThincaSnglPairs( self, snglRowsA, snglRowsB, idxA, idxB ):
+        """
+        Array version of eThincaSngl; see eThincaSimPairs. Pairs that are not
+        coincident are assigned inf. Note: the event_ids of the rows that are
+        in a pair are set to 0.
+        """
+        for i in set(idxA):
+            snglRowsA[i].event_id = 0
+        for j in set(idxB):
+            snglRowsB[j].event_id = 0
+        ethincaVals = numpy.empty(len(idxA), dtype = float)
+        for n, (i, j) in enumerate(zip(idxA, idxB)):
+            try:
+                ethincaVals[n] = tools.XLALCalculateEThincaParameter( snglRowsA[i], snglRowsB[j] )
+            except ValueError:
+                ethincaVals[n] = float('inf')
+        return ethincaVals
+
+    def comparePairs( self, rowsA, rowsB, idxA, idxB ):
+        """
+        Array version of _compare. Returns a boolean array that is True for
+        each pair (rowsA[idxA[i]], rowsB[idxB[i]]) whose diff, as computed by
+        the array version of self.diffFunc, is within self.window.
+        """
+        pairFuncs = {
+            self.diffRowARowB: self.diffRowARowBPairs,
+            self.diffSimSngl: self.diffSimSnglPairs,
+            self.eThincaSim: self.eThincaSimPairs,
+            self.eThincaSngl: self.eThincaSnglPairs
+            }
+        idxA = numpy.asarray(idxA, dtype = int)
+        idxB = numpy.asarray(idxB, dtype = int)
+        if not len(idxA):
+            return numpy.zeros(0, dtype = bool)
+        return pairFuncs[ self.diffFunc ]( rowsA, rowsB, idxA, idxB ) <= self.window
+
 
 class OffsetVector(dict):
     weak_equality = False
@@ -1,4 +1,5 @@
 import sys
+import numpy
 
 from glue.ligolw import lsctables
 from glue.ligolw import ilwd
@@ -27,7 +28,247 @@ def make_rec_sngls_table( connection, recovery_table ):
     connection.cursor().execute(sqlquery)
 
 
-def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rough_match = None, rejection_criteria = [], rough_rejection = None, verbose = False ):
+def load_data_rows( connection, sqlquery, DataRowClass, columns ):
+    """
+    Runs the given query and returns a list of instances of DataRowClass,
+    one per result row, populated with the given columns. The query must
+    select the columns in the order given.
+    """
+    rows = []
+    for values in connection.cursor().execute( sqlquery ):
+        row = DataRowClass()
+        row.store( zip(columns, values) )
+        rows.append( row )
+    return rows
+
+
+def window_pairs( keysA, keysB, lowerEdges, upperEdges, order = None ):
+    """
+    Returns arrays (idxA, idxB) of all pairs of indices such that
+    lowerEdges[idxA] <= keysB[idxB] <= upperEdges[idxA]. keysA is only used
+    for its length; keysB is sorted once and the range of each element of A
+    is found with numpy.searchsorted, so the cost is O((n + m) log m) plus
+    the number of pairs returned, rather than O(n m). If keysB has already
+    been argsorted, the result can be passed as order.
+    """
+    if order is None:
+        order = numpy.argsort( keysB, kind = 'mergesort' )
+    sortedB = keysB[order]
+    lo = sortedB.searchsorted( lowerEdges, side = 'left' )
+    hi = sortedB.searchsorted( upperEdges, side = 'right' )
+    counts = numpy.maximum( hi - lo, 0 )
+    idxA = numpy.repeat( numpy.arange(len(keysA)), counts )
+    # position of each pair within its A element's range
+    within = numpy.arange( counts.sum() ) - numpy.repeat( numpy.cumsum(counts) - counts, counts )
+    idxB = order[ numpy.repeat(lo, counts) + within ]
+    return idxA, idxB
+
+
+def find_injections_by_arrays( connection, simulation_table, SimDataRow, RecDataRow, simColumns, recColumns, match_criteria, rough_match = None, block_size = 10000, verbose = False ):
+    """
+    Array-based alternative to the SQL join used by dbinjfind to draw
+    sim-sngl maps. The simulation table and the rec_sngls table are loaded
+    into memory and candidate pairs are generated by sorting the events and
+    using numpy.searchsorted over a window: the rough_match window if given,
+    else the window of the first startTime or endTime match criteria (using
+    the sngl's site to pick the sim time), else all the pairs sharing a
+    process id. The match criteria are then evaluated on the candidates with
+    the array versions of the CompareDataRows functions, and the matching
+    pairs are written to the found_inj table with a single executemany. If
+    there is no window every injection is paired with every event in its
+    process, so the pairs are generated and tested in blocks of about
+    block_size pairs. The all_data rejection is not done here; the events
+    must already have been removed from rec_sngls (see
+    reject_all_data_by_arrays).
+    """
+    # load the data
+    sims = load_data_rows( connection, 'SELECT %s FROM %s' % (', '.join(simColumns), simulation_table), SimDataRow, simColumns )
+    sngls = load_data_rows( connection, 'SELECT %s FROM rec_sngls' % ', '.join(recColumns), RecDataRow, recColumns )
+    simIds = [sim.simulation_id for sim in sims]
+    eventIds = [sngl.event_id for sngl in sngls]
+    simProcIds = [sim.process_id for sim in sims]
+    snglProcIds = [sim_proc_id for (sim_proc_id,) in connection.cursor().execute( 'SELECT sim_proc_id FROM rec_sngls' )]
+    if verbose:
+        print >> sys.stdout, "\tloaded %i injections and %i events" %( len(sims), len(sngls) )
+
+    # set up the compare functions; eThinca is done last since it has to be
+    # called once per pair
+    compFs = []
+    for simFunc, snglFunc, window in match_criteria:
+        compF = dataUtils.CompareDataRows(SimDataRow, RecDataRow)
+        compF.set_window( window )
+        if simFunc == 'eThinca':
+            compF.set_diffFunc( compF.eThincaSim )
+        else:
+            compF.set_matchCriteriaA( simFunc )
+            compF.set_matchCriteriaB( snglFunc )
+            compF.set_diffFunc( compF.diffSimSngl )
+        compFs.append( compF )
+    compFs.sort( key = lambda compF: compF.diffFunc == compF.eThincaSim )
+    timeCompFs = [compF for compF in compFs if compF.matchCriteriaA in ('startTime', 'endTime')]
+
+    # apply the match criteria to candidate pairs, keeping the matches
+    allSimIdx = []
+    allSnglIdx = []
+    nCandidates = [0]
+    def add_candidates( simIdx, snglIdx ):
+        nCandidates[0] += len(simIdx)
+        for compF in compFs:
+            keep = compF.comparePairs( sims, sngls, simIdx, snglIdx )
+            simIdx = simIdx[keep]
+            snglIdx = snglIdx[keep]
+        allSimIdx.append( simIdx )
+        allSnglIdx.append( snglIdx )
+
+    # generate candidate pairs within each injection process; the values
+    # used for the windows are computed once for all the rows
+    snglGroups = sqlutils.group_indices( snglProcIds )
+    if rough_match is not None:
+        simRough, recRough, winRough = rough_match
+        simRoughKeys = numpy.array([getattr(sim, simRough) for sim in sims], dtype = float)
+        snglRoughKeys = numpy.array([getattr(sngl, recRough) for sngl in sngls], dtype = float)
+    elif timeCompFs:
+        snglSites = timeCompFs[0]._rowSites( sngls )
+    for (proc_id,), simIdx in sqlutils.group_indices( simProcIds ).items():
+        if (proc_id,) not in snglGroups:
+            continue
+        snglIdx = snglGroups[(proc_id,)]
+        if rough_match is not None:
+            simKeys = simRoughKeys[simIdx]
+            snglKeys = snglRoughKeys[snglIdx]
+            i, j = window_pairs( simKeys, snglKeys, simKeys - winRough, simKeys + winRough )
+            add_candidates( simIdx[i], snglIdx[j] )
+        elif timeCompFs:
+            compF = timeCompFs[0]
+            sites = snglSites[snglIdx]
+            for site in set(sites):
+                siteSnglIdx = snglIdx[sites == site]
+                simKeys = compF._simSiteValues( sims, site )[simIdx]
+                snglKeys = compF._rowValues( sngls, compF.matchCriteriaB )[siteSnglIdx]
+                # widen the window by a few ulps; the criteria is applied
+                # exactly below
+                slop = 4. * (numpy.spacing(numpy.abs(simKeys)) + numpy.spacing(compF.window))
+                i, j = window_pairs( simKeys, snglKeys, simKeys - compF.window - slop, simKeys + compF.window + slop )
+                add_candidates( simIdx[i], siteSnglIdx[j] )
+        else:
+            # every pair is a candidate; bound the number of pairs per block
+            step = max( 1, block_size // len(snglIdx) )
+            for start in range(0, len(simIdx), step):
+                blockSimIdx = simIdx[start:start+step]
+                add_candidates( numpy.repeat( blockSimIdx, len(snglIdx) ), numpy.tile( snglIdx, len(blockSimIdx) ) )
+    simIdx = numpy.concatenate( allSimIdx + [numpy.zeros(0, dtype = int)] )
+    snglIdx = numpy.concatenate( allSnglIdx + [numpy.zeros(0, dtype = int)] )
+    if verbose:
+        print >> sys.stdout, "\t%i candidate pairs" % nCandidates[0]
+        print >> sys.stdout, "\t%i sim-sngl maps found" % len(simIdx)
+
+    # write the results
+    connection.cursor().execute( 'CREATE TEMP TABLE found_inj (sim_id, event_id)' )
+    connection.cursor().executemany( 'INSERT INTO found_inj (sim_id, event_id) VALUES (?, ?)', [(simIds[i], eventIds[j]) for i, j in zip(simIdx, snglIdx)] )
+    connection.commit()
+
+
+def reject_all_data_by_arrays( connection, RecDataRow, recColumns, rejection_criteria, rough_rejection = None, block_size = 10000, verbose = False ):
+    """
+    Array-based alternative to the correlated EXISTS subquery used by
+    dbinjfind to remove events in rec_sngls that match an event in
+    all_data_sngls. Both tables are loaded into memory and the all_data
+    events are sorted by the rough_rejection column if given, else by the
+    value of the first rejection criteria that is not eThinca. Each block of
+    block_size rec_sngls events is then joined to the all_data events within
+    the window with numpy.searchsorted, and the rejection criteria are
+    applied to all the pairs in the block at once. If there is no window
+    (only eThinca criteria and no rough_rejection) every event is paired
+    with every all_data event, and the blocks are made small enough to hold
+    about block_size pairs. The rejected events are removed with a single
+    DELETE.
+    """
+    recRows = load_data_rows( connection, 'SELECT %s FROM rec_sngls' % ', '.join(recColumns), RecDataRow, recColumns )
+    allRows = load_data_rows( connection, 'SELECT %s FROM all_data_sngls' % ', '.join(recColumns), RecDataRow, recColumns )
+    eventIds = [row.event_id for row in recRows]
+    if verbose:
+        print >> sys.stdout, "\tloaded %i events and %i all_data events" %( len(recRows), len(allRows) )
+
+    # set up the tests; the values of all criteria but eThinca are computed
+    # once per row
+    tests = []
+    eThincaTests = []
+    for thisFunc, window in rejection_criteria:
+        compF = dataUtils.CompareDataRows(RecDataRow, RecDataRow)
+        compF.set_window( window )
+        if thisFunc == 'eThinca':
+            compF.set_diffFunc( compF.eThincaSngl )
+            eThincaTests.append( (compF, None, None) )
+        else:
+            compF.set_matchCriteriaA( thisFunc )
+            compF.set_matchCriteriaB( thisFunc )
+            compF.set_diffFunc( compF.diffRowARowB )
+            tests.append( (compF, compF._rowValues( recRows, thisFunc ), compF._rowValues( allRows, thisFunc )) )
+    tests.extend( eThincaTests )
+
+    # pick the window used to generate candidates
+    if rough_rejection is not None:
+        rejRough, rejRoughWin = rough_rejection
+        recKeys = numpy.array([getattr(row, rejRough) for row in recRows], dtype = float)
+        allKeys = numpy.array([getattr(row, rejRough) for row in allRows], dtype = float)
+        lowerEdges = recKeys - rejRoughWin
+        upperEdges = recKeys + rejRoughWin
+    elif tests[0][1] is not None:
+        compF, recKeys, allKeys = tests[0]
+        # widen the window by a few ulps; the criteria is applied exactly
+        # below
+        slop = 4. * (numpy.spacing(numpy.abs(recKeys)) + numpy.spacing(compF.window))
+        lowerEdges = recKeys - compF.window - slop
+        upperEdges = recKeys + compF.window + slop
+    else:
+        allKeys = None
+    if allKeys is not None:
+        order = numpy.argsort( allKeys, kind = 'mergesort' )
+    else:
+        # every pair is a candidate; bound the number of pairs per block
+        block_size = max( 1, block_size // max(len(allRows), 1) )
+
+    rejected = numpy.zeros(len(recRows), dtype = bool)
+    for start in range(0, len(recRows), block_size):
+        stop = min(start + block_size, len(recRows))
+        if allKeys is not None:
+            i, j = window_pairs( recKeys[start:stop], allKeys, lowerEdges[start:stop], upperEdges[start:stop], order = order )
+            i += start
+        else:
+            i = numpy.repeat( numpy.arange(start, stop), len(allRows) )
+            j = numpy.tile( numpy.arange(len(allRows)), stop - start )
+        for compF, recValues, allValues in tests:
+            if recValues is None:
+                keep = compF.comparePairs( recRows, allRows, i, j )
+            else:
+                keep = numpy.abs( recValues[i] - allValues[j] ) <= compF.window
+            i = i[keep]
+            j = j[keep]
+        rejected[i] = True
+    if verbose:
+        print >> sys.stdout, "\trejecting %i events" % rejected.sum()
+
+    # remove the rejected events
+    connection.cursor().execute( 'CREATE TEMP TABLE rejected_sngls (event_id)' )
+    connection.cursor().executemany( 'INSERT INTO rejected_sngls (event_id) VALUES (?)', [(eventIds[n],) for n in numpy.flatnonzero(rejected)] )
+    connection.cursor().execute( 'DELETE FROM rec_sngls WHERE event_id IN (SELECT event_id FROM rejected_sngls)' )
+    connection.cursor().execute( 'DROP TABLE rejected_sngls' )
+    connection.commit()
+
+
+def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rough_match = None, rejection_criteria = [], rough_rejection = None, verbose = False, engine = 'sql' ):
+    """
+    Finds the events in recovery_table that match injections in
+    simulation_table and stores the maps in a temporary found_inj table.
+    If engine is 'sql' the matches are found by a join in the database with
+    the match criteria evaluated by python functions registered with
+    create_function. If engine is 'array' the tables are loaded into memory;
+    events are rejected using reject_all_data_by_arrays and matched using
+    find_injections_by_arrays. This is much faster for large numbers of
+    injections and events.
+    """
+    if engine not in ('sql', 'array'):
+        raise ValueError, "unrecognized engine %s" % engine
 
     # validate simulation_table and recovery_table
     simulation_table = sqlutils.validate_option( simulation_table )
@@ -51,8 +292,9 @@ def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rou
         simRough, recRough, winRough = rough_match
         simRough = sqlutils.validate_option( simRough )
         recRough = sqlutils.validate_option( recRough )
-        sqlquery = "CREATE INDEX rs_rmtch_idx ON rec_sngls (%s)" % recRough
-        connection.cursor().execute( sqlquery )
+        if engine == 'sql':
+            sqlquery = "CREATE INDEX rs_rmtch_idx ON rec_sngls (%s)" % recRough
+            connection.cursor().execute( sqlquery )
         rough_match_test = "rec_sngls.%s >= sim.%s - %f AND rec_sngls.%s <= sim.%s + %f AND\n" %( recRough, simRough, winRough, recRough, simRough, winRough ) 
 
 
@@ -75,42 +317,48 @@ def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rou
                     experiment_summary.datatype == "all_data"''' ])
         connection.cursor().execute(sqlquery)
 
-        rough_test = ''
-        if rough_rejection is not None:
-            rejRough, rejRoughWin = rough_rejection
-            rejRough = sqlutils.validate_option( rejRough )
-            sqlquery = "CREATE INDEX ads_rmtch_idx ON all_data_sngls (%s)" % rejRough
-            connection.cursor().execute( sqlquery )
-            rough_test = "all_data_sngls.%s >= rec_sngls.%s - %f AND all_data_sngls.%s <= rec_sngls.%s + %f AND\n" % ( rejRough, rejRough, rejRoughWin, rejRough, rejRough, rejRoughWin )
-
-        # cycle over the rejection criteria, creating a function in the database for each
-        rejection_tests = []
-        for n,(thisFunc, window) in enumerate(rejection_criteria):
-            compF = dataUtils.CompareDataRows(RecDataRow, RecDataRow)
-            funcName = 'matches_all_data%i' % n
-            if thisFunc == 'eThinca':
-                compF.create_dbCompF( connection, compF.eThincaSngl, funcName, window, recColumns, recColumns )
-            else:
-                compF.set_matchCriteriaA( thisFunc )
-                compF.set_matchCriteriaB( thisFunc )
-                compF.create_dbCompF( connection, compF.diffRowARowB, funcName, window, recColumns, recColumns )
-            simSnglCols = ','.join(['rec_sngls.%s' %(col) for col in compF.neededColumnsA])
-            allSnglCols = ','.join(['all_data_sngls.%s' %(col) for col in compF.neededColumnsB])
-            rejection_tests.append( '%s(%s, %s)' %(funcName, simSnglCols, allSnglCols) ) 
-
-        # now remove triggers
-        sqlquery = ''.join([ '''
-            DELETE FROM
-                rec_sngls
-            WHERE EXISTS (
-                SELECT
-                    *
-                FROM
-                    all_data_sngls
-                WHERE
-                    ''', rough_test, '\nAND '.join( rejection_tests ), ')' ])
-        connection.cursor().execute(sqlquery)
-        connection.commit()
+        if engine == 'array':
+            if rough_rejection is not None:
+                rejRough, rejRoughWin = rough_rejection
+                rough_rejection = (sqlutils.validate_option( rejRough ), rejRoughWin)
+            reject_all_data_by_arrays( connection, RecDataRow, recColumns, rejection_criteria, rough_rejection = rough_rejection, verbose = verbose )
+        else:
+            rough_test = ''
+            if rough_rejection is not None:
+                rejRough, rejRoughWin = rough_rejection
+                rejRough = sqlutils.validate_option( rejRough )
+                sqlquery = "CREATE INDEX ads_rmtch_idx ON all_data_sngls (%s)" % rejRough
+                connection.cursor().execute( sqlquery )
+                rough_test = "all_data_sngls.%s >= rec_sngls.%s - %f AND all_data_sngls.%s <= rec_sngls.%s + %f AND\n" % ( rejRough, rejRough, rejRoughWin, rejRough, rejRough, rejRoughWin )
+
+            # cycle over the rejection criteria, creating a function in the database for each
+            rejection_tests = []
+            for n,(thisFunc, window) in enumerate(rejection_criteria):
+                compF = dataUtils.CompareDataRows(RecDataRow, RecDataRow)
+                funcName = 'matches_all_data%i' % n
+                if thisFunc == 'eThinca':
+                    compF.create_dbCompF( connection, compF.eThincaSngl, funcName, window, recColumns, recColumns )
+                else:
+                    compF.set_matchCriteriaA( thisFunc )
+                    compF.set_matchCriteriaB( thisFunc )
+                    compF.create_dbCompF( connection, compF.diffRowARowB, funcName, window, recColumns, recColumns )
+                simSnglCols = ','.join(['rec_sngls.%s' %(col) for col in compF.neededColumnsA])
+                allSnglCols = ','.join(['all_data_sngls.%s' %(col) for col in compF.neededColumnsB])
+                rejection_tests.append( '%s(%s, %s)' %(funcName, simSnglCols, allSnglCols) ) 
+
+            # now remove triggers
+            sqlquery = ''.join([ '''
+                DELETE FROM
+                    rec_sngls
+                WHERE EXISTS (
+                    SELECT
+                        *
+                    FROM
+                        all_data_sngls
+                    WHERE
+                        ''', rough_test, '\nAND '.join( rejection_tests ), ')' ])
+            connection.cursor().execute(sqlquery)
+            connection.commit()
 
     #
     #   Determine Sim-Sngl matches
@@ -118,6 +366,12 @@ def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rou
     
     if verbose:
         print >> sys.stdout, "Applying match criteria to find sim-sngl maps..."
+    if engine == 'array':
+        if rough_match is not None:
+            rough_match = (simRough, recRough, winRough)
+        find_injections_by_arrays( connection, simulation_table, SimDataRow, RecDataRow, simColumns, recColumns, match_criteria, rough_match = rough_match, verbose = verbose )
+        return
+
     # cycle over the match criteria, creating a function in the database for each
     match_tests = []
     for n,(simFunc, snglFunc, window) in enumerate(match_criteria):
@@ -146,7 +400,7 @@ def dbinjfind( connection, simulation_table, recovery_table, match_criteria, rou
         """, simulation_table, """ AS sim, rec_sngls
     WHERE
         sim.process_id == rec_sngls.sim_proc_id AND
-        """, rough_match_test, '\n\t\tAND'.join( match_tests ) ])
+        """, rough_match_test, '\n\t\tAND '.join( match_tests ) ])
     connection.cursor().execute(sqlquery)
     connection.commit()
 
@@ -138,14 +138,18 @@ def ligolw_sicluster(doc, **kwargs):
         del snglinspiraltable[i]
 
   # Cluster
-  snglcluster.cluster_events(
+  if kwargs["verbose"]:
+    print >>sys.stderr, "sorting by end time ..."
+  snglinspiraltable.sort(SnglInspiralUtils.CompareSnglInspiralByEndTime)
+  if kwargs["verbose"]:
+    print >>sys.stderr, "clustering ..."
+  snglinspiraltable[:] = list(snglcluster.cluster_events_by_time(
     snglinspiraltable,
-    testfunc = lambda a, b: SnglInspiralUtils.CompareSnglInspiral(a, b, twindow = kwargs["cluster_window"]),
+    timefunc = lambda a: a.get_end(),
+    window = kwargs["cluster_window"],
     clusterfunc = SnglInspiralCluster,
-    sortfunc = SnglInspiralUtils.CompareSnglInspiralByEndTime,
-    bailoutfunc = lambda a, b: SnglInspiralUtils.CompareSnglInspiral(a, b, twindow = kwargs["cluster_window"]),
     verbose = kwargs["verbose"]
-  )
+  ))
 
   # Sort by signal-to-noise ratio
   if kwargs["sort_ascending_snr"] or kwargs["sort_descending_snr"]:
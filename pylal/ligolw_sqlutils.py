@@ -19,6 +19,8 @@ import bisect
 import copy
 import time
 import pdb
+import itertools
+import numpy
 
 from glue.ligolw import dbtables
 from glue.ligolw import lsctables
@@ -616,6 +618,17 @@ def increment_id( last_id, nsteps = 1 ):
 def end_time_in_ns( end_time, end_time_ns ):
     return end_time*1e9 + end_time_ns
 
+def group_indices(*columns):
+    """
+    Given one or more sequences of the same length, returns a dictionary
+    mapping each distinct tuple of values found at the same position in the
+    sequences to a numpy array of the positions at which it occurs.
+    """
+    groups = {}
+    for n, key in enumerate(zip(*columns)):
+        groups.setdefault(key, []).append(n)
+    return dict((key, numpy.array(idx, dtype = int)) for key, idx in groups.items())
+
 class Summaries:
     """
     This class stores information about the foreground and background in a 
@@ -664,6 +677,18 @@ class Summaries:
 
     zero_lag_ids stores the esid of all zero-lag "slides" of an experiment.
         zero_lag_ids[ experiment_id ] = [experiment_summ_id1, experiment_summ_id2, etc.]
+
+    calc_ufars_by_max, calc_ufars_by_min and calc_cfars are vectorized
+    versions of calc_ufar_by_max, calc_ufar_by_min and calc_cfar. They take
+    sequences with one element per trigger and compute the fars of all the
+    triggers at once using numpy.searchsorted on sorted array copies of the
+    bkg_stats, sngl_slide_stats and max_bkg_fars lists. The array copies are
+    made the first time they are needed and are discarded by add_to_bkg_stats,
+    sort_bkg_stats, append_max_bkg_far and sort_max_bkg_fars; if the lists
+    are modified directly, call sort_bkg_stats or sort_max_bkg_fars afterward.
+    The results are the same as those of the scalar methods; in particular
+    the counts are divided by bkg_durs in the same way, so integer durations
+    give integer division as they do there.
     """
     def __init__(self):
         self.bkg_stats = {}
@@ -673,12 +698,15 @@ class Summaries:
         self.bkg_durs = {}
         self.max_bkg_fars = {}
         self.zero_lag_ids = {}
+        self._stat_arrays = {}
+        self._max_bkg_far_arrays = {}
 
     def add_to_bkg_stats(self, experiment_id, experiment_summ_id, ifos, param_group, stat):
         """
         Adds a stat to bkg_stats and sngl_slide_stats. What stat is added is determined on the command
         line by the ranking-stat option.
         """
+        self._stat_arrays.clear()
         # add the categories to the bkg_stats if they don't exist yet
         if (experiment_id, ifos, param_group) not in self.bkg_stats:
             self.bkg_stats[(experiment_id, ifos, param_group)] = []
@@ -693,6 +721,7 @@ class Summaries:
         """
         Sorts each list in bkg_stats and sngl_slide_stats from smallest to largest value.
         """
+        self._stat_arrays.clear()
         for thislist in self.bkg_stats.values():
             thislist.sort()
         for thislist in self.sngl_slide_stats.values():
@@ -756,6 +785,7 @@ class Summaries:
         param_bins and coincident_ifos (as was done in the low-mass S51yr and 
         12-18 month analyses), ifo_group should be set to "ALL_IFOS".
         """
+        self._max_bkg_far_arrays.clear()
         if (experiment_summ_id, ifo_group) not in self.max_bkg_fars:
             self.max_bkg_fars[(experiment_summ_id, ifo_group)] = []
         self.max_bkg_fars[(experiment_summ_id, ifo_group)].append(max_bkg_far)
@@ -764,6 +794,7 @@ class Summaries:
         """
         Sorts the max_bkg_fars lists from smallest to highest values.
         """
+        self._max_bkg_far_arrays.clear()
         for thislist in self.max_bkg_fars.values():
             thislist.sort()
 
@@ -825,6 +856,182 @@ class Summaries:
             (len( self.max_bkg_fars[(esid, ifo_group)] ) - bisect.bisect_left( self.max_bkg_fars[(esid,ifo_group)], ufar ))*ufar \
             + sum([self.max_bkg_fars[(esid,ifo_group)][ii] for ii in range(bisect.bisect_left( self.max_bkg_fars[(esid,ifo_group)], ufar))])
 
+    def _get_stat_array(self, stats_name, key):
+        """
+        Returns the list getattr(self, stats_name)[key] as a sorted numpy
+        array, caching the result. stats_name is either 'bkg_stats' or
+        'sngl_slide_stats'. Missing categories are returned as empty arrays.
+        """
+        try:
+            return self._stat_arrays[(stats_name, key)]
+        except KeyError:
+            stats = numpy.sort(numpy.array(getattr(self, stats_name).get(key, []), dtype = float))
+            self._stat_arrays[(stats_name, key)] = stats
+            return stats
+
+    def _get_max_bkg_far_arrays(self, esid, ifo_group):
+        """
+        Returns the max_bkg_fars for (esid, ifo_group) as a sorted numpy array
+        along with its cumulative sums with a leading 0, i.e., element k of the
+        second array is the sum of the k smallest max_bkg_fars.
+        """
+        try:
+            return self._max_bkg_far_arrays[(esid, ifo_group)]
+        except KeyError:
+            max_bkg_fars = numpy.sort(numpy.array(self.max_bkg_fars[(esid, ifo_group)], dtype = float))
+            cumsums = numpy.concatenate(([0.], numpy.cumsum(max_bkg_fars)))
+            self._max_bkg_far_arrays[(esid, ifo_group)] = max_bkg_fars, cumsums
+            return max_bkg_fars, cumsums
+
+    def calc_ufars_by_max(self, eids, esids, ifos, param_groups, stats):
+        """
+        Vectorized version of calc_ufar_by_max. The arguments are sequences
+        with one element per trigger; a numpy array of the triggers' uncombined
+        fars is returned. The triggers are grouped by category and time slide
+        and the counts for each group are found with one searchsorted on each
+        of the group's bkg_stats and sngl_slide_stats arrays.
+        """
+        stats = numpy.asarray(stats, dtype = float)
+        ufars = numpy.empty(len(stats), dtype = float)
+        for (eid, esid, ifo, param_group), idx in group_indices(eids, esids, ifos, param_groups).items():
+            bkg_stats = self._get_stat_array('bkg_stats', (eid, ifo, param_group))
+            sngl_slide_stats = self._get_stat_array('sngl_slide_stats', (eid, esid, ifo, param_group))
+            these_stats = stats[idx]
+            ufars[idx] = ( \
+                ( len(bkg_stats) - bkg_stats.searchsorted(these_stats, side = 'left') ) \
+                - \
+                ( len(sngl_slide_stats) - sngl_slide_stats.searchsorted(these_stats, side = 'left') ) \
+                ) / self.bkg_durs[esid]
+        return ufars
+
+    def calc_ufars_by_min(self, eids, esids, ifos, param_groups, stats):
+        """
+        Vectorized version of calc_ufar_by_min; see calc_ufars_by_max. As in
+        calc_ufar_by_min, triggers with a stat of 0 get an uncombined far of 0.
+        """
+        stats = numpy.asarray(stats, dtype = float)
+        ufars = numpy.empty(len(stats), dtype = float)
+        for (eid, esid, ifo, param_group), idx in group_indices(eids, esids, ifos, param_groups).items():
+            bkg_stats = self._get_stat_array('bkg_stats', (eid, ifo, param_group))
+            sngl_slide_stats = self._get_stat_array('sngl_slide_stats', (eid, esid, ifo, param_group))
+            these_stats = stats[idx]
+            ufars[idx] = ( \
+                bkg_stats.searchsorted(these_stats, side = 'right') \
+                - \
+                sngl_slide_stats.searchsorted(these_stats, side = 'right') \
+                ) / self.bkg_durs[esid]
+        ufars[stats == 0.] = 0.
+        return ufars
+
+    def calc_cfars(self, esids, ifo_groups, ufars):
+        """
+        Vectorized version of calc_cfar. The arguments are sequences with one
+        element per trigger; a numpy array of the combined fars is returned.
+        The sum of the max_bkg_fars of the inactive categories is looked up in
+        a prefix sum of the sorted max_bkg_fars instead of being re-summed for
+        every trigger.
+        """
+        ufars = numpy.asarray(ufars, dtype = float)
+        cfars = numpy.empty(len(ufars), dtype = float)
+        for (esid, ifo_group), idx in group_indices(esids, ifo_groups).items():
+            max_bkg_fars, cumsums = self._get_max_bkg_far_arrays(esid, ifo_group)
+            these_ufars = ufars[idx]
+            k = max_bkg_fars.searchsorted(these_ufars, side = 'left')
+            cfars[idx] = (len(max_bkg_fars) - k) * these_ufars + cumsums[k]
+        return cfars
+
+    def merge(self, other):
+        """
+        Adds the background in the Summaries instance other to this one. This
+        allows the background to be built up incrementally, e.g., when another
+        chunk of time slides or another analysis period is added, without
+        rebuilding the summary from every coinc in every database.
+
+        The datatypes, zero_lag_ids and frg_durs are combined; if an
+        experiment_summ_id is in both, its durations are added, as the two
+        summaries are taken to cover disjoint data. The sngl_slide_stats of
+        each category are merged, the bkg_stats of the categories that changed
+        are updated, and the bkg_durs are recalculated. The max_bkg_fars
+        depend on the background durations and so must be recomputed by the
+        caller. Only the array copies of the categories that changed are
+        discarded, so fars in the other categories can be calculated again
+        without re-sorting.
+        """
+        for eid, datatypes in other.datatypes.items():
+            for datatype, esids in datatypes.items():
+                for esid in esids:
+                    if esid not in self.datatypes.get(eid, {}).get(datatype, []):
+                        self.store_datatypes(eid, esid, datatype)
+        for eid, esids in other.zero_lag_ids.items():
+            for esid in esids:
+                if esid not in self.zero_lag_ids.get(eid, []):
+                    self.append_zero_lag_id(eid, esid)
+        for eid, durs_dict in other.frg_durs.items():
+            for esid, duration in durs_dict.items():
+                self.append_duration(eid, esid, self.frg_durs.get(eid, {}).get(esid, 0.) + duration)
+        for (eid, esid, ifos, param_group), stats in other.sngl_slide_stats.items():
+            self.sngl_slide_stats[(eid, esid, ifos, param_group)] = sorted(self.sngl_slide_stats.get((eid, esid, ifos, param_group), []) + list(stats))
+            self._stat_arrays.pop(('sngl_slide_stats', (eid, esid, ifos, param_group)), None)
+        for (eid, ifos, param_group), stats in other.bkg_stats.items():
+            self.bkg_stats[(eid, ifos, param_group)] = sorted(self.bkg_stats.get((eid, ifos, param_group), []) + list(stats))
+            self._stat_arrays.pop(('bkg_stats', (eid, ifos, param_group)), None)
+        self.bkg_durs = {}
+        self.calc_bkg_durs()
+        self.max_bkg_fars = {}
+        self._max_bkg_far_arrays.clear()
+
+    def save_to_database(self, connection, table_name = 'far_background_summary'):
+        """
+        Writes the background to two tables in the database: table_name_stats,
+        which stores the sorted sngl_slide_stats of each category as a blob,
+        and table_name_durations, which stores the datatype and duration of
+        each experiment_summ_id. Any previous contents of the tables are
+        replaced. The summary can be read back with load_from_database, so
+        that it can be kept alongside the analysis and updated with merge when
+        new time slides are added. The ifos and param_group must be strings or
+        numbers; the bkg_stats are not stored, as they can be rebuilt from the
+        sngl_slide_stats.
+        """
+        cursor = connection.cursor()
+        cursor.executescript(''.join(["""
+            DROP TABLE IF EXISTS """, table_name, """_stats;
+            DROP TABLE IF EXISTS """, table_name, """_durations;
+            CREATE TABLE """, table_name, """_stats (experiment_id, experiment_summ_id, ifos, param_group, stats BLOB);
+            CREATE TABLE """, table_name, """_durations (experiment_id, experiment_summ_id, datatype, duration, zero_lag INTEGER);
+            """]))
+        cursor.executemany(''.join(["INSERT INTO ", table_name, "_stats VALUES (?, ?, ?, ?, ?)"]),
+            ((eid, esid, ifos, param_group, sqlite3.Binary(numpy.sort(numpy.array(stats, dtype = float)).tostring())) for (eid, esid, ifos, param_group), stats in self.sngl_slide_stats.items()))
+        rows = []
+        for eid, datatypes in self.datatypes.items():
+            for datatype, esids in datatypes.items():
+                for esid in esids:
+                    rows.append((eid, esid, datatype, self.frg_durs.get(eid, {}).get(esid), esid in self.zero_lag_ids.get(eid, [])))
+        cursor.executemany(''.join(["INSERT INTO ", table_name, "_durations VALUES (?, ?, ?, ?, ?)"]), rows)
+        connection.commit()
+
+    def load_from_database(self, connection, table_name = 'far_background_summary'):
+        """
+        Reads a background written by save_to_database and merges it into
+        this summary. The bkg_stats are rebuilt from the sngl_slide_stats of
+        the slides that are not zero-lag.
+        """
+        other = Summaries()
+        cursor = connection.cursor()
+        for eid, esid, datatype, duration, zero_lag in cursor.execute(''.join(["SELECT experiment_id, experiment_summ_id, datatype, duration, zero_lag FROM ", table_name, "_durations"])):
+            other.store_datatypes(eid, esid, datatype)
+            if duration is not None:
+                other.append_duration(eid, esid, duration)
+            if zero_lag:
+                other.append_zero_lag_id(eid, esid)
+        for eid, esid, ifos, param_group, stats in cursor.execute(''.join(["SELECT experiment_id, experiment_summ_id, ifos, param_group, stats FROM ", table_name, "_stats"])):
+            stats = numpy.frombuffer(str(stats), dtype = float).tolist()
+            other.sngl_slide_stats[(eid, esid, ifos, param_group)] = stats
+            other.bkg_stats.setdefault((eid, ifos, param_group), [])
+            if not ( eid in other.zero_lag_ids and esid in other.zero_lag_ids[eid] ):
+                other.bkg_stats[(eid, ifos, param_group)].extend(stats)
+        other.sort_bkg_stats()
+        self.merge(other)
+
 class rank_stats:
     """
     Class to return a rank for stats.
@@ -1947,6 +2154,131 @@ def apply_inclusion_rules_to_coinc_table( connection, coinc_table, exclude_coinc
             clean_coinc_event_map = True, clean_mapped_tables = True )
 
 
+def cluster_coincs_sql( connection, sqlquery, window, rank_by = 'MAX', debug = False ):
+    """
+    Clusters coincs by deleting from the experiment_map table every
+    (coinc_event_id, experiment_summ_id) pair for which there is another
+    coinc in the same experiment_summ_id and group with a better ranking stat
+    and a gps_time in (gps_time - window, gps_time + window]. This is done
+    with a self-join on a temporary table in the database.
+
+    @sqlquery: a SELECT statement returning the columns esid, ceid, ifos,
+     gps_time, param_grouping, and ranking_stat for every entry in the
+     experiment_map table to be clustered. Coincs are grouped by esid, ifos,
+     and param_grouping.
+    @window: the cluster window, in the same units as gps_time
+    @rank_by: 'MAX' or 'MIN'; whether larger or smaller ranking stats are
+     better
+    """
+    rank_by = {'MAX': '>', 'MIN': '<'}[rank_by.strip().upper()]
+    sqlscript = ''.join(["""
+        CREATE TEMP TABLE clustered AS
+            """, sqlquery, """;
+        CREATE INDEX cl_sipt_index ON clustered (esid, ifos, param_grouping, gps_time);
+        DELETE 
+        FROM 
+            experiment_map
+        WHERE (cast(coinc_event_id AS char) || "," || cast(experiment_summ_id AS char)) IN (
+            SELECT 
+                (cast(ceid AS char) || "," || cast(esid AS char)) 
+            FROM clustered AS deltrigs
+            WHERE EXISTS (
+                SELECT *
+                FROM
+                    clustered AS reftrigs
+                WHERE
+                    reftrigs.esid == deltrigs.esid
+                    AND reftrigs.ifos == deltrigs.ifos
+                    AND reftrigs.param_grouping == deltrigs.param_grouping
+                    AND reftrigs.ranking_stat """, rank_by, """ deltrigs.ranking_stat
+                    AND reftrigs.gps_time > ( deltrigs.gps_time - """, `window`,""" )
+                    AND reftrigs.gps_time <= ( deltrigs.gps_time + """, `window`,""" )
+                LIMIT 1)
+            );"""])
+    if debug:
+        print >> sys.stderr, sqlscript
+        print >> sys.stderr, time.localtime()[3], time.localtime()[4], time.localtime()[5]
+    connection.cursor().executescript( sqlscript )
+    if debug:
+        print >> sys.stderr, time.localtime()[3], time.localtime()[4], time.localtime()[5]
+
+def window_maxima( times, stats, window ):
+    """
+    Given times sorted from smallest to largest and the corresponding stats,
+    returns an array containing, for each element, the largest stat of the
+    elements with times in (time - window, time + window], or -inf if there
+    are none. The windows are found with numpy.searchsorted and the maxima
+    with a sparse table of the maxima of power-of-two length runs, so every
+    window is evaluated at once in O(n log n) operations.
+    """
+    n = len(times)
+    lo = times.searchsorted( times - window, side = 'right' )
+    hi = times.searchsorted( times + window, side = 'right' )
+    lengths = hi - lo
+    maxima = numpy.empty(n, dtype = float)
+    maxima.fill( float('-inf') )
+    # level k of the table holds the maxima of the runs of length 2**k
+    level = numpy.asarray(stats, dtype = float)
+    k = 0
+    while True:
+        # the windows whose largest power-of-two run length is 2**k are
+        # covered by two, possibly overlapping, runs of length 2**k
+        these = (lengths >= 2**k) & (lengths < 2**(k+1))
+        if these.any():
+            maxima[these] = numpy.maximum( level[lo[these]], level[hi[these] - 2**k] )
+        if 2**(k+1) > lengths.max():
+            break
+        level = numpy.maximum( level[:-2**k], level[2**k:] )
+        k += 1
+    return maxima
+
+def cluster_coincs_by_window( connection, sqlquery, window, rank_by = 'MAX', verbose = False ):
+    """
+    Produces the same result as cluster_coincs_sql, without the self-join.
+    The rows returned by sqlquery are read out of the database once, ordered
+    by esid, ifos, param_grouping, and gps_time, and the best ranking stat in
+    the window around each coinc in a group is found with window_maxima.
+    The losing (coinc_event_id, experiment_summ_id) pairs are then deleted
+    from the experiment_map table with a single statement. Only one group
+    is held in memory at a time, plus the list of losers. Rows with a NULL
+    in any of the columns can never win or lose, as in the SQL comparisons.
+
+    See cluster_coincs_sql for the arguments.
+    """
+    sign = {'MAX': 1., 'MIN': -1.}[rank_by.strip().upper()]
+    sqlquery = ''.join(["""
+        SELECT
+            esid, ceid, ifos, param_grouping, gps_time, ranking_stat
+        FROM (""", sqlquery, """)
+        ORDER BY
+            esid, ifos, param_grouping, gps_time"""])
+    rows = (row for row in connection.cursor().execute( sqlquery ) if None not in row)
+    losers = []
+    ngroups = 0
+    for (esid, ifos, param_grouping), group in itertools.groupby( rows, lambda row: (row[0], row[2], row[3]) ):
+        group = list(group)
+        times = numpy.array([row[4] for row in group], dtype = float)
+        stats = sign * numpy.array([row[5] for row in group], dtype = float)
+        lost = window_maxima( times, stats, window ) > stats
+        losers.extend( (group[n][1], esid) for n in numpy.flatnonzero(lost) )
+        ngroups += 1
+    if verbose:
+        print >> sys.stderr, "\tclustered %i groups, deleting %i coincs" % (ngroups, len(losers))
+
+    connection.cursor().execute( 'CREATE TEMP TABLE cluster_losers (ceid, esid)' )
+    connection.cursor().executemany( 'INSERT INTO cluster_losers (ceid, esid) VALUES (?, ?)', losers )
+    connection.cursor().execute( """
+        DELETE
+        FROM
+            experiment_map
+        WHERE (cast(coinc_event_id AS char) || "," || cast(experiment_summ_id AS char)) IN (
+            SELECT
+                (cast(ceid AS char) || "," || cast(esid AS char))
+            FROM cluster_losers
+            )""" )
+    connection.cursor().execute( 'DROP TABLE cluster_losers' )
+
+
 # =============================================================================
 #
 #                       CoincDefiner Utilities
@@ -25,7 +25,9 @@
 
 
 import bisect
+import itertools
 import math
+import numpy
 import sys
 
 
@@ -40,6 +42,7 @@ from glue.ligolw.utils import search_summary as ligolw_search_summary
 from glue import offsetvector
 from pylal import git_version
 from pylal import snglcoinc
+from pylal import vetoindex
 from pylal.xlal import tools as xlaltools
 from pylal.xlal.datatypes.ligotimegps import LIGOTimeGPS
 from pylal.xlal.datatypes import snglinspiraltable
@@ -199,8 +202,8 @@ InspiralCoincDef = lsctables.CoincDef(search = u"inspiral", search_coinc_type =
 
 
 class InspiralCoincTables(snglcoinc.CoincTables):
-	def __init__(self, xmldoc, vetoes = None, program = u"inspiral", likelihood_func = None, likelihood_params_func = None):
-		snglcoinc.CoincTables.__init__(self, xmldoc)
+	def __init__(self, xmldoc, vetoes = None, program = u"inspiral", likelihood_func = None, likelihood_params_func = None, connection = None):
+		snglcoinc.CoincTables.__init__(self, xmldoc, connection = connection)
 
 		#
 		# configure the likelihood ratio evaluator
@@ -218,14 +221,19 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		self.uniquifier = {}
 
 		#
-		# find the coinc_inspiral table or create one if not found
+		# find the coinc_inspiral table or create one if not found,
+		# or stream the rows into the database
 		#
 
-		try:
-			self.coinc_inspiral_table = lsctables.table.get_table(xmldoc, lsctables.CoincInspiralTable.tableName)
-		except ValueError:
-			self.coinc_inspiral_table = lsctables.New(lsctables.CoincInspiralTable)
-			xmldoc.childNodes[0].appendChild(self.coinc_inspiral_table)
+		if connection is not None:
+			self.coinc_inspiral_table = snglcoinc.SQLiteTableSink(connection, lsctables.CoincInspiralTable)
+			self.sinks.append(self.coinc_inspiral_table)
+		else:
+			try:
+				self.coinc_inspiral_table = lsctables.table.get_table(xmldoc, lsctables.CoincInspiralTable.tableName)
+			except ValueError:
+				self.coinc_inspiral_table = lsctables.New(lsctables.CoincInspiralTable)
+				xmldoc.childNodes[0].appendChild(self.coinc_inspiral_table)
 
 		#
 		# extract the coalesced out segment lists from the trigger generator
@@ -234,6 +242,179 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		self.seglists = ligolw_search_summary.segmentlistdict_fromsearchsummary(xmldoc, program = program).coalesce()
 		if vetoes is not None:
 			self.seglists -= vetoes
+		self.seglists_index = vetoindex.VetoIndexDict(self.seglists)
+
+		#
+		# the sngl_inspiral columns used by .append_coincs() are
+		# extracted on first use
+		#
+
+		self.xmldoc = xmldoc
+		self.sngl_columns = None
+
+	def get_sngl_columns(self, magic_number):
+		"""
+		Return a dictionary of arrays of the sngl_inspiral columns
+		from which .append_coincs() computes the coinc_inspiral
+		rows, indexed by the events' positions in the sngl_inspiral
+		table.  "index" maps event ID to position, "instruments" is
+		the sorted list of instrument names and "ifo" holds each
+		event's position in that list.  A weighted SNR that cannot
+		be computed (division by zero) is stored as NaN.
+		"""
+		if self.sngl_columns is not None and self.sngl_columns["magic_number"] == magic_number:
+			return self.sngl_columns
+
+		def weighted_snr(event):
+			try:
+				return event.get_weighted_snr(fac = magic_number)
+			except ZeroDivisionError:
+				return float("nan")
+
+		events = list(lsctables.table.get_table(self.xmldoc, lsctables.SnglInspiralTable.tableName))
+		instruments = sorted(set(event.ifo for event in events) | set(self.seglists))
+		code = dict((instrument, i) for i, instrument in enumerate(instruments))
+		self.sngl_columns = {
+			"magic_number": magic_number,
+			"events": events,
+			"index": dict((event.event_id, i) for i, event in enumerate(events)),
+			"instruments": instruments,
+			"ifo": numpy.fromiter((code[event.ifo] for event in events), dtype = "intp", count = len(events)),
+			"mtotal": numpy.fromiter((event.mass1 + event.mass2 for event in events), dtype = "double", count = len(events)),
+			"mchirp": numpy.fromiter((event.mchirp for event in events), dtype = "double", count = len(events)),
+			"snr": numpy.fromiter((weighted_snr(event) for event in events), dtype = "double", count = len(events)),
+			"template_duration": numpy.fromiter((event.template_duration for event in events), dtype = "double", count = len(events)),
+			"end_ns": numpy.fromiter((event.end_time * 1000000000 + event.end_time_ns for event in events), dtype = "int64", count = len(events))
+		}
+		return self.sngl_columns
+
+	def append_coincs(self, process_id, time_slide_id, coinc_def_id, coincs, magic_number):
+		"""
+		Bulk form of .append_coinc().  coincs is a sequence of
+		tuples of sngl_inspiral event IDs, all found at the offset
+		vector time_slide_id.  The rows are the same as those
+		.append_coinc() would construct for each coinc in turn, but
+		the coinc_inspiral columns and the instruments that were on
+		are computed for all of the coincs at once with numpy, and
+		the rows are appended in one batch.
+		"""
+		coincs = tuple(coincs)
+		if not coincs:
+			return
+
+		#
+		# populate the coinc_event and coinc_event_map tables
+		#
+
+		coinc_rows = snglcoinc.CoincTables.append_coincs(self, process_id, time_slide_id, coinc_def_id, coincs)
+
+		#
+		# compute the coinc_inspiral columns as in .append_coinc(),
+		# one coinc size at a time.  within each coinc the events
+		# are put in alphabetical order by instrument
+		#
+
+		columns = self.get_sngl_columns(magic_number)
+		instruments = columns["instruments"]
+		offsetvector = self.time_slide_index[time_slide_id]
+		offsets_ns = numpy.array([offsetvector[instrument].ns() if instrument in offsetvector else 0 for instrument in instruments], dtype = "int64")
+
+		n = len(coincs)
+		mass = numpy.empty((n,), dtype = "double")
+		mchirp = numpy.empty((n,), dtype = "double")
+		snr = numpy.empty((n,), dtype = "double")
+		minimum_duration = numpy.empty((n,), dtype = "double")
+		end_ns = numpy.empty((n,), dtype = "int64")
+		ifo_bits = numpy.empty((n,), dtype = "int64")
+		ordered = [None] * n
+
+		index = columns["index"]
+		sizes = numpy.fromiter((len(coinc) for coinc in coincs), dtype = "intp", count = n)
+		for size in set(sizes.tolist()):
+			rows = numpy.flatnonzero(sizes == size)
+			idx = numpy.array([[index[event_id] for event_id in coincs[i]] for i in rows], dtype = "intp").reshape((len(rows), size))
+			ifo = columns["ifo"][idx]
+			order = ifo.argsort(axis = 1, kind = "mergesort")
+			r = numpy.arange(len(rows))[:,numpy.newaxis]
+			idx = idx[r, order]
+			ifo = ifo[r, order]
+			mass[rows] = columns["mtotal"][idx].sum(axis = 1) / size
+			mchirp[rows] = columns["mchirp"][idx].sum(axis = 1) / size
+			snr[rows] = numpy.sqrt((columns["snr"][idx]**2).sum(axis = 1))
+			minimum_duration[rows] = columns["template_duration"][idx].min(axis = 1)
+			end_ns[rows] = columns["end_ns"][idx[:,0]] + offsets_ns[ifo[:,0]]
+			ifo_bits[rows] = numpy.bitwise_or.reduce(numpy.left_shift(1, ifo), axis = 1)
+			if self.likelihood_func is not None:
+				for i, j in zip(rows.tolist(), idx.tolist()):
+					ordered[i] = j
+		if numpy.isnan(snr).any():
+			# .append_coinc() would have raised here too
+			raise ZeroDivisionError("weighted SNR is undefined for a trigger in a coincidence")
+
+		#
+		# record the instruments that were on at the time of each
+		# coinc.  note that the end time of the coinc must be unslid
+		# to compare with the instrument segment lists
+		#
+
+		on_bits = ifo_bits.copy()
+		for instrument in self.seglists:
+			on = self.seglists_index.mask_ns(instrument, end_ns - offsetvector[instrument].ns())
+			on_bits[on] |= 1 << snglcoinc.instrument_bit(instruments, instrument)
+
+		#
+		# convert the instrument sets to strings once for each
+		# distinct set, re-using strings to save memory
+		#
+
+		ifos_strings = {}
+		for bits in numpy.unique(ifo_bits).tolist():
+			coinc_inspiral = self.coinc_inspiral_table.RowType()
+			coinc_inspiral.set_ifos(snglcoinc.instruments_from_bits(instruments, bits))
+			ifos_strings[bits] = self.uniquifier.setdefault(coinc_inspiral.ifos, coinc_inspiral.ifos)
+		instruments_strings = {}
+		for bits in numpy.unique(on_bits).tolist():
+			coinc = self.coinctable.RowType()
+			coinc.set_instruments(snglcoinc.instruments_from_bits(instruments, bits))
+			instruments_strings[bits] = self.uniquifier.setdefault(coinc.instruments, coinc.instruments)
+
+		#
+		# populate the coinc_inspiral table
+		#
+
+		RowType = self.coinc_inspiral_table.RowType
+		coinc_inspiral_rows = []
+		for coinc, row_mass, row_mchirp, row_snr, row_minimum_duration, row_end_ns, row_ifo_bits, row_on_bits in itertools.izip(coinc_rows, mass.tolist(), mchirp.tolist(), snr.tolist(), minimum_duration.tolist(), end_ns.tolist(), ifo_bits.tolist(), on_bits.tolist()):
+			coinc_inspiral = RowType()
+			coinc_inspiral.coinc_event_id = coinc.coinc_event_id
+			coinc_inspiral.mass = row_mass
+			coinc_inspiral.mchirp = row_mchirp
+			coinc_inspiral.snr = row_snr
+			coinc_inspiral.false_alarm_rate = None
+			coinc_inspiral.combined_far = None
+			coinc_inspiral.minimum_duration = row_minimum_duration
+			coinc_inspiral.end_time, coinc_inspiral.end_time_ns = divmod(row_end_ns, 1000000000)
+			coinc_inspiral.ifos = ifos_strings[row_ifo_bits]
+			coinc_inspiral_rows.append(coinc_inspiral)
+			coinc.instruments = instruments_strings[row_on_bits]
+		self.coinc_inspiral_table.extend(coinc_inspiral_rows)
+
+		#
+		# if a likelihood ratio calculator is available, assign a
+		# likelihood ratio to each coinc
+		#
+
+		if self.likelihood_func is not None:
+			events = columns["events"]
+			for coinc, idx in zip(coinc_rows, ordered):
+				coinc.likelihood = self.likelihood_func(self.likelihood_params_func([events[j] for j in idx], offsetvector))
+
+		#
+		# the rows are complete, they can be written to the
+		# database
+		#
+
+		self.flush_full()
 
 	def append_coinc(self, process_id, time_slide_id, coinc_def_id, events, magic_number):
 		#
@@ -296,6 +477,13 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		coinc.instruments = self.uniquifier.setdefault(coinc.instruments, coinc.instruments)
 		coinc_inspiral.ifos = self.uniquifier.setdefault(coinc_inspiral.ifos, coinc_inspiral.ifos)
 
+		#
+		# the rows are complete, they can be written to the
+		# database
+		#
+
+		self.flush_full()
+
 		#
 		# done
 		#
@@ -373,6 +561,161 @@ class InspiralEventList(snglcoinc.EventList):
 		return [event_b for event_b in self[bisect.bisect_left(self, end - self.dt) : bisect.bisect_right(self, end + self.dt)] if not comparefunc(event_a, offset_a, event_b, self.offset, light_travel_time, threshold)]
 
 
+class ColumnarInspiralEventList(snglcoinc.ColumnarEventList):
+	"""
+	A version of InspiralEventList that stores the end times (as
+	integer nanoseconds), masses and e-thinca metric components of the
+	events in numpy arrays, allowing snglcoinc.get_doubles() to find
+	all candidate pairs for an offset vector in one pass.  Can be used
+	in place of InspiralEventList;  the coincidences found are the
+	same.
+	"""
+	@staticmethod
+	def event_time_ns(event):
+		return event.end_time * 1000000000 + event.end_time_ns
+
+	def make_columns(self):
+		return {
+			"mass1": numpy.fromiter((event.mass1 for event in self), dtype = "double", count = len(self)),
+			"mass2": numpy.fromiter((event.mass2 for event in self), dtype = "double", count = len(self)),
+			"mchirp": numpy.fromiter((event.mchirp for event in self), dtype = "double", count = len(self)),
+			"eta": numpy.fromiter((event.eta for event in self), dtype = "double", count = len(self)),
+			"tau0": numpy.fromiter((event.tau0 for event in self), dtype = "double", count = len(self)),
+			"tau3": numpy.fromiter((event.tau3 for event in self), dtype = "double", count = len(self)),
+			"Gamma": numpy.array([(event.Gamma0, event.Gamma1, event.Gamma2, event.Gamma3, event.Gamma4, event.Gamma5, event.Gamma6, event.Gamma7, event.Gamma8, event.Gamma9) for event in self], dtype = "double").reshape((len(self), 10))
+		}
+
+	def set_dt(self, dt):
+		"""
+		If an event's end time differs by more than this many
+		seconds from the end time of another event then it is
+		*impossible* for them to be coincident.
+		"""
+		# add 1% for safety
+		snglcoinc.ColumnarEventList.set_dt(self, dt * 1.01)
+
+
+def inspiral_template_key(event):
+	"""
+	Return a tuple of the template parameters of event that are
+	compared by inspiral_compare_masses_spins().  Two events have
+	identical masses and spins if and only if their keys are equal.
+	"""
+	try:
+		# check for spin columns (from events in sngl_inspiral table)
+		spins = (event.spin1x, event.spin1y, event.spin1z, event.spin2x, event.spin2y, event.spin2z)
+	except:
+		# use spin correction terms for older templates
+		spins = (event.beta, event.chi)
+	return (event.mchirp, event.eta) + spins
+
+
+class TemplatePartitionedInspiralEventList(ColumnarInspiralEventList):
+	"""
+	A version of ColumnarInspiralEventList for exact-match
+	coincidence, where only events from the same template can be
+	coincident.  The events are ordered by template (see
+	inspiral_template_key()) and then by end time, so the candidate
+	partners of an event are sought only among the events from its own
+	template instead of among every event in the coincidence window.
+	The coincidences found are the same as with InspiralEventList.
+
+	Must be used with a comparison function that requires an exact
+	template match, which is marked by an exact_match attribute (see
+	inspiral_coinc_compare_exact()).
+	"""
+	def __init__(self, instrument):
+		ColumnarInspiralEventList.__init__(self, instrument)
+		# integer IDs of this list's templates, the template keys
+		# in ID order, and the offsets of each template's events
+		self.template_ids = {}
+		self.template_keys = []
+		self.template_offsets = numpy.zeros((1,), dtype = "intp")
+		# maps from other lists' template IDs to this list's,
+		# indexed by instrument
+		self.template_maps = {}
+
+	def make_index(self):
+		self.template_ids = {}
+		self.template_keys = []
+		self.template_maps = {}
+		template_ids = []
+		for event in self:
+			key = inspiral_template_key(event)
+			if key not in self.template_ids:
+				self.template_ids[key] = len(self.template_keys)
+				self.template_keys.append(key)
+			template_ids.append(self.template_ids[key])
+		time_ns = [self.event_time_ns(event) for event in self]
+		order = sorted(xrange(len(self)), key = lambda i: (template_ids[i], time_ns[i]))
+		self[:] = [self[i] for i in order]
+		self.template_id = numpy.array([template_ids[i] for i in order], dtype = "int64")
+		self.time_ns = numpy.array([time_ns[i] for i in order], dtype = "int64")
+		# self[template_offsets[k]:template_offsets[k + 1]] are the
+		# events from template k
+		self.template_offsets = numpy.concatenate(([0], numpy.bincount(self.template_id, minlength = len(self.template_keys)).cumsum())).astype("intp")
+		self.columns = self.make_columns()
+
+	def template_map(self, eventlist_a):
+		"""
+		Return an array giving, for each of eventlist_a's template
+		IDs, the ID of the same template in this list or -1 if this
+		list has no events from it.  eventlist_a must be a
+		TemplatePartitionedInspiralEventList.  The array is
+		computed once for each indexing of the two lists.
+		"""
+		try:
+			template_keys, template_map = self.template_maps[eventlist_a.instrument]
+		except KeyError:
+			template_keys = None
+		if template_keys is not eventlist_a.template_keys:
+			template_keys = eventlist_a.template_keys
+			template_map = numpy.array([self.template_ids.get(key, -1) for key in template_keys] + [-1], dtype = "int64")
+			self.template_maps[eventlist_a.instrument] = template_keys, template_map
+		return template_map
+
+	def get_coincs(self, event_a, offset_a, light_travel_time, threshold, comparefunc):
+		template_id = self.template_ids.get(inspiral_template_key(event_a))
+		if template_id is None:
+			return []
+		# the events from event_a's template
+		lo, hi = self.template_offsets[template_id], self.template_offsets[template_id + 1]
+		# event_a's time, with time shift applied, in this list's
+		# frame
+		t = self.event_time_ns(event_a) + LIGOTimeGPS(offset_a).ns() - self.offset_ns
+		lo, hi = lo + self.time_ns[lo:hi].searchsorted(t - self.dt_ns, side = "left"), lo + self.time_ns[lo:hi].searchsorted(t + self.dt_ns, side = "right")
+		return [event_b for event_b in self[lo:hi] if not comparefunc(event_a, offset_a, event_b, self.offset, light_travel_time, threshold)]
+
+	def candidate_bounds(self, eventlist_a, start = 0, stop = None):
+		# this list's IDs of the templates of the events from
+		# eventlist_a, -1 for templates this list does not have
+		if isinstance(eventlist_a, TemplatePartitionedInspiralEventList):
+			template_id = self.template_map(eventlist_a)[eventlist_a.template_id[start:stop]]
+		else:
+			template_id = numpy.array([self.template_ids.get(inspiral_template_key(event), -1) for event in eventlist_a[start:stop]], dtype = "int64")
+		t = eventlist_a.time_ns[start:stop] + (eventlist_a.offset_ns - self.offset_ns)
+		lo = numpy.zeros((len(t),), dtype = "intp")
+		hi = numpy.zeros((len(t),), dtype = "intp")
+		if not len(t):
+			return lo, hi
+		# one searchsorted() per template, on the times of this
+		# list's events from that template.  the sort is cheap when
+		# eventlist_a is also ordered by template
+		order = template_id.argsort(kind = "mergesort")
+		template_id = template_id[order]
+		bounds = numpy.concatenate(([0], numpy.flatnonzero(numpy.diff(template_id)) + 1, [len(template_id)]))
+		for first, last in zip(bounds[:-1], bounds[1:]):
+			k = template_id[first]
+			if k < 0:
+				continue
+			indexes = order[first:last]
+			offset = self.template_offsets[k]
+			time_ns = self.time_ns[offset:self.template_offsets[k + 1]]
+			lo[indexes] = offset + time_ns.searchsorted(t[indexes] - self.dt_ns, side = "left")
+			hi[indexes] = offset + time_ns.searchsorted(t[indexes] + self.dt_ns, side = "right")
+		return lo, hi
+
+
 #
 # =============================================================================
 #
@@ -427,6 +770,26 @@ def inspiral_coinc_compare(a, offseta, b, offsetb, light_travel_time, e_thinca_p
 	return not coincident
 
 
+def inspiral_coinc_compare_batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, e_thinca_parameter):
+	"""
+	Vectorized form of inspiral_coinc_compare() for use with
+	ColumnarInspiralEventList.  Computes the e-thinca parameter for the
+	pairs of events (eventlist_a[ia[i]], eventlist_b[ib[i]]) in one
+	call into LAL, and returns a boolean array that is False for the
+	pairs that pass the ellipsoidal thinca test.  The events' end
+	times are not modified.
+	"""
+	a = eventlist_a.columns
+	b = eventlist_b.columns
+	ethinca = xlaltools.XLALCalculateEThincaParameterArray(
+		eventlist_a.instrument, eventlist_a.time_ns[ia], numpy.repeat(numpy.int64(eventlist_a.offset_ns), len(ia)), a["tau0"][ia], a["tau3"][ia], a["Gamma"][ia],
+		eventlist_b.instrument, eventlist_b.time_ns[ib], numpy.repeat(numpy.int64(eventlist_b.offset_ns), len(ib)), b["tau0"][ib], b["tau3"][ib], b["Gamma"][ib]
+	)
+	# FIXME:  should it be "<" or "<="?
+	return ~(ethinca <= e_thinca_parameter)
+inspiral_coinc_compare.batched = inspiral_coinc_compare_batched
+
+
 def inspiral_coinc_compare_exact(a, offseta, b, offsetb, light_travel_time, e_thinca_parameter):
 	"""
 	Returns False (a & b are coincident) if their component masses and spins
@@ -441,6 +804,39 @@ def inspiral_coinc_compare_exact(a, offseta, b, offsetb, light_travel_time, e_th
 	else:
 		return True
 
+
+def _template_mismatch(eventlist_a, ia, eventlist_b, ib):
+	"""
+	Return a boolean array that is True for the pairs of events
+	(eventlist_a[ia[i]], eventlist_b[ib[i]]) whose masses and spins
+	differ.
+	"""
+	if hasattr(eventlist_a, "template_id") and hasattr(eventlist_b, "template_id"):
+		return eventlist_a.template_id[ia] != eventlist_b.template_id[ib]
+	return numpy.fromiter((not inspiral_compare_masses_spins(eventlist_a[i], eventlist_b[j]) for i, j in itertools.izip(ia, ib)), dtype = "bool", count = len(ia))
+
+
+def _abs_dt(eventlist_a, ia, eventlist_b, ib):
+	"""
+	Return the absolute differences, in seconds, of the end times of
+	the pairs of events (eventlist_a[ia[i]], eventlist_b[ib[i]]), with
+	the offsets carried by the event lists applied.
+	"""
+	return abs((eventlist_a.time_ns[ia] + eventlist_a.offset_ns) - (eventlist_b.time_ns[ib] + eventlist_b.offset_ns)) * 1e-9
+
+
+def inspiral_coinc_compare_exact_batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, e_thinca_parameter):
+	"""
+	Vectorized form of inspiral_coinc_compare_exact() for use with
+	ColumnarInspiralEventList and its subclasses.
+	"""
+	twin_a = numpy.sqrt(e_thinca_parameter / eventlist_a.columns["Gamma"][ia, 0])
+	twin_b = numpy.sqrt(e_thinca_parameter / eventlist_b.columns["Gamma"][ib, 0])
+	return _template_mismatch(eventlist_a, ia, eventlist_b, ib) | (_abs_dt(eventlist_a, ia, eventlist_b, ib) > light_travel_time + twin_a + twin_b)
+inspiral_coinc_compare_exact.batched = inspiral_coinc_compare_exact_batched
+inspiral_coinc_compare_exact.exact_match = True
+
+
 def inspiral_coinc_compare_exact_dt(a, offseta, b, offsetb, light_travel_time, delta_t):
 	"""
 	Returns False (a & b are coincident) if their component masses and spins
@@ -453,6 +849,17 @@ def inspiral_coinc_compare_exact_dt(a, offseta, b, offsetb, light_travel_time, d
 	else:
 		return True
 
+
+def inspiral_coinc_compare_exact_dt_batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, delta_t):
+	"""
+	Vectorized form of inspiral_coinc_compare_exact_dt() for use with
+	ColumnarInspiralEventList and its subclasses.
+	"""
+	return _template_mismatch(eventlist_a, ia, eventlist_b, ib) | (_abs_dt(eventlist_a, ia, eventlist_b, ib) > light_travel_time + delta_t)
+inspiral_coinc_compare_exact_dt.batched = inspiral_coinc_compare_exact_dt_batched
+inspiral_coinc_compare_exact_dt.exact_match = True
+
+
 def inspiral_compare_masses_spins(a, b):
 	"""
 	Returns True if a and b have identical masses and spins. Returns False
@@ -520,6 +927,10 @@ def replicate_threshold(threshold, instruments):
 	thresholds.update(dict((pair,threshold) for pair in iterutils.choices(instruments, 2)))
 	return thresholds
 
+# number of coincs whose rows are constructed together by
+# InspiralCoincTables.append_coincs()
+coinc_block_size = 1 << 14
+
 def get_vetoes(xmldoc, vetoes_name, verbose = False):
 	if not ligolw_segments.has_segment_tables(xmldoc):
 		if verbose:
@@ -546,12 +957,19 @@ def ligolw_thinca(
 	likelihood_func = None,
 	likelihood_params_func = None,
 	verbose = False,
-	max_dt_func = None
+	max_dt_func = None,
+	eventlist_type = InspiralEventList,
+	nprocs = 1,
+	low_memory = False,
+	coinc_engine = "graph",
+	connection = None
 ):
 	if not max_dt_func:
 		err_msg = "Must supply max_dt_func keyword argument to "
 		err_msg += "ligolw_thinca function."
 		raise ValueError(err_msg)
+	if issubclass(eventlist_type, TemplatePartitionedInspiralEventList) and not getattr(event_comparefunc, "exact_match", False):
+		raise ValueError("TemplatePartitionedInspiralEventList requires an exact-match event_comparefunc")
 	#
 	# prepare the coincidence table interface.
 	#
@@ -563,7 +981,8 @@ def ligolw_thinca(
 		vetoes = veto_segments,
 		program = trigger_program,
 		likelihood_func = likelihood_func,
-		likelihood_params_func = likelihood_params_func
+		likelihood_params_func = likelihood_params_func,
+		connection = connection
 	)
 	coinc_def_id = get_coinc_def_id(
 		xmldoc,
@@ -580,10 +999,18 @@ def ligolw_thinca(
 	# removing events from the lists that fall in vetoed segments
 	#
 
-	eventlists = snglcoinc.make_eventlists(xmldoc, InspiralEventList, lsctables.SnglInspiralTable.tableName)
+	eventlists = snglcoinc.make_eventlists(xmldoc, eventlist_type, lsctables.SnglInspiralTable.tableName)
 	if veto_segments is not None:
-		for eventlist in eventlists.values():
-			iterutils.inplace_filter((lambda event: event.ifo not in veto_segments or event.get_end() not in veto_segments[event.ifo]), eventlist)
+		veto_index = vetoindex.VetoIndexDict(veto_segments)
+		for instrument, eventlist in eventlists.items():
+			# the event lists are keyed by the events' ifo
+			# columns.  test all of an instrument's end times
+			# in one call
+			vetoed = veto_index.mask_ns(instrument, numpy.fromiter((event.end_time * 1000000000 + event.end_time_ns for event in eventlist), dtype = "int64", count = len(eventlist)))
+			if vetoed.any():
+				eventlist[:] = [event for event, veto in itertools.izip(eventlist, vetoed) if not veto]
+			# rebuild any indexes invalidated by the removals
+			eventlist.make_index()
 
 	#
 	# set the \Delta t parameter on all the event lists
@@ -603,26 +1030,42 @@ def ligolw_thinca(
 	thresholds = replicate_threshold(thresholds, set(eventlists))
 
 	#
-	# construct offset vector assembly graph
+	# construct offset vector assembly graph, or the time-ordered
+	# sweep that replaces it.  the two produce the same coincs
 	#
 
-	time_slide_graph = snglcoinc.TimeSlideGraph(coinc_tables.time_slide_index, verbose = verbose)
+	if coinc_engine == "graph":
+		time_slide_graph = snglcoinc.TimeSlideGraph(coinc_tables.time_slide_index, verbose = verbose, low_memory = low_memory)
+		coincs = time_slide_graph.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose, nprocs = nprocs)
+	elif coinc_engine == "sweep":
+		if not issubclass(eventlist_type, snglcoinc.ColumnarEventList):
+			raise ValueError("coinc_engine \"sweep\" requires a ColumnarEventList eventlist_type")
+		time_slide_sweep = snglcoinc.TimeSlideSweep(coinc_tables.time_slide_index, verbose = verbose)
+		coincs = time_slide_sweep.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose)
+	else:
+		raise ValueError("unrecognized coinc_engine \"%s\"" % coinc_engine)
 
 	#
 	# retrieve all coincidences, apply the final n-tuple compare func
 	# and record the survivors
 	#
 
-	for node, coinc in time_slide_graph.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose):
-		ntuple = tuple(sngl_index[id] for id in coinc)
-		if not ntuple_comparefunc(ntuple, node.offset_vector):
-			coinc_tables.append_coinc(
-				process_id,
-				node.time_slide_id,
-				coinc_def_id,
-				ntuple,
-				magic_number
-			)
+	# the coincs are collected into blocks that share a time slide
+	# and the rows for each block are constructed in one call.  the
+	# engines report a time slide's coincs together, so a block is
+	# flushed when the time slide changes or when it is full
+
+	block = []
+	block_time_slide_id = None
+	for node, coinc in coincs:
+		if ntuple_comparefunc is not default_ntuple_comparefunc and ntuple_comparefunc(tuple(sngl_index[id] for id in coinc), node.offset_vector):
+			continue
+		if node.time_slide_id != block_time_slide_id or len(block) >= coinc_block_size:
+			coinc_tables.append_coincs(process_id, block_time_slide_id, coinc_def_id, block, magic_number)
+			block = []
+			block_time_slide_id = node.time_slide_id
+		block.append(coinc)
+	coinc_tables.append_coincs(process_id, block_time_slide_id, coinc_def_id, block, magic_number)
 
 	#
 	# remove time offsets from events
@@ -630,6 +1073,16 @@ def ligolw_thinca(
 
         del eventlists.offsetvector
 
+	#
+	# if the coincs are being streamed into a database, write out the
+	# last of the rows and index the tables now that they're complete
+	#
+
+	if connection is not None:
+		coinc_tables.flush()
+		coinc_tables.build_indexes()
+		connection.commit()
+
 	#
 	# done
 	#
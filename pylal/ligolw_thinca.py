@@ -25,7 +25,9 @@
 
 
 import bisect
+import itertools
 import math
+import numpy
 import sys
 
 
@@ -38,6 +40,7 @@ from glue import offsetvector
 import lal
 from pylal import git_version
 from pylal import snglcoinc
+from pylal import vetoindex
 from pylal.xlal import tools as xlaltools
 from pylal.xlal.datatypes.ligotimegps import LIGOTimeGPS
 from pylal.xlal.datatypes import snglinspiraltable
@@ -131,8 +134,8 @@ InspiralCoincDef = lsctables.CoincDef(search = u"inspiral", search_coinc_type =
 
 
 class InspiralCoincTables(snglcoinc.CoincTables):
-	def __init__(self, xmldoc, vetoes = None, program = u"inspiral", likelihood_func = None, likelihood_params_func = None):
-		snglcoinc.CoincTables.__init__(self, xmldoc)
+	def __init__(self, xmldoc, vetoes = None, program = u"inspiral", likelihood_func = None, likelihood_params_func = None, connection = None):
+		snglcoinc.CoincTables.__init__(self, xmldoc, connection = connection)
 
 		#
 		# configure the likelihood ratio evaluator
@@ -150,14 +153,19 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		self.uniquifier = {}
 
 		#
-		# find the coinc_inspiral table or create one if not found
+		# find the coinc_inspiral table or create one if not found,
+		# or stream the rows into the database
 		#
 
-		try:
-			self.coinc_inspiral_table = lsctables.CoincInspiralTable.get_table(xmldoc)
-		except ValueError:
-			self.coinc_inspiral_table = lsctables.New(lsctables.CoincInspiralTable)
-			xmldoc.childNodes[0].appendChild(self.coinc_inspiral_table)
+		if connection is not None:
+			self.coinc_inspiral_table = snglcoinc.SQLiteTableSink(connection, lsctables.CoincInspiralTable)
+			self.sinks.append(self.coinc_inspiral_table)
+		else:
+			try:
+				self.coinc_inspiral_table = lsctables.CoincInspiralTable.get_table(xmldoc)
+			except ValueError:
+				self.coinc_inspiral_table = lsctables.New(lsctables.CoincInspiralTable)
+				xmldoc.childNodes[0].appendChild(self.coinc_inspiral_table)
 
 		#
 		# extract the coalesced out segment lists from the trigger generator
@@ -166,6 +174,175 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		self.seglists = ligolw_search_summary.segmentlistdict_fromsearchsummary(xmldoc, program = program).coalesce()
 		if vetoes is not None:
 			self.seglists -= vetoes
+		self.seglists_index = vetoindex.VetoIndexDict(self.seglists)
+
+		#
+		# the sngl_inspiral columns used by .append_coincs() are
+		# extracted on first use
+		#
+
+		self.xmldoc = xmldoc
+		self.sngl_columns = None
+
+	def get_sngl_columns(self, effective_snr_factor):
+		"""
+		Return a dictionary of arrays of the sngl_inspiral columns
+		from which .append_coincs() computes the coinc_inspiral
+		rows, indexed by the events' positions in the sngl_inspiral
+		table.  "index" maps event ID to position, "instruments" is
+		the sorted list of instrument names and "ifo" holds each
+		event's position in that list.  The effective SNR of events
+		for which it cannot be computed, e.g. those without a
+		\chi^{2} value, is stored as NaN.
+		"""
+		if self.sngl_columns is not None and self.sngl_columns["effective_snr_factor"] == effective_snr_factor:
+			return self.sngl_columns
+
+		def effective_snr(event):
+			if not event.chisq:
+				return float("nan")
+			try:
+				return event.get_effective_snr(fac = effective_snr_factor)
+			except ZeroDivisionError:
+				return float("nan")
+
+		events = list(lsctables.SnglInspiralTable.get_table(self.xmldoc))
+		instruments = sorted(set(event.ifo for event in events) | set(self.seglists))
+		code = dict((instrument, i) for i, instrument in enumerate(instruments))
+		self.sngl_columns = {
+			"effective_snr_factor": effective_snr_factor,
+			"events": events,
+			"index": dict((event.event_id, i) for i, event in enumerate(events)),
+			"instruments": instruments,
+			"ifo": numpy.fromiter((code[event.ifo] for event in events), dtype = "intp", count = len(events)),
+			"mtotal": numpy.fromiter((event.mass1 + event.mass2 for event in events), dtype = "double", count = len(events)),
+			"mchirp": numpy.fromiter((event.mchirp for event in events), dtype = "double", count = len(events)),
+			"has_chisq": numpy.fromiter((bool(event.chisq) for event in events), dtype = "bool", count = len(events)),
+			"effective_snr": numpy.fromiter((effective_snr(event) for event in events), dtype = "double", count = len(events)),
+			"end_ns": numpy.fromiter((event.end_time * 1000000000 + event.end_time_ns for event in events), dtype = "int64", count = len(events))
+		}
+		return self.sngl_columns
+
+	def append_coincs(self, process_id, time_slide_id, coinc_def_id, coincs, effective_snr_factor):
+		"""
+		Bulk form of .append_coinc().  coincs is a sequence of
+		tuples of sngl_inspiral event IDs, all found at the offset
+		vector time_slide_id.  The rows are the same as those
+		.append_coinc() would construct for each coinc in turn, but
+		the coinc_inspiral columns and the instruments that were on
+		are computed for all of the coincs at once with numpy, and
+		the rows are appended in one batch.
+		"""
+		coincs = tuple(coincs)
+		if not coincs:
+			return
+
+		#
+		# populate the coinc_event and coinc_event_map tables
+		#
+
+		coinc_rows = snglcoinc.CoincTables.append_coincs(self, process_id, time_slide_id, coinc_def_id, coincs)
+
+		#
+		# compute the coinc_inspiral columns as in .append_coinc(),
+		# one coinc size at a time.  the end time is that of the
+		# coinc's first event in alphabetical order by instrument
+		#
+
+		columns = self.get_sngl_columns(effective_snr_factor)
+		instruments = columns["instruments"]
+		offsetvector = self.time_slide_index[time_slide_id]
+		offsets_ns = numpy.array([offsetvector[instrument].ns() if instrument in offsetvector else 0 for instrument in instruments], dtype = "int64")
+
+		n = len(coincs)
+		mass = numpy.empty((n,), dtype = "double")
+		mchirp = numpy.empty((n,), dtype = "double")
+		snr = numpy.empty((n,), dtype = "double")
+		end_ns = numpy.empty((n,), dtype = "int64")
+		ifo_bits = numpy.empty((n,), dtype = "int64")
+
+		index = columns["index"]
+		sizes = numpy.fromiter((len(coinc) for coinc in coincs), dtype = "intp", count = n)
+		for size in set(sizes.tolist()):
+			rows = numpy.flatnonzero(sizes == size)
+			idx = numpy.array([[index[event_id] for event_id in coincs[i]] for i in rows], dtype = "intp").reshape((len(rows), size))
+			ifo = columns["ifo"][idx]
+			first = ifo.argmin(axis = 1)
+			r = numpy.arange(len(rows))
+			mass[rows] = columns["mtotal"][idx].sum(axis = 1) / size
+			mchirp[rows] = columns["mchirp"][idx].sum(axis = 1) / size
+			# NaN, and so None, if any event lacks a \chi^{2} value
+			snr[rows] = numpy.sqrt((columns["effective_snr"][idx]**2).sum(axis = 1))
+			if numpy.isnan(snr[rows][columns["has_chisq"][idx].all(axis = 1)]).any():
+				# .append_coinc() would have raised here too
+				raise ZeroDivisionError("effective SNR is undefined for a trigger in a coincidence")
+			end_ns[rows] = columns["end_ns"][idx[r, first]] + offsets_ns[ifo[r, first]]
+			ifo_bits[rows] = numpy.bitwise_or.reduce(numpy.left_shift(1, ifo), axis = 1)
+
+		#
+		# record the instruments that were on at the time of each
+		# coinc.  note that the end time of the coinc must be unslid
+		# to compare with the instrument segment lists
+		#
+
+		on_bits = ifo_bits.copy()
+		for instrument in self.seglists:
+			on = self.seglists_index.mask_ns(instrument, end_ns - offsetvector[instrument].ns())
+			on_bits[on] |= 1 << snglcoinc.instrument_bit(instruments, instrument)
+
+		#
+		# convert the instrument sets to strings once for each
+		# distinct set, re-using strings to save memory
+		#
+
+		ifos_strings = {}
+		for bits in numpy.unique(ifo_bits).tolist():
+			coinc_inspiral = self.coinc_inspiral_table.RowType()
+			coinc_inspiral.instruments = snglcoinc.instruments_from_bits(instruments, bits)
+			ifos_strings[bits] = self.uniquifier.setdefault(coinc_inspiral.ifos, coinc_inspiral.ifos)
+		instruments_strings = {}
+		for bits in numpy.unique(on_bits).tolist():
+			coinc = self.coinctable.RowType()
+			coinc.set_instruments(snglcoinc.instruments_from_bits(instruments, bits))
+			instruments_strings[bits] = self.uniquifier.setdefault(coinc.instruments, coinc.instruments)
+
+		#
+		# populate the coinc_inspiral table
+		#
+
+		RowType = self.coinc_inspiral_table.RowType
+		coinc_inspiral_rows = []
+		for coinc, row_mass, row_mchirp, row_snr, row_end_ns, row_ifo_bits, row_on_bits in itertools.izip(coinc_rows, mass.tolist(), mchirp.tolist(), snr.tolist(), end_ns.tolist(), ifo_bits.tolist(), on_bits.tolist()):
+			coinc_inspiral = RowType()
+			coinc_inspiral.coinc_event_id = coinc.coinc_event_id
+			coinc_inspiral.mass = row_mass
+			coinc_inspiral.mchirp = row_mchirp
+			coinc_inspiral.snr = None if math.isnan(row_snr) else row_snr
+			coinc_inspiral.false_alarm_rate = None
+			coinc_inspiral.combined_far = None
+			coinc_inspiral.minimum_duration = None
+			coinc_inspiral.end_time, coinc_inspiral.end_time_ns = divmod(row_end_ns, 1000000000)
+			coinc_inspiral.ifos = ifos_strings[row_ifo_bits]
+			coinc_inspiral_rows.append(coinc_inspiral)
+			coinc.instruments = instruments_strings[row_on_bits]
+		self.coinc_inspiral_table.extend(coinc_inspiral_rows)
+
+		#
+		# if a likelihood ratio calculator is available, assign a
+		# likelihood ratio to each coinc
+		#
+
+		if self.likelihood_func is not None:
+			events = columns["events"]
+			for coinc, event_ids in itertools.izip(coinc_rows, coincs):
+				coinc.likelihood = self.likelihood_func(self.likelihood_params_func(tuple(events[index[event_id]] for event_id in event_ids), offsetvector))
+
+		#
+		# the rows are complete, they can be written to the
+		# database
+		#
+
+		self.flush_full()
 
 	def append_coinc(self, process_id, time_slide_id, coinc_def_id, events, effective_snr_factor):
 		#
@@ -229,6 +406,13 @@ class InspiralCoincTables(snglcoinc.CoincTables):
 		coinc.instruments = self.uniquifier.setdefault(coinc.instruments, coinc.instruments)
 		coinc_inspiral.ifos = self.uniquifier.setdefault(coinc_inspiral.ifos, coinc_inspiral.ifos)
 
+		#
+		# the rows are complete, they can be written to the
+		# database
+		#
+
+		self.flush_full()
+
 		#
 		# done
 		#
@@ -302,6 +486,40 @@ class InspiralEventList(snglcoinc.EventList):
 		return [event_b for event_b in self[bisect.bisect_left(self, end - self.dt) : bisect.bisect_right(self, end + self.dt)] if not comparefunc(event_a, offset_a, event_b, self.offset, light_travel_time, e_thinca_parameter)]
 
 
+class ColumnarInspiralEventList(snglcoinc.ColumnarEventList):
+	"""
+	A version of InspiralEventList that stores the end times (as
+	integer nanoseconds), masses and e-thinca metric components of the
+	events in numpy arrays, allowing snglcoinc.get_doubles() to find
+	all candidate pairs for an offset vector in one pass.  Can be used
+	in place of InspiralEventList;  the coincidences found are the
+	same.
+	"""
+	@staticmethod
+	def event_time_ns(event):
+		return event.end_time * 1000000000 + event.end_time_ns
+
+	def make_columns(self):
+		return {
+			"mass1": numpy.fromiter((event.mass1 for event in self), dtype = "double", count = len(self)),
+			"mass2": numpy.fromiter((event.mass2 for event in self), dtype = "double", count = len(self)),
+			"mchirp": numpy.fromiter((event.mchirp for event in self), dtype = "double", count = len(self)),
+			"eta": numpy.fromiter((event.eta for event in self), dtype = "double", count = len(self)),
+			"tau0": numpy.fromiter((event.tau0 for event in self), dtype = "double", count = len(self)),
+			"tau3": numpy.fromiter((event.tau3 for event in self), dtype = "double", count = len(self)),
+			"Gamma": numpy.array([(event.Gamma0, event.Gamma1, event.Gamma2, event.Gamma3, event.Gamma4, event.Gamma5, event.Gamma6, event.Gamma7, event.Gamma8, event.Gamma9) for event in self], dtype = "double").reshape((len(self), 10))
+		}
+
+	def set_dt(self, dt):
+		"""
+		If an event's end time differs by more than this many
+		seconds from the end time of another event then it is
+		*impossible* for them to be coincident.
+		"""
+		# add 1% for safety
+		snglcoinc.ColumnarEventList.set_dt(self, dt * 1.01)
+
+
 #
 # =============================================================================
 #
@@ -342,6 +560,26 @@ def inspiral_coinc_compare(a, offseta, b, offsetb, light_travel_time, e_thinca_p
 	return not coincident
 
 
+def inspiral_coinc_compare_batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, e_thinca_parameter):
+	"""
+	Vectorized form of inspiral_coinc_compare() for use with
+	ColumnarInspiralEventList.  Computes the e-thinca parameter for the
+	pairs of events (eventlist_a[ia[i]], eventlist_b[ib[i]]) in one
+	call into LAL, and returns a boolean array that is False for the
+	pairs that pass the ellipsoidal thinca test.  The events' end
+	times are not modified.
+	"""
+	a = eventlist_a.columns
+	b = eventlist_b.columns
+	ethinca = xlaltools.XLALCalculateEThincaParameterArray(
+		eventlist_a.instrument, eventlist_a.time_ns[ia], numpy.repeat(numpy.int64(eventlist_a.offset_ns), len(ia)), a["tau0"][ia], a["tau3"][ia], a["Gamma"][ia],
+		eventlist_b.instrument, eventlist_b.time_ns[ib], numpy.repeat(numpy.int64(eventlist_b.offset_ns), len(ib)), b["tau0"][ib], b["tau3"][ib], b["Gamma"][ib]
+	)
+	# FIXME:  should it be "<" or "<="?
+	return ~(ethinca <= e_thinca_parameter)
+inspiral_coinc_compare.batched = inspiral_coinc_compare_batched
+
+
 def inspiral_coinc_compare_exact(a, offseta, b, offsetb, light_travel_time, e_thinca_parameter):
 	"""
 	Returns False (a & b are coincident) if they pass the ellipsoidal
@@ -350,6 +588,21 @@ def inspiral_coinc_compare_exact(a, offseta, b, offsetb, light_travel_time, e_th
 	return (a.mass1 != b.mass1) or (a.mass2 != b.mass2) or inspiral_coinc_compare(a, offseta, b, offsetb, light_travel_time, e_thinca_parameter)
 
 
+def inspiral_coinc_compare_exact_batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, e_thinca_parameter):
+	"""
+	Vectorized form of inspiral_coinc_compare_exact() for use with
+	ColumnarInspiralEventList.
+	"""
+	a = eventlist_a.columns
+	b = eventlist_b.columns
+	result = (a["mass1"][ia] != b["mass1"][ib]) | (a["mass2"][ia] != b["mass2"][ib])
+	# only compute e-thinca for the pairs whose masses match
+	match, = (~result).nonzero()
+	result[match] = inspiral_coinc_compare_batched(eventlist_a, ia[match], eventlist_b, ib[match], light_travel_time, e_thinca_parameter)
+	return result
+inspiral_coinc_compare_exact.batched = inspiral_coinc_compare_exact_batched
+
+
 #
 # =============================================================================
 #
@@ -393,6 +646,11 @@ def replicate_threshold(e_thinca_parameter, instruments):
 	return thresholds
 
 
+# number of coincs whose rows are constructed together by
+# InspiralCoincTables.append_coincs()
+coinc_block_size = 1 << 14
+
+
 def ligolw_thinca(
 	xmldoc,
 	process_id,
@@ -406,7 +664,12 @@ def ligolw_thinca(
 	likelihood_func = None,
 	likelihood_params_func = None,
 	verbose = False,
-	max_dt = None
+	max_dt = None,
+	eventlist_type = InspiralEventList,
+	nprocs = 1,
+	low_memory = False,
+	coinc_engine = "graph",
+	connection = None
 ):
 	#
 	# prepare the coincidence table interface.
@@ -414,7 +677,7 @@ def ligolw_thinca(
 
 	if verbose:
 		print >>sys.stderr, "indexing ..."
-	coinc_tables = InspiralCoincTables(xmldoc, vetoes = veto_segments, program = trigger_program, likelihood_func = likelihood_func, likelihood_params_func = likelihood_params_func)
+	coinc_tables = InspiralCoincTables(xmldoc, vetoes = veto_segments, program = trigger_program, likelihood_func = likelihood_func, likelihood_params_func = likelihood_params_func, connection = connection)
 	coinc_def_id = ligolw_coincs.get_coinc_def_id(xmldoc, coinc_definer_row.search, coinc_definer_row.search_coinc_type, create_new = True, description = coinc_definer_row.description)
 	sngl_index = dict((row.event_id, row) for row in lsctables.SnglInspiralTable.get_table(xmldoc))
 
@@ -424,10 +687,18 @@ def ligolw_thinca(
 	# removing events from the lists that fall in vetoed segments
 	#
 
-	eventlists = snglcoinc.make_eventlists(xmldoc, InspiralEventList, lsctables.SnglInspiralTable.tableName)
+	eventlists = snglcoinc.make_eventlists(xmldoc, eventlist_type, lsctables.SnglInspiralTable.tableName)
 	if veto_segments is not None:
-		for eventlist in eventlists.values():
-			iterutils.inplace_filter((lambda event: event.ifo not in veto_segments or event.get_end() not in veto_segments[event.ifo]), eventlist)
+		veto_index = vetoindex.VetoIndexDict(veto_segments)
+		for instrument, eventlist in eventlists.items():
+			# the event lists are keyed by the events' ifo
+			# columns.  test all of an instrument's end times
+			# in one call
+			vetoed = veto_index.mask_ns(instrument, numpy.fromiter((event.end_time * 1000000000 + event.end_time_ns for event in eventlist), dtype = "int64", count = len(eventlist)))
+			if vetoed.any():
+				eventlist[:] = [event for event, veto in itertools.izip(eventlist, vetoed) if not veto]
+			# rebuild any indexes invalidated by the removals
+			eventlist.make_index()
 
 	#
 	# set the \Delta t parameter on all the event lists
@@ -448,20 +719,42 @@ def ligolw_thinca(
 	thresholds = replicate_threshold(thresholds, set(eventlists))
 
 	#
-	# construct offset vector assembly graph
+	# construct offset vector assembly graph, or the time-ordered
+	# sweep that replaces it.  the two produce the same coincs
 	#
 
-	time_slide_graph = snglcoinc.TimeSlideGraph(coinc_tables.time_slide_index, verbose = verbose)
+	if coinc_engine == "graph":
+		time_slide_graph = snglcoinc.TimeSlideGraph(coinc_tables.time_slide_index, verbose = verbose, low_memory = low_memory)
+		coincs = time_slide_graph.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose, nprocs = nprocs)
+	elif coinc_engine == "sweep":
+		if not issubclass(eventlist_type, snglcoinc.ColumnarEventList):
+			raise ValueError("coinc_engine \"sweep\" requires a ColumnarEventList eventlist_type")
+		time_slide_sweep = snglcoinc.TimeSlideSweep(coinc_tables.time_slide_index, verbose = verbose)
+		coincs = time_slide_sweep.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose)
+	else:
+		raise ValueError("unrecognized coinc_engine \"%s\"" % coinc_engine)
 
 	#
 	# retrieve all coincidences, apply the final n-tuple compare func
 	# and record the survivors
 	#
 
-	for node, coinc in time_slide_graph.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose):
-		coinc = tuple(sngl_index[event_id] for event_id in coinc)
-		if not ntuple_comparefunc(coinc, node.offset_vector):
-			coinc_tables.append_coinc(process_id, node.time_slide_id, coinc_def_id, coinc, effective_snr_factor)
+	# the coincs are collected into blocks that share a time slide
+	# and the rows for each block are constructed in one call.  the
+	# engines report a time slide's coincs together, so a block is
+	# flushed when the time slide changes or when it is full
+
+	block = []
+	block_time_slide_id = None
+	for node, coinc in coincs:
+		if ntuple_comparefunc is not default_ntuple_comparefunc and ntuple_comparefunc(tuple(sngl_index[event_id] for event_id in coinc), node.offset_vector):
+			continue
+		if node.time_slide_id != block_time_slide_id or len(block) >= coinc_block_size:
+			coinc_tables.append_coincs(process_id, block_time_slide_id, coinc_def_id, block, effective_snr_factor)
+			block = []
+			block_time_slide_id = node.time_slide_id
+		block.append(coinc)
+	coinc_tables.append_coincs(process_id, block_time_slide_id, coinc_def_id, block, effective_snr_factor)
 
 	#
 	# remove time offsets from events
@@ -469,6 +762,16 @@ def ligolw_thinca(
 
 	del eventlists.offsetvector
 
+	#
+	# if the coincs are being streamed into a database, write out the
+	# last of the rows and index the tables now that they're complete
+	#
+
+	if connection is not None:
+		coinc_tables.flush()
+		coinc_tables.build_indexes()
+		connection.commit()
+
 	#
 	# done
 	#
@@ -142,6 +142,26 @@ class Bins(object):
 			return slice(self[x.start] if x.start is not None else 0, self[x.stop] + 1 if x.stop is not None else len(self))
 		raise NotImplementedError
 
+	def indices(self, x):
+		"""
+		Convert an array of co-ordinates to an array of bin
+		indices.  This is the array form of .__getitem__() for
+		single values:  the result has the shape of x, and each
+		co-ordinate for which .__getitem__() would raise IndexError
+		is mapped to -1.  This implementation calls .__getitem__()
+		for each co-ordinate, subclasses override it with array
+		arithmetic.  If x is not a numpy array it is treated as a
+		1-dimensional sequence.
+		"""
+		def index(value):
+			try:
+				return self[value]
+			except IndexError:
+				return -1
+		if isinstance(x, numpy.ndarray):
+			return numpy.fromiter((index(value) for value in x.flat), dtype = "intp", count = x.size).reshape(x.shape)
+		return numpy.fromiter((index(value) for value in x), dtype = "intp")
+
 	def __iter__(self):
 		"""
 		If __iter__ does not exist, Python uses __getitem__ with
@@ -258,6 +278,24 @@ class Bins(object):
 			yield uniform(l[i], u[i]), ln_Pi - ln_dx[i]
 
 
+def _floor_as_scalar(bins, x, v, result):
+	"""
+	For internal use by the .indices() methods of Bins subclasses
+	whose bin index is the floor of a value v computed with a
+	transcendental function.  numpy's log(), arctan(), etc. can differ
+	from the math module's in the last bit, which can move a
+	co-ordinate lying on a bin boundary into the neighbouring bin.  The
+	elements of result whose v is within rounding error of an integer
+	are recomputed with bins.__getitem__() so that .indices() agrees
+	exactly with .__getitem__().  x, v and result are 1-dimensional
+	arrays of the same length;  result is modified in place and
+	returned.
+	"""
+	for i in numpy.flatnonzero(numpy.abs(v - numpy.round(v)) <= 1e-8 * numpy.maximum(1., numpy.abs(v))):
+		result[i] = bins[x[i]]
+	return result
+
+
 class IrregularBins(Bins):
 	"""
 	Bins with arbitrary, irregular spacing.  We only require strict
@@ -278,6 +316,8 @@ class IrregularBins(Bins):
 	2
 	>>> x[4:17]
 	slice(0, 3, None)
+	>>> x.indices(numpy.array([-1.0, 1.5, 13.0, 25.0, numpy.inf])).tolist()
+	[-1, 0, 1, 2, 2]
 	>>> IrregularBins([0.0, 15.0, 11.0])
 	Traceback (most recent call last):
 		...
@@ -324,6 +364,14 @@ class IrregularBins(Bins):
 			return len(self.boundaries) - 2
 		raise IndexError(x)
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		result = numpy.asarray(numpy.array(self.boundaries).searchsorted(x, side = "right") - 1, dtype = "intp")
+		result[~((self.min <= x) & (x < self.max))] = -1
+		# special measure-zero edge case
+		result[x == self.max] = len(self.boundaries) - 2
+		return result
+
 	def lower(self):
 		return numpy.array(self.boundaries[:-1])
 
@@ -371,6 +419,12 @@ class LinearBins(Bins):
 	slice(1, 3, None)
 	>>> x[10:]
 	slice(1, 3, None)
+
+	Arrays of co-ordinates are converted with .indices(), which maps
+	co-ordinates outside the binning to -1:
+
+	>>> x.indices(numpy.array([0.0, 1.0, 1.5, 10.0, 25.0, 27.0])).tolist()
+	[-1, 0, 0, 1, 2, -1]
 	"""
 	def __init__(self, min, max, n):
 		super(LinearBins, self).__init__(min, max, n)
@@ -386,6 +440,15 @@ class LinearBins(Bins):
 			return len(self) - 1
 		raise IndexError(x)
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		result = -numpy.ones(x.shape, dtype = "intp")
+		inrange = (self.min <= x) & (x < self.max)
+		result[inrange] = numpy.floor((x[inrange] - self.min) / self.delta)
+		# special "measure zero" corner case
+		result[x == self.max] = len(self) - 1
+		return result
+
 	def lower(self):
 		return numpy.linspace(self.min, self.max - self.delta, len(self))
 
@@ -433,6 +496,8 @@ class LinearPlusOverflowBins(Bins):
 	slice(0, 3, None)
 	>>> x[9:float("+inf")]
 	slice(2, 5, None)
+	>>> x.indices(numpy.array([float("-inf"), 1, 10, 24.99999999, 25, 100])).tolist()
+	[0, 1, 2, 3, 4, 4]
 	"""
 	def __init__(self, min, max, n):
 		if n < 3:
@@ -453,6 +518,17 @@ class LinearPlusOverflowBins(Bins):
 			return 0
 		raise IndexError(x)
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		result = -numpy.ones(x.shape, dtype = "intp")
+		inrange = (self.min <= x) & (x < self.max)
+		result[inrange] = numpy.floor((x[inrange] - self.min) / self.delta) + 1
+		# +infinity overflow bin
+		result[x >= self.max] = len(self) - 1
+		# -infinity overflow bin
+		result[x < self.min] = 0
+		return result
+
 	def lower(self):
 		return numpy.concatenate((numpy.array([NegInf]), self.min + self.delta * numpy.arange(len(self) - 2), numpy.array([self.max])))
 
@@ -479,6 +555,8 @@ class LogarithmicBins(Bins):
 	1
 	>>> x[25]
 	2
+	>>> x.indices(numpy.array([0, 1, 5, 25, 26])).tolist()
+	[-1, 0, 1, 2, -1]
 	"""
 	def __init__(self, min, max, n):
 		super(LogarithmicBins, self).__init__(min, max, n)
@@ -494,6 +572,17 @@ class LogarithmicBins(Bins):
 			return len(self) - 1
 		raise IndexError(x)
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		result = -numpy.ones(x.shape, dtype = "intp")
+		inrange = (self.min <= x) & (x < self.max)
+		x_inrange = x[inrange]
+		v = (numpy.log(x_inrange) - math.log(self.min)) / self.delta
+		result[inrange] = _floor_as_scalar(self, x_inrange, v, numpy.floor(v).astype("intp"))
+		# special "measure zero" corner case
+		result[x == self.max] = len(self) - 1
+		return result
+
 	def lower(self):
 		return numpy.exp(numpy.linspace(math.log(self.min), math.log(self.max) - self.delta, len(self)))
 
@@ -529,6 +618,8 @@ class LogarithmicPlusOverflowBins(Bins):
 	4
 	>>> x[100]
 	4
+	>>> x.indices(numpy.array([0, 1, 5, 24.999, 25, 100])).tolist()
+	[0, 1, 2, 3, 4, 4]
 	>>> x.lower()
 	array([  0.        ,   1.        ,   2.92401774,   8.54987973,  25.        ])
 	>>> x.upper()
@@ -555,6 +646,19 @@ class LogarithmicPlusOverflowBins(Bins):
 			return 0
 		raise IndexError(x)
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		result = -numpy.ones(x.shape, dtype = "intp")
+		inrange = (self.min <= x) & (x < self.max)
+		x_inrange = x[inrange]
+		v = (numpy.log(x_inrange) - math.log(self.min)) / self.delta
+		result[inrange] = _floor_as_scalar(self, x_inrange, v, 1 + numpy.floor(v).astype("intp"))
+		# infinity overflow bin
+		result[x >= self.max] = len(self) - 1
+		# zero overflow bin
+		result[x < self.min] = 0
+		return result
+
 	def lower(self):
 		return numpy.concatenate((numpy.array([0.]), numpy.exp(numpy.linspace(math.log(self.min), math.log(self.max), len(self) - 1))))
 
@@ -584,6 +688,8 @@ class ATanBins(Bins):
 	5
 	>>> x[float("+inf")]
 	10
+	>>> x.indices(numpy.array([float("-inf"), 0, float("+inf")])).tolist()
+	[0, 5, 10]
 	>>> x.centres()
 	array([-4.42778777, -1.39400285, -0.73469838, -0.40913068, -0.18692843,
 	        0.        ,  0.18692843,  0.40913068,  0.73469838,  1.39400285,
@@ -605,6 +711,18 @@ class ATanBins(Bins):
 		# x == 1, special "measure zero" corner case
 		return len(self) - 1
 
+	def indices(self, x):
+		x = numpy.asarray(x, dtype = "double")
+		# map to the domain [0, 1]
+		y = numpy.arctan((x - self.mid) * self.scale) / math.pi + 0.5
+		# y == 1, special "measure zero" corner case
+		result = numpy.empty(x.shape, dtype = "intp")
+		result.fill(len(self) - 1)
+		below = y < 1.
+		v = y[below] / self.delta
+		result[below] = _floor_as_scalar(self, x[below], v, numpy.floor(v).astype("intp"))
+		return result
+
 	def lower(self):
 		x = numpy.tan(numpy.linspace(-math.pi / 2., +math.pi / 2., len(self), endpoint = False)) / self.scale + self.mid
 		x[0] = NegInf
@@ -719,6 +837,8 @@ class Categories(Bins):
 	Traceback (most recent call last):
 		...
 	IndexError: -1
+	>>> categories.indices([2, 4, -1]).tolist()
+	[0, 1, -1]
 
 	This last example demonstrates the behaviour when the intersection
 	of the categorys is not the empty set.
@@ -758,6 +878,21 @@ class Categories(Bins):
 		return self.containers
 
 
+def _bin_index(bins, x):
+	"""
+	Convert the co-ordinate x to a bin index with the Bins instance
+	bins.  x can be a numpy array, in which case an array of bin
+	indices is returned, and IndexError is raised if any of the
+	co-ordinates is outside the binning.
+	"""
+	if isinstance(x, numpy.ndarray):
+		indices = bins.indices(x)
+		if (indices < 0).any():
+			raise IndexError(x[indices < 0][0])
+		return indices
+	return bins[x]
+
+
 class NDBins(tuple):
 	"""
 	Multi-dimensional co-ordinate binning.  An instance of this object
@@ -818,14 +953,48 @@ class NDBins(tuple):
 		will accept.  Note that the co-ordinates to be converted
 		must be a tuple, even if it is only a 1-dimensional
 		co-ordinate.
+
+		A co-ordinate can also be a numpy array of values, which is
+		converted to an array of bin indices with the Bins
+		instance's .indices() method.  IndexError is raised if any
+		of the values is outside the binning.
+
+		>>> x[numpy.array([1, 10, 20]), 1]
+		(array([0, 1, 2]), 0)
+
+		Note that when arrays of co-ordinates are used to modify a
+		BinnedArray, as in binnedarray[arr, ...] += w, numpy applies
+		the increment once to each distinct bin:  repeated indices
+		are silently dropped instead of accumulated.  Use
+		BinnedArray.fill() (or numpy.add.at()) to accumulate
+		weights into bins that can repeat.
 		"""
 		if isinstance(coords, tuple):
 			if len(coords) != len(self):
 				raise ValueError("dimension mismatch")
-			return tuple(map(lambda b, c: b[c], self, coords))
+			return tuple(map(_bin_index, self, coords))
 		else:
 			return tuple.__getitem__(self, coords)
 
+	def indices(self, coords):
+		"""
+		Convert N-dimensional co-ordinates to bin indices in bulk.
+		coords is a sequence of arrays, one for each dimension,
+		and the return value is a tuple of arrays of bin indices
+		computed by the .indices() methods of the Bins instances.
+		Co-ordinates outside the binning are mapped to -1 in the
+		corresponding dimension.
+
+		Example:
+
+		>>> x = NDBins((LinearBins(1, 25, 3), LogarithmicBins(1, 25, 3)))
+		>>> [index.tolist() for index in x.indices((numpy.array([1, 10, 30]), numpy.array([1, 5, 5])))]
+		[[0, 1, -1], [0, 1, 1]]
+		"""
+		if len(coords) != len(self):
+			raise ValueError("dimension mismatch")
+		return tuple(b.indices(c) for b, c in zip(self, coords))
+
 	def lower(self):
 		"""
 		Return a tuple of arrays, where each array contains the
@@ -1033,6 +1202,95 @@ def bins_spanned(bins, seglist, dtype = "double"):
 #
 
 
+#
+# rebinning.  the mapping from one binning to another is computed once
+# for each pair of binnings and cached, so repeatedly merging histograms
+# with the same pair of binnings costs one numpy.add.reduceat() per
+# dimension
+#
+
+
+_rebin_maps = {}
+
+
+def _binning_key(binning):
+	"""
+	Return a hashable description of a Bins instance, equal for equal
+	binnings, or None if the binning cannot be described that way.
+	"""
+	if isinstance(binning, Categories):
+		return None
+	if isinstance(binning, IrregularBins):
+		return type(binning), tuple(binning.boundaries)
+	return type(binning), binning.min, binning.max, len(binning)
+
+
+def rebin_map(source, target):
+	"""
+	Compute the mapping from the bins of the Bins instance source to
+	those of the Bins instance target, assigning each source bin to the
+	target bin containing its centre.  The return value is a tuple
+	(order, starts, targets):  after the source bins are put in the
+	order order (None if no re-ordering is needed), the runs beginning
+	at the positions starts are summed into the target bins targets.
+	ValueError is raised if a source bin's centre is outside the
+	target binning.  The result is cached.
+
+	Example:
+
+	>>> order, starts, targets = rebin_map(LinearBins(0, 10, 10), LinearBins(0, 10, 5))
+	>>> starts.tolist(), targets.tolist()
+	([0, 2, 4, 6, 8], [0, 1, 2, 3, 4])
+	"""
+	key = _binning_key(source), _binning_key(target)
+	try:
+		return _rebin_maps[key]
+	except KeyError:
+		pass
+	mapping = target.indices(source.centres())
+	if (mapping < 0).any():
+		raise ValueError("binning %s does not cover binning %s" % (repr(target), repr(source)))
+	order = mapping.argsort(kind = "mergesort")
+	mapping = mapping[order]
+	if (order == numpy.arange(len(order))).all():
+		order = None
+	starts = numpy.flatnonzero(numpy.concatenate(([True], mapping[1:] != mapping[:-1])))
+	result = order, starts, mapping[starts]
+	if None not in key:
+		_rebin_maps[key] = result
+	return result
+
+
+def rebin_array(array, source, target):
+	"""
+	Sum the contents of array, binned with the NDBins instance source,
+	into a new array binned with the NDBins instance target.  Each bin
+	in source is added to the bin in target containing its centre.
+
+	Example:
+
+	>>> rebin_array(numpy.arange(10.), NDBins((LinearBins(0, 10, 10),)), NDBins((LinearBins(0, 10, 5),))).tolist()
+	[1.0, 5.0, 9.0, 13.0, 17.0]
+	"""
+	if len(source) != len(target):
+		raise ValueError("dimension mismatch")
+	for axis, (source_binning, target_binning) in enumerate(zip(source, target)):
+		order, starts, targets = rebin_map(source_binning, target_binning)
+		if order is not None:
+			array = array.take(order, axis = axis)
+		array = numpy.add.reduceat(array, starts, axis = axis)
+		if len(targets) != len(target_binning) or (targets != numpy.arange(len(targets))).any():
+			# some target bins receive nothing
+			shape = list(array.shape)
+			shape[axis] = len(target_binning)
+			result = numpy.zeros(shape, dtype = array.dtype)
+			index = [slice(None)] * array.ndim
+			index[axis] = targets
+			result[tuple(index)] = array
+			array = result
+	return array
+
+
 class BinnedArray(object):
 	"""
 	A convenience wrapper, using the NDBins class to provide access to
@@ -1098,6 +1356,55 @@ class BinnedArray(object):
 	def __len__(self):
 		return len(self.array)
 
+	def fill(self, coords, weights = None, discard_out_of_range = False):
+		"""
+		Histogram many co-ordinates at once.  coords is a sequence
+		of arrays, one for each dimension of the binning, such
+		that (coords[0][i], coords[1][i], ...) is the i-th
+		co-ordinate.  weights is an array of the weights to add to
+		the bins containing the co-ordinates, or None to add 1 for
+		each.  The result is the same as
+
+		for i in range(len(coords[0])):
+			x[coords[0][i], coords[1][i], ...] += weights[i]
+
+		but the bin indices are computed with array arithmetic and
+		the weights are accumulated in a single call to
+		numpy.bincount().  If any co-ordinate is outside the
+		binning IndexError is raised and the array is not
+		modified, unless discard_out_of_range is True in which
+		case those co-ordinates are skipped.
+
+		Example:
+
+		>>> x = BinnedArray(NDBins((LinearBins(0, 10, 5),)))
+		>>> x.fill((numpy.array([0, 0.5, 3, 9.99]),))
+		>>> x.array.tolist()
+		[2.0, 1.0, 0.0, 0.0, 1.0]
+		>>> x.fill((numpy.array([1, 11]),), weights = numpy.array([0.5, 1]))
+		Traceback (most recent call last):
+			...
+		IndexError: (11,)
+		>>> x.fill((numpy.array([1, 11]),), weights = numpy.array([0.5, 1]), discard_out_of_range = True)
+		>>> x.array.tolist()
+		[2.5, 1.0, 0.0, 0.0, 1.0]
+		"""
+		indices = self.bins.indices(coords)
+		inrange = numpy.ones(numpy.shape(indices[0]), dtype = "bool")
+		for index in indices:
+			inrange &= index >= 0
+		if not inrange.all():
+			if not discard_out_of_range:
+				i = numpy.flatnonzero(~inrange)[0]
+				raise IndexError(tuple(c[i] for c in coords))
+			indices = tuple(index[inrange] for index in indices)
+			if weights is not None:
+				weights = numpy.asarray(weights)[inrange]
+		if not len(indices[0]):
+			return
+		counts = numpy.bincount(numpy.ravel_multi_index(indices, self.array.shape), weights = weights, minlength = self.array.size)
+		self.array += counts.reshape(self.array.shape)
+
 	def __iadd__(self, other):
 		"""
 		Add the contents of another BinnedArray object to this one.
@@ -1112,10 +1419,27 @@ class BinnedArray(object):
 		# can other's bins be put into ours?
 		if self.bins.min != other.bins.min or self.bins.max != other.bins.max or False in map(lambda a, b: (b % a) == 0, self.bins.shape, other.bins.shape):
 			raise TypeError("incompatible binning: %s" % repr(other))
-		for coords in iterutils.MultiIter(*other.bins.centres()):
-			self[coords] += other[coords]
+		self.array += rebin_array(other.array, other.bins, self.bins)
 		return self
 
+	def rebin(self, bins):
+		"""
+		Return a new BinnedArray with the binning bins, an NDBins
+		instance, each of whose bins contains the sum of the bins
+		of this one whose centres it contains.  ValueError is
+		raised if any of the bin centres is outside the new
+		binning.  The index mapping between the two binnings is
+		computed once and cached (see rebin_map()).
+
+		Example:
+
+		>>> x = BinnedArray(NDBins((LinearBins(0, 10, 10),)))
+		>>> x.array[:] = range(10)
+		>>> x.rebin(NDBins((LinearBins(0, 10, 2),))).array.tolist()
+		[10.0, 35.0]
+		"""
+		return type(self)(bins, rebin_array(self.array, self.bins, bins))
+
 	def copy(self):
 		"""
 		Return a copy of the BinnedArray.  The .bins attribute is
@@ -1209,10 +1533,11 @@ class BinnedRatios(object):
 	Like BinnedArray, but provides a numerator array and a denominator
 	array.  The incnumerator() method increments a bin in the numerator
 	by the given weight, and the incdenominator() method increments a
-	bin in the denominator by the given weight.  There are no methods
-	provided for setting or decrementing either, but the they are
-	accessible as the numerator and denominator attributes, which are
-	both BinnedArray objects.
+	bin in the denominator by the given weight;  fillnumerator() and
+	filldenominator() do the same for many co-ordinates at once.
+	There are no methods provided for setting or decrementing either,
+	but the they are accessible as the numerator and denominator
+	attributes, which are both BinnedArray objects.
 	"""
 	def __init__(self, bins, dtype = "double"):
 		self.numerator = BinnedArray(bins, dtype = dtype)
@@ -1240,6 +1565,17 @@ class BinnedRatios(object):
 			raise TypeError("incompatible binning: %s" % repr(other))
 		return self
 
+	def rebin(self, bins):
+		"""
+		Return a new BinnedRatios with the binning bins, whose
+		numerator and denominator are those of this one rebinned
+		with BinnedArray.rebin().
+		"""
+		new = type(self)(NDBins())
+		new.numerator = self.numerator.rebin(bins)
+		new.denominator = self.denominator.rebin(bins)
+		return new
+
 	def incnumerator(self, coords, weight = 1):
 		"""
 		Add weight to the numerator bin at coords.
@@ -1252,6 +1588,20 @@ class BinnedRatios(object):
 		"""
 		self.denominator[coords] += weight
 
+	def fillnumerator(self, coords, weights = None, discard_out_of_range = False):
+		"""
+		Add weights to the numerator bins at many co-ordinates at
+		once.  See BinnedArray.fill().
+		"""
+		self.numerator.fill(coords, weights = weights, discard_out_of_range = discard_out_of_range)
+
+	def filldenominator(self, coords, weights = None, discard_out_of_range = False):
+		"""
+		Add weights to the denominator bins at many co-ordinates
+		at once.  See BinnedArray.fill().
+		"""
+		self.denominator.fill(coords, weights = weights, discard_out_of_range = discard_out_of_range)
+
 	def ratio(self):
 		"""
 		Compute and return the array of ratios.
@@ -1335,6 +1685,55 @@ class BinnedRatios(object):
 #
 
 
+def _interp_grid(binnedarray, fill_value):
+	"""
+	For internal use.  Return the co-ordinates of the interpolation
+	grid points along each dimension and the array of values at those
+	points used by InterpBinnedArray() and InterpBinnedArrayTable().
+	"""
+	# the upper and lower boundaries of the binnings are added as
+	# additional co-ordinates with the array being assumed to equal
+	# fill_value at those points.  this solves the problem of providing
+	# a valid function in the outer halves of the first and last bins.
+
+	# coords[0] = co-ordinates along 1st dimension,
+	# coords[1] = co-ordinates along 2nd dimension,
+	# ...
+	coords = tuple(numpy.hstack((l[0], c, u[-1])) for l, c, u in zip(binnedarray.bins.lower(), binnedarray.bins.centres(), binnedarray.bins.upper()))
+
+	# pad the contents of the binned array with 1 element of fill_value
+	# on each side in each dimension
+	try:
+		z = numpy.pad(binnedarray.array, [(1, 1)] * len(binnedarray.array.shape), mode = "constant", constant_values = [(fill_value, fill_value)] * len(binnedarray.array.shape))
+	except AttributeError:
+		# numpy < 1.7 didn't have pad().  FIXME:  remove when we
+		# can rely on a newer numpy
+		z = numpy.empty(tuple(l + 2 for l in binnedarray.array.shape))
+		z.fill(fill_value)
+		z[(slice(1, -1),) * len(binnedarray.array.shape)] = binnedarray.array
+
+	# if any co-ordinates are infinite, remove them.  also remove
+	# degenerate co-ordinates from ends
+	slices = []
+	for c in coords:
+		finite_indexes, = numpy.isfinite(c).nonzero()
+		assert len(finite_indexes) != 0
+
+		lo, hi = finite_indexes.min(), finite_indexes.max()
+
+		while lo < hi and c[lo + 1] == c[lo]:
+			lo += 1
+		while lo < hi and c[hi - 1] == c[hi]:
+			hi -= 1
+		assert lo < hi
+
+		slices.append(slice(lo, hi + 1))
+	coords = tuple(c[s] for c, s in zip(coords, slices))
+	z = z[slices]
+
+	return coords, z
+
+
 def InterpBinnedArray(binnedarray, fill_value = 0.0):
 	"""
 	Wrapper constructing a scipy.interpolate interpolator from the
@@ -1408,45 +1807,7 @@ def InterpBinnedArray(binnedarray, fill_value = 0.0):
 	dimensions that is slow, and in 3- and higher dimensions the
 	fall-back is to nearest-neighbour "interpolation".
 	"""
-	# the upper and lower boundaries of the binnings are added as
-	# additional co-ordinates with the array being assumed to equal
-	# fill_value at those points.  this solves the problem of providing
-	# a valid function in the outer halves of the first and last bins.
-
-	# coords[0] = co-ordinates along 1st dimension,
-	# coords[1] = co-ordinates along 2nd dimension,
-	# ...
-	coords = tuple(numpy.hstack((l[0], c, u[-1])) for l, c, u in zip(binnedarray.bins.lower(), binnedarray.bins.centres(), binnedarray.bins.upper()))
-
-	# pad the contents of the binned array with 1 element of fill_value
-	# on each side in each dimension
-	try:
-		z = numpy.pad(binnedarray.array, [(1, 1)] * len(binnedarray.array.shape), mode = "constant", constant_values = [(fill_value, fill_value)] * len(binnedarray.array.shape))
-	except AttributeError:
-		# numpy < 1.7 didn't have pad().  FIXME:  remove when we
-		# can rely on a newer numpy
-		z = numpy.empty(tuple(l + 2 for l in binnedarray.array.shape))
-		z.fill(fill_value)
-		z[(slice(1, -1),) * len(binnedarray.array.shape)] = binnedarray.array
-
-	# if any co-ordinates are infinite, remove them.  also remove
-	# degenerate co-ordinates from ends
-	slices = []
-	for c in coords:
-		finite_indexes, = numpy.isfinite(c).nonzero()
-		assert len(finite_indexes) != 0
-
-		lo, hi = finite_indexes.min(), finite_indexes.max()
-
-		while lo < hi and c[lo + 1] == c[lo]:
-			lo += 1
-		while lo < hi and c[hi - 1] == c[hi]:
-			hi -= 1
-		assert lo < hi
-
-		slices.append(slice(lo, hi + 1))
-	coords = tuple(c[s] for c, s in zip(coords, slices))
-	z = z[slices]
+	coords, z = _interp_grid(binnedarray, fill_value)
 
 	# build the interpolator from the co-ordinates and array data.
 	# scipy/numpy interpolators return an array-like thing so we have
@@ -1518,6 +1879,79 @@ def InterpBinnedArray(binnedarray, fill_value = 0.0):
 		return lambda *coords: float(interp(*coords))
 
 
+class InterpBinnedArrayTable(object):
+	"""
+	A vectorized piece-wise linear interpolator for the contents of a
+	BinnedArray.  The grid of co-ordinates and values used by
+	InterpBinnedArray() is pre-computed once, and the interpolator
+	evaluates the multi-linear interpolant on that regular grid at
+	arrays of co-ordinates, returning an array of values.  The
+	interpolant is multi-linear within each grid cell.  In one and
+	two dimensions this is the same interpolant as
+	InterpBinnedArray()'s (interp1d and bilinear interp2d).  In three
+	and more dimensions InterpBinnedArray() is linear on a Delaunay
+	triangulation of the grid instead, and the two agree only at the
+	grid points and along the grid lines, so callers that must
+	reproduce InterpBinnedArray() should use this only in one or two
+	dimensions.  Points outside the grid are assigned fill_value.
+
+	The two also differ where infinite values are involved.  If any
+	of the grid values contributing to a point is -inf, the result
+	here is -inf, but scipy's interpolators generally give nan for
+	such points because they compute -inf - -inf or -inf + inf.
+	This affects the outer half-bins when fill_value is -inf (as is
+	done for ln PDFs) and the cells next to bins holding -inf (e.g.,
+	the logarithm of a 0 bin).  Everywhere else the results agree.
+
+	Example:
+
+	>>> x = BinnedArray(NDBins((LinearBins(-0.5, 2.5, 3),)))
+	>>> x[0,] = 0
+	>>> x[1,] = 1
+	>>> x[2,] = 3
+	>>> y = InterpBinnedArrayTable(x)
+	>>> y(numpy.array([0., 0.5, 1., 1.5, 2.]))
+	array([ 0. ,  0.5,  1. ,  2. ,  3. ])
+	"""
+	def __init__(self, binnedarray, fill_value = 0.0):
+		self.coords, self.z = _interp_grid(binnedarray, fill_value)
+		self.fill_value = fill_value
+
+	def __call__(self, *coords):
+		if len(coords) != len(self.coords):
+			raise ValueError("require %d co-ordinate arrays, got %d" % (len(self.coords), len(coords)))
+		coords = numpy.broadcast_arrays(*(numpy.asarray(x, dtype = "double") for x in coords))
+		shape = coords[0].shape
+		coords = [x.ravel() for x in coords]
+		n = len(coords[0])
+
+		# for each dimension find the grid cell containing each
+		# point and the fractional position within it
+		inside = numpy.ones((n,), dtype = "bool")
+		indexes = []
+		fractions = []
+		for x, c in zip(coords, self.coords):
+			inside &= (c[0] <= x) & (x <= c[-1])
+			i = numpy.clip(c.searchsorted(x, side = "right") - 1, 0, len(c) - 2)
+			with numpy.errstate(invalid = "ignore"):
+				fractions.append((x - c[i]) / (c[i + 1] - c[i]))
+			indexes.append(i)
+
+		# sum the contributions from the corners of the cells.
+		# corners with zero weight are skipped so that infinite
+		# values at them do not contribute
+		result = numpy.zeros((n,), dtype = "double")
+		for corner in itertools.product((0, 1), repeat = len(self.coords)):
+			weight = numpy.ones((n,), dtype = "double")
+			for offset, t in zip(corner, fractions):
+				weight *= t if offset else 1. - t
+			z = self.z[tuple(i + offset for i, offset in zip(indexes, corner))]
+			nonzero = weight != 0.
+			result[nonzero] += weight[nonzero] * z[nonzero]
+		result[~inside] = self.fill_value
+		return result.reshape(shape)
+
+
 #
 # =============================================================================
 #
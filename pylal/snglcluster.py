@@ -135,3 +135,48 @@ def cluster_events(events, testfunc, clusterfunc, sortfunc = None, bailoutfunc =
 		iterutils.inplace_filter(lambda event: event is not None, events)
 		changed = True
 	return changed
+
+
+def cluster_events_by_time(events, timefunc, window, clusterfunc, verbose = False):
+	"""
+	Cluster time-ordered events in a single sweep.  This is a generator
+	that yields the clusters in time order.  events can be any iterable
+	of events sorted in increasing order of timefunc(event), for
+	example a generator reading rows from a large table;  only the
+	cluster being built is held in memory.  ValueError is raised if an
+	event is found out of order.
+
+	Each event is compared with the current cluster, and if the
+	magnitude of the difference of their times is less than window,
+	clusterfunc(cluster, event) is called and must return the new
+	cluster (for example, the louder of the two, or a merger of them).
+	Otherwise the cluster is complete, is yielded, and the event starts
+	a new one.
+
+	If the time of a cluster always lies within the span of the times
+	of the events it was built from (true for keep-the-loudest and for
+	averaging), the result is the same as that of cluster_events() with
+	a testfunc that returns 0 for events within window of each other,
+	the same clusterfunc, and the events sorted by time, but in a single
+	O(n) pass.
+	"""
+	cluster = None
+	for n, event in enumerate(events):
+		if verbose and not (n % 1000):
+			print >>sys.stderr, "\t%d events\r" % n,
+		t = timefunc(event)
+		if cluster is None:
+			cluster, cluster_t = event, t
+		elif t < last_t:
+			raise ValueError("events not in time order: %s after %s" % (str(t), str(last_t)))
+		elif abs(t - cluster_t) < window:
+			cluster = clusterfunc(cluster, event)
+			cluster_t = timefunc(cluster)
+		else:
+			yield cluster
+			cluster, cluster_t = event, t
+		last_t = t
+	if verbose:
+		print >>sys.stderr, "\tclustering complete"
+	if cluster is not None:
+		yield cluster
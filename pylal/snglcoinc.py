@@ -31,6 +31,7 @@ Light Weight XML documents.
 
 
 import bisect
+import collections
 try:
 	from fpconst import NaN, NegInf, PosInf
 except ImportError:
@@ -41,8 +42,10 @@ except ImportError:
 	PosInf = float("+inf")
 import itertools
 import math
+import multiprocessing
 import numpy
 import random
+import resource
 from scipy.constants import c as speed_of_light
 import scipy.optimize
 import sys
@@ -55,9 +58,11 @@ from glue import offsetvector
 from glue import segmentsUtils
 from glue.ligolw import ligolw
 from glue.ligolw import array as ligolw_array
+from glue.ligolw import dbtables
 from glue.ligolw import param as ligolw_param
 from glue.ligolw import table as ligolw_table
 from glue.ligolw import lsctables
+from glue.ligolw import types as ligolwtypes
 from glue.text_progress_bar import ProgressBar
 from pylal import git_version
 from pylal import inject
@@ -153,6 +158,160 @@ class EventList(list):
 		raise NotImplementedError
 
 
+class ColumnarEventList(EventList):
+	"""
+	A version of the EventList class that, in addition to the list of
+	event objects, maintains a time-ordered numpy array of the event
+	times as integer nanoseconds and a dictionary of numpy arrays of
+	any other event properties required by the coincidence test.  The
+	arrays allow the complete set of candidate pairs of events between
+	two lists to be identified for an offset vector with a single
+	searchsorted() pass instead of one bisection search (and
+	LIGOTimeGPS arithmetic) per event.
+
+	To be useful, this class must be subclassed with overrides provided
+	for the event_time_ns() and make_columns() methods, and the
+	subclass must call .set_dt() to set the coincidence window before
+	coincidences are constructed.  The coincidence test can be
+	vectorized by providing a comparison function that carries a
+	batched form of itself (see .compare_pairs()).
+	"""
+	# number of events from the other list whose candidate partners
+	# are examined at once by .get_coinc_pairs().  bounds the size of
+	# the temporary index arrays
+	block_size = 1 << 16
+
+	def __init__(self, instrument):
+		EventList.__init__(self, instrument)
+		self.offset_ns = 0
+		self.dt_ns = 0
+		self.time_ns = numpy.empty((0,), dtype = "int64")
+		self.columns = {}
+
+	@staticmethod
+	def event_time_ns(event):
+		"""
+		Return the time of event as an integer count of
+		nanoseconds.  Must be overridden in a subclass.
+		"""
+		raise NotImplementedError
+
+	def make_columns(self):
+		"""
+		Return a dictionary mapping column name to a numpy array of
+		the values of that property for the events in this list, in
+		the order in which they appear in the list.  Called by
+		.make_index() after the events have been sorted.  The
+		default implementation returns an empty dictionary.
+		"""
+		return {}
+
+	def make_index(self):
+		"""
+		Sort the events by time, and build the array of event
+		times and the dictionary of event property arrays.  Must be
+		called again if the list is modified.
+		"""
+		self.sort(key = self.event_time_ns)
+		self.time_ns = numpy.fromiter((self.event_time_ns(event) for event in self), dtype = "int64", count = len(self))
+		self.columns = self.make_columns()
+
+	def set_offset(self, offset):
+		EventList.set_offset(self, offset)
+		self.offset_ns = self.offset.ns()
+
+	def set_dt(self, dt):
+		"""
+		If an event's time differs by more than this many seconds
+		from the time of another event then it is *impossible* for
+		them to be coincident.
+		"""
+		self.dt_ns = lsctables.LIGOTimeGPS(dt).ns()
+
+	def get_coincs(self, event_a, offset_a, light_travel_time, threshold, comparefunc):
+		# event_a's time, with time shift applied, in this list's
+		# frame
+		t = self.event_time_ns(event_a) + lsctables.LIGOTimeGPS(offset_a).ns() - self.offset_ns
+		lo = self.time_ns.searchsorted(t - self.dt_ns, side = "left")
+		hi = self.time_ns.searchsorted(t + self.dt_ns, side = "right")
+		return [event_b for event_b in self[lo:hi] if not comparefunc(event_a, offset_a, event_b, self.offset, light_travel_time, threshold)]
+
+	def candidate_bounds(self, eventlist_a, start = 0, stop = None):
+		"""
+		Return a pair of integer arrays, (lo, hi), such that for
+		each i the candidate partners of eventlist_a[start + i] are
+		self[lo[i]:hi[i]], the events separated from it in time by
+		no more than the coincidence window once the offsets
+		carried by the two lists have been applied.  Subclasses
+		that order their events differently override this.
+		"""
+		t = eventlist_a.time_ns[start:stop] + (eventlist_a.offset_ns - self.offset_ns)
+		lo = self.time_ns.searchsorted(t - self.dt_ns, side = "left")
+		hi = self.time_ns.searchsorted(t + self.dt_ns, side = "right")
+		return lo, hi
+
+	def candidate_pairs(self, eventlist_a, start = 0, stop = None):
+		"""
+		Return a pair of integer arrays, (ia, ib), such that for
+		each i eventlist_a[ia[i]] and self[ib[i]] are separated in
+		time by no more than the coincidence window once the
+		offsets carried by the two lists have been applied.
+		eventlist_a must also be a ColumnarEventList.  Only the
+		events eventlist_a[start:stop] are considered.  The pairs
+		are ordered by ia, then by ib.
+		"""
+		lo, hi = self.candidate_bounds(eventlist_a, start, stop)
+		counts = hi - lo
+		ia = numpy.repeat(numpy.arange(start, start + len(lo)), counts)
+		# position of each candidate within its event's window,
+		# plus the start of the window
+		ib = numpy.arange(len(ia)) - numpy.repeat(counts.cumsum() - counts, counts) + numpy.repeat(lo, counts)
+		return ia, ib
+
+	def compare_pairs(self, eventlist_a, ia, ib, light_travel_time, threshold, comparefunc):
+		"""
+		Return a boolean array that is True for each of the pairs
+		of events (eventlist_a[ia[i]], self[ib[i]]) that are
+		coincident.
+
+		If comparefunc has a .batched attribute, it is assumed to
+		be a vectorized form of the comparison function whose
+		signature is
+
+		>>> comparefunc.batched(eventlist_a, ia, eventlist_b, ib, light_travel_time, threshold)
+
+		where eventlist_b is this list, and which returns a boolean
+		array that is True for the pairs that are *not* coincident
+		(the same sense as comparefunc itself).  Otherwise
+		comparefunc is called for each pair of event objects.
+		"""
+		batched = getattr(comparefunc, "batched", None)
+		if batched is not None:
+			return ~batched(eventlist_a, ia, self, ib, light_travel_time, threshold)
+		offset_a = eventlist_a.offset
+		offset_b = self.offset
+		return numpy.fromiter((not comparefunc(eventlist_a[i], offset_a, self[j], offset_b, light_travel_time, threshold) for i, j in itertools.izip(ia, ib)), dtype = "bool", count = len(ia))
+
+	def get_coinc_pairs(self, eventlist_a, light_travel_time, threshold, comparefunc, verbose = False):
+		"""
+		Generator yielding (event_a, event_b) tuples of coincident
+		events, where event_a is drawn from eventlist_a and event_b
+		is drawn from this list.  The sequence is the same as would
+		be obtained by calling .get_coincs() for each event in
+		eventlist_a in order.
+		"""
+		length = len(eventlist_a)
+		for start in xrange(0, length, self.block_size):
+			if verbose:
+				print >>sys.stderr, "\t%.1f%%\r" % (100.0 * start / length),
+			ia, ib = self.candidate_pairs(eventlist_a, start, start + self.block_size)
+			coincident = self.compare_pairs(eventlist_a, ia, ib, light_travel_time, threshold, comparefunc)
+			for i, j in itertools.izip(ia[coincident], ib[coincident]):
+				yield eventlist_a[i], self[j]
+		if verbose:
+			print >>sys.stderr, "\t100.0%"
+
+
 class EventListDict(dict):
 	"""
 	A dictionary of EventList objects, indexed by instrument,
@@ -299,6 +458,14 @@ def get_doubles(eventlists, comparefunc, instruments, thresholds, verbose = Fals
 		raise KeyError("no coincidence thresholds provided for instrument pair %s, %s" % e.args[0])
 	light_travel_time = inject.light_travel_time(eventlista.instrument, eventlistb.instrument)
 
+	# if both lists carry columnar indexes, search for all candidate
+	# pairs at once
+
+	if isinstance(eventlista, ColumnarEventList) and isinstance(eventlistb, ColumnarEventList):
+		for pair in eventlistb.get_coinc_pairs(eventlista, light_travel_time, threshold_data, comparefunc, verbose = verbose):
+			yield pair
+		return
+
 	# for each event in the shortest list
 
 	for n, eventa in enumerate(eventlista):
@@ -333,10 +500,20 @@ class TimeSlideGraphNode(object):
 		self.components = None
 		self.coincs = None
 		self.unused_coincs = set()
+		# number of nodes constructed from this one
+		self.consumers = 0
 
 	def name(self):
 		return self.offset_vector.__str__(compact = True)
 
+	def make_leaf_coincs(self, pairs):
+		"""
+		From a sequence of pairs of event IDs, each pair ordered
+		alphabetically by instrument name, construct the object to
+		be stored as the coincs of a leaf node.
+		"""
+		return tuple(sorted(pairs))
+
 	def get_coincs(self, eventlists, event_comparefunc, thresholds, verbose = False):
 		#
 		# has this node already been visited?  if so, return the
@@ -365,7 +542,7 @@ class TimeSlideGraphNode(object):
 			if not offset_instruments.issubset(avail_instruments):
 				if verbose:
 					print >>sys.stderr, "\twarning: do not have data for instrument(s) %s ... assuming 0 coincs" % ", ".join(offset_instruments - avail_instruments)
-				self.coincs = tuple()
+				self.coincs = self.make_leaf_coincs(())
 				return self.coincs
 
 			#
@@ -391,7 +568,7 @@ class TimeSlideGraphNode(object):
 			# tuple returned by get_doubles() is arbitrary so
 			# we need to sort each tuple by instrument name
 			# explicitly
-			self.coincs = tuple(sorted((a.event_id, b.event_id) if a.ifo <= b.ifo else (b.event_id, a.event_id) for (a, b) in get_doubles(eventlists, event_comparefunc, offset_instruments, thresholds, verbose = verbose)))
+			self.coincs = self.make_leaf_coincs((a.event_id, b.event_id) if a.ifo <= b.ifo else (b.event_id, a.event_id) for (a, b) in get_doubles(eventlists, event_comparefunc, offset_instruments, thresholds, verbose = verbose))
 			return self.coincs
 
 		#
@@ -523,8 +700,222 @@ class TimeSlideGraphNode(object):
 		return self.coincs
 
 
+#
+# row-wise set operations on 2-D integer arrays, used by the memory-bounded
+# time slide graph
+#
+
+
+def _sort_rows(rows):
+	"""
+	Return a copy of the 2-D array rows with its rows sorted
+	lexicographically.
+	"""
+	return rows[numpy.lexsort(rows.T[::-1])]
+
+
+def _row_ranks(*arrays):
+	"""
+	Given 2-D arrays with the same number of columns, return a list of
+	1-D arrays, one for each input, giving the rank of each row in the
+	lexicographic ordering of the rows of all the arrays together.
+	Equal rows are assigned equal ranks.
+	"""
+	rows = numpy.vstack(arrays)
+	order = numpy.lexsort(rows.T[::-1])
+	rows = rows[order]
+	new = numpy.ones((len(rows),), dtype = "bool")
+	new[1:] = (rows[1:] != rows[:-1]).any(axis = 1)
+	ranks = numpy.empty((len(rows),), dtype = "intp")
+	ranks[order] = new.cumsum() - 1
+	return numpy.split(ranks, numpy.cumsum([len(array) for array in arrays])[:-1])
+
+
+def _union_rows(a, b):
+	ranks = numpy.concatenate(_row_ranks(a, b))
+	ranks, indexes = numpy.unique(ranks, return_index = True)
+	return numpy.vstack((a, b))[indexes]
+
+
+def _intersect_rows(a, b):
+	ranksa, ranksb = _row_ranks(a, b)
+	return a[numpy.in1d(ranksa, ranksb)]
+
+
+def _difference_rows(a, b):
+	ranksa, ranksb = _row_ranks(a, b)
+	return a[~numpy.in1d(ranksa, ranksb)]
+
+
+class CompactTimeSlideGraphNode(TimeSlideGraphNode):
+	"""
+	A version of TimeSlideGraphNode for use in the memory-bounded mode
+	of TimeSlideGraph.  The coincs are stored as a 2-D array of integer
+	event IDs, one row per coinc, with the columns ordered
+	alphabetically by instrument name and the rows sorted.  The unused
+	coincs are stored as a dictionary mapping the (sorted) tuple of
+	instruments participating in the coincs to a similar array.  A node
+	releases its coincs once all the nodes that are constructed from it
+	have been constructed.
+	"""
+	def __init__(self, offset_vector, time_slide_id = None):
+		TimeSlideGraphNode.__init__(self, offset_vector, time_slide_id = time_slide_id)
+		self.instruments = tuple(sorted(offset_vector))
+		self.unused_coincs = {}
+		self.released = False
+
+	def make_leaf_coincs(self, pairs):
+		coincs = numpy.array([(int(a), int(b)) for a, b in pairs], dtype = "int64").reshape((-1, 2))
+		return _sort_rows(coincs)
+
+	def release(self):
+		"""
+		Discard the coincs.  The node cannot be used after this.
+		"""
+		self.coincs = None
+		self.unused_coincs = {}
+		self.released = True
+
+	def consumed(self):
+		"""
+		Called by each node constructed from this one once it has
+		been constructed.  After the last such call the coincs are
+		released.
+		"""
+		self.consumers -= 1
+		if self.consumers <= 0:
+			self.release()
+
+	@property
+	def nbytes(self):
+		"""
+		Number of bytes occupied by the coinc arrays.
+		"""
+		return (self.coincs.nbytes if self.coincs is not None else 0) + sum(coincs.nbytes for coincs in self.unused_coincs.values())
+
+	def get_coincs(self, eventlists, event_comparefunc, thresholds, verbose = False):
+		if self.released:
+			raise ValueError("coincs for %s have been released" % str(self.offset_vector))
+
+		#
+		# leaf nodes, head nodes, and nodes that have already been
+		# visited are handled by the parent class
+		#
+
+		if self.coincs is not None or self.components is None or len(self.components) == 1:
+			components = self.components
+			coincs = TimeSlideGraphNode.get_coincs(self, eventlists, event_comparefunc, thresholds, verbose = verbose)
+			for component in components or ():
+				component.consumed()
+			return coincs
+
+		#
+		# this is a regular node in the graph.  the coincidence
+		# synthesis algorithm is the same as in the parent class,
+		# but is applied to all coincs at once
+		#
+
+		assert len(self.components) > 2
+		for component in self.components:
+			component.get_coincs(eventlists, event_comparefunc, thresholds, verbose = verbose)
+
+		# all coincs with n-1 instruments from the component time
+		# slides are potentially unused, as are the coincs with
+		# fewer instruments left unused by any two components (see
+		# TimeSlideGraphNode.get_coincs())
+		unused = {}
+		def merge(d):
+			for key, coincs in d.items():
+				unused[key] = _union_rows(unused[key], coincs) if key in unused else coincs
+		for component in self.components:
+			merge({component.instruments: component.coincs})
+		for componenta, componentb in iterutils.choices(self.components, 2):
+			merge(dict((key, _intersect_rows(componenta.unused_coincs[key], componentb.unused_coincs[key])) for key in set(componenta.unused_coincs) & set(componentb.unused_coincs)))
+
+		if verbose:
+			print >>sys.stderr, "\tassembling %s ..." % str(self.offset_vector)
+		allcoincs0 = self.components[0].coincs
+		allcoincs1 = self.components[1].coincs
+		allcoincs2 = self.components[-1].coincs
+		# pair each coinc in list 0 with each coinc in list 1 whose
+		# first (n-2) event IDs are the same as the first (n-2)
+		# event IDs in the coinc from list 0.  list 1 is sorted, so
+		# the ranks of its (n-2)-ID prefixes are non-decreasing and
+		# the matching coincs for each coinc in list 0 are
+		# identified with two searches
+		ranks0, ranks1 = _row_ranks(allcoincs0[:, :-1], allcoincs1[:, :-1])
+		lo = ranks1.searchsorted(ranks0, side = "left")
+		hi = ranks1.searchsorted(ranks0, side = "right")
+		counts = hi - lo
+		i0 = numpy.repeat(numpy.arange(len(allcoincs0)), counts)
+		i1 = numpy.arange(len(i0)) - numpy.repeat(counts.cumsum() - counts, counts) + numpy.repeat(lo, counts)
+		# each pair identifies a unique potential n-instrument coinc,
+		# which is confirmed if its last (n-1) event IDs are found
+		# in list 2.  the candidates are generated in sorted order
+		candidates = numpy.hstack((allcoincs0[i0], allcoincs1[i1, -1:]))
+		ranks_candidates, ranks2 = _row_ranks(candidates[:, 1:], allcoincs2)
+		self.coincs = candidates[numpy.in1d(ranks_candidates, ranks2)]
+
+		# remove the (n-1)-instrument components of the new coincs
+		# from the unused pile
+		for n in range(len(self.instruments)):
+			key = self.instruments[:n] + self.instruments[n + 1:]
+			if key in unused:
+				unused[key] = _difference_rows(unused[key], numpy.delete(self.coincs, n, axis = 1))
+		self.unused_coincs = unused
+
+		#
+		# done.  unlink the graph, and release the components'
+		# coincs if nothing else needs them
+		#
+
+		components, self.components = self.components, None
+		for component in components:
+			component.consumed()
+		return self.coincs
+
+
+#
+# state shared with the worker processes used to construct leaf nodes in
+# parallel.  it is set in the parent before the worker pool is created, so
+# that the workers inherit it when they are forked and the event lists are
+# shared with the parent (copy-on-write) rather than pickled and sent to
+# each worker
+#
+
+
+_leaf_worker_state = None
+
+
+def _leaf_worker(n):
+	"""
+	For internal use by TimeSlideGraph.get_leaf_coincs().  Construct
+	the coincs for the n-th leaf node, and return them as an array of
+	pairs of positions of the events in their event lists, with the
+	columns ordered alphabetically by instrument name.
+	"""
+	eventlists, event_comparefunc, thresholds, leaves, positions = _leaf_worker_state
+	offset_vector = leaves[n].offset_vector
+	instrumenta, instrumentb = sorted(offset_vector)
+	eventlists.offsetvector = offset_vector
+	positionsa = positions[instrumenta]
+	positionsb = positions[instrumentb]
+	pairs = [(positionsa[id(a)], positionsb[id(b)]) if a.ifo <= b.ifo else (positionsa[id(b)], positionsb[id(a)]) for (a, b) in get_doubles(eventlists, event_comparefunc, offset_vector, thresholds)]
+	return numpy.array(pairs, dtype = "intp").reshape((len(pairs), 2))
+
+
 class TimeSlideGraph(object):
-	def __init__(self, offset_vector_dict, verbose = False):
+	def __init__(self, offset_vector_dict, verbose = False, low_memory = False):
+		"""
+		Construct the coincidence assembly graph for the target
+		offset vectors in offset_vector_dict.  If low_memory is
+		True, the graph's nodes store their coincs as compact
+		integer arrays and discard them as soon as every node
+		that is constructed from them has been constructed (see
+		CompactTimeSlideGraphNode), bounding the memory required
+		to the coincs of the nodes that are still needed.  The
+		output of .get_coincs() is the same in either case.
+		"""
 		#
 		# validate input
 		#
@@ -539,7 +930,12 @@ class TimeSlideGraph(object):
 
 		if verbose:
 			print >>sys.stderr, "constructing coincidence assembly graph for %d target offset vectors ..." % len(offset_vector_dict)
-		self.head = tuple(TimeSlideGraphNode(offset_vector, time_slide_id) for time_slide_id, offset_vector in sorted(offset_vector_dict.items()))
+		self.low_memory = low_memory
+		if low_memory:
+			node_type = CompactTimeSlideGraphNode
+		else:
+			node_type = TimeSlideGraphNode
+		self.head = tuple(node_type(offset_vector, time_slide_id) for time_slide_id, offset_vector in sorted(offset_vector_dict.items()))
 
 		#
 		# populate the graph generations.  generations[n] is a
@@ -551,7 +947,7 @@ class TimeSlideGraph(object):
 
 		self.generations = {}
 		n = max(len(offset_vector) for offset_vector in offset_vector_dict.values())
-		self.generations[n] = tuple(TimeSlideGraphNode(offset_vector) for offset_vector in offsetvector.component_offsetvectors((node.offset_vector for node in self.head if len(node.offset_vector) == n), n))
+		self.generations[n] = tuple(node_type(offset_vector) for offset_vector in offsetvector.component_offsetvectors((node.offset_vector for node in self.head if len(node.offset_vector) == n), n))
 		for n in range(n, 2, -1):	# [n, n-1, ..., 3]
 			#
 			# collect all offset vectors of length n that we
@@ -568,7 +964,7 @@ class TimeSlideGraph(object):
 			# as the n-1'st generation
 			#
 
-			self.generations[n - 1] = tuple(TimeSlideGraphNode(offset_vector) for offset_vector in offsetvector.component_offsetvectors(offset_vectors, n - 1))
+			self.generations[n - 1] = tuple(node_type(offset_vector) for offset_vector in offsetvector.component_offsetvectors(offset_vectors, n - 1))
 
 		#
 		# link each n-instrument node to the n-1 instrument nodes
@@ -601,6 +997,16 @@ class TimeSlideGraph(object):
 				component_deltas = set(frozenset(offset_vector.deltas.items()) for offset_vector in offsetvector.component_offsetvectors([node.offset_vector], n - 1))
 				node.components = tuple(sorted((component for component in self.generations[n - 1] if component.deltas in component_deltas), key = lambda x: sorted(x.offset_vector)))
 
+		#
+		# count the number of nodes constructed from each node so
+		# that, in low memory mode, each node knows when its coincs
+		# are no longer needed
+		#
+
+		for node in itertools.chain(self.head, *self.generations.values()):
+			for component in node.components or ():
+				component.consumers += 1
+
 		#
 		# done
 		#
@@ -612,12 +1018,102 @@ class TimeSlideGraph(object):
 			print >>sys.stderr, "\t%d offset vectors total" % sum(len(self.generations[n]) for n in self.generations)
 
 
-	def get_coincs(self, eventlists, event_comparefunc, thresholds, include_small_coincs = True, verbose = False):
+	def get_leaf_coincs(self, eventlists, event_comparefunc, thresholds, nprocs, verbose = False):
+		"""
+		Construct the coincs for all of the 2-instrument (leaf)
+		nodes of the graph using a pool of nprocs worker
+		processes.  Each leaf is an independent double-coincidence
+		search.  The workers are forked from this process and so
+		share the event lists with it, read-only;  the coincs are
+		returned to this process, which records them in the leaf
+		nodes exactly as .get_coincs() would have.  After this, the
+		higher-order nodes are assembled by .get_coincs() in this
+		process as usual.
+
+		NOTE:  relies on the worker processes being created by
+		fork(), as they are on Unix-like systems.
+		"""
+		global _leaf_worker_state
+
+		avail_instruments = set(eventlists)
+		leaves = []
+		for node in self.generations.get(2, ()):
+			if node.coincs is not None:
+				continue
+			if not set(node.offset_vector).issubset(avail_instruments):
+				if verbose:
+					print >>sys.stderr, "\twarning: do not have data for instrument(s) %s ... assuming 0 coincs" % ", ".join(set(node.offset_vector) - avail_instruments)
+				node.coincs = node.make_leaf_coincs(())
+				continue
+			leaves.append(node)
+		if not leaves:
+			return
+
+		if verbose:
+			print >>sys.stderr, "constructing %d 2-instrument offset vectors using %d processes ..." % (len(leaves), nprocs)
+		positions = dict((instrument, dict((id(event), n) for n, event in enumerate(eventlist))) for instrument, eventlist in eventlists.items())
+		_leaf_worker_state = eventlists, event_comparefunc, thresholds, leaves, positions
+		pool = multiprocessing.Pool(nprocs)
+		try:
+			for n, (node, pairs) in enumerate(itertools.izip(leaves, pool.imap(_leaf_worker, range(len(leaves)))), start = 1):
+				if verbose:
+					print >>sys.stderr, "\t%d/%d: %s" % (n, len(leaves), str(node.offset_vector))
+				eventlista, eventlistb = [eventlists[instrument] for instrument in sorted(node.offset_vector)]
+				node.coincs = node.make_leaf_coincs((eventlista[i].event_id, eventlistb[j].event_id) for i, j in pairs)
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+			_leaf_worker_state = None
+
+	def get_coincs(self, eventlists, event_comparefunc, thresholds, include_small_coincs = True, verbose = False, nprocs = 1):
+		"""
+		Generator yielding (node, coinc) tuples, where coinc is a
+		tuple of event IDs ordered alphabetically by instrument,
+		for each target offset vector in the graph.  If nprocs is
+		greater than 1, the 2-instrument nodes are constructed in
+		parallel by a pool of that many worker processes (see
+		.get_leaf_coincs()), otherwise everything is done in this
+		process.
+
+		In low memory mode the coincs of each target offset vector
+		are released after they have been yielded, and if verbose
+		is True the peak memory use of the process and the memory
+		occupied by the coincs still held by the graph are
+		reported after each target.
+		"""
+		if nprocs > 1:
+			self.get_leaf_coincs(eventlists, event_comparefunc, thresholds, nprocs, verbose = verbose)
+		if self.low_memory:
+			# map the integer event IDs stored in the graph
+			# back to the event ID objects
+			event_ids = dict((int(event.event_id), event.event_id) for eventlist in eventlists.values() for event in eventlist)
 		if verbose:
 			print >>sys.stderr, "constructing coincs for target offset vectors ..."
 		for n, node in enumerate(self.head, start = 1):
 			if verbose:
 				print >>sys.stderr, "%d/%d: %s" % (n, len(self.head), str(node.offset_vector))
+			if self.low_memory:
+				coincs = node.get_coincs(eventlists, event_comparefunc, thresholds, verbose)
+				if include_small_coincs:
+					# note that unused_coincs must be
+					# retrieved after the call to
+					# .get_coincs() because the former
+					# is computed as a side effect of
+					# the latter
+					arrays = [coincs] + [node.unused_coincs[key] for key in sorted(node.unused_coincs)]
+				else:
+					arrays = [coincs]
+				node.release()
+				for coincs in arrays:
+					for coinc in coincs.tolist():
+						yield node, tuple(event_ids[event_id] for event_id in coinc)
+				del arrays, coincs
+				if verbose:
+					print >>sys.stderr, "\tmemory:  %d bytes of coincs held by graph, peak resident set size %d kB" % (self.nbytes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+				continue
 			if include_small_coincs:
 				# note that unused_coincs must be retrieved
 				# after the call to .get_coincs() because
@@ -629,6 +1125,14 @@ class TimeSlideGraph(object):
 			for coinc in iterator:
 				yield node, coinc
 
+	@property
+	def nbytes(self):
+		"""
+		In low memory mode, the number of bytes occupied by the
+		coinc arrays held by the nodes of the graph.
+		"""
+		return sum(node.nbytes for node in itertools.chain(self.head, *self.generations.values()))
+
 
 	def write(self, fileobj):
 		"""
@@ -648,6 +1152,172 @@ class TimeSlideGraph(object):
 		print >>fileobj, "}"
 
 
+class TimeSlideSweep(object):
+	"""
+	An alternative to the TimeSlideGraph coincidence engine.  For each
+	target offset vector, the events from all instruments are merged
+	into a single time-ordered stream (with the offsets applied) and
+	the coincidences of all orders are assembled in one sweep over
+	the stream.  The sweep holds, in a ring buffer for each
+	instrument, only the events that are within the coincidence
+	window of the current event, and so at any time only the partial
+	coincs involving those events are held in memory.  The coincs
+	produced are identical to those produced by TimeSlideGraph, but
+	not necessarily in the same order.
+
+	The event lists must be instances of ColumnarEventList.  The
+	double coincidence test is applied to all candidate pairs of
+	events for each pair of instruments at once (see
+	ColumnarEventList.compare_pairs()).
+	"""
+	def __init__(self, offset_vector_dict, verbose = False):
+		if min(len(offset_vector) for offset_vector in offset_vector_dict.values()) < 2:
+			raise ValueError("offset vectors must have at least two instruments")
+		# nodes providing the same .offset_vector and
+		# .time_slide_id attributes as the head nodes of a
+		# TimeSlideGraph
+		self.head = tuple(TimeSlideGraphNode(offset_vector, time_slide_id) for time_slide_id, offset_vector in sorted(offset_vector_dict.items()))
+		if verbose:
+			print >>sys.stderr, "%d target offset vectors to be constructed by time-ordered sweep" % len(self.head)
+
+	@staticmethod
+	def get_coinc_pairs(eventlists, event_comparefunc, instruments, thresholds):
+		"""
+		Return a pair of integer arrays giving the positions in
+		their respective event lists of the events in each pair
+		of coincident events from the two instruments.  The pairs
+		are found and tested exactly as get_doubles() does, using
+		the offsets currently carried by the event lists.
+		"""
+		eventlista, eventlistb = [eventlists[instrument] for instrument in instruments]
+		swap = len(eventlista) > len(eventlistb)
+		if swap:
+			eventlista, eventlistb = eventlistb, eventlista
+		try:
+			threshold_data = thresholds[(eventlista.instrument, eventlistb.instrument)]
+		except KeyError as e:
+			raise KeyError("no coincidence thresholds provided for instrument pair %s, %s" % e.args[0])
+		light_travel_time = inject.light_travel_time(eventlista.instrument, eventlistb.instrument)
+		ias = []
+		ibs = []
+		for start in range(0, len(eventlista), eventlistb.block_size):
+			ia, ib = eventlistb.candidate_pairs(eventlista, start = start, stop = start + eventlistb.block_size)
+			coincident = eventlistb.compare_pairs(eventlista, ia, ib, light_travel_time, threshold_data, event_comparefunc)
+			ias.append(ia[coincident])
+			ibs.append(ib[coincident])
+		ia = numpy.concatenate(ias) if ias else numpy.empty((0,), dtype = "intp")
+		ib = numpy.concatenate(ibs) if ibs else numpy.empty((0,), dtype = "intp")
+		if swap:
+			return ib, ia
+		return ia, ib
+
+	def sweep(self, eventlists, event_comparefunc, thresholds, offset_vector, include_small_coincs = True):
+		"""
+		Generator yielding the coincs for one offset vector, each
+		a tuple of event IDs ordered alphabetically by instrument.
+		"""
+		instruments = tuple(sorted(instrument for instrument in offset_vector if instrument in eventlists))
+		for instrument in instruments:
+			if not isinstance(eventlists[instrument], ColumnarEventList):
+				raise TypeError("%s event list is not a ColumnarEventList" % instrument)
+		if len(instruments) < 2 or (not include_small_coincs and len(instruments) < len(offset_vector)):
+			return
+		eventlists.offsetvector = offsetvector.offsetvector((instrument, offset_vector[instrument]) for instrument in instruments)
+
+		#
+		# merge the events into a single time-ordered stream.
+		# events are identified by their position in the
+		# concatenation of the event lists
+		#
+
+		base = dict(zip(instruments, numpy.cumsum([0] + [len(eventlists[instrument]) for instrument in instruments[:-1]])))
+		times = numpy.concatenate([eventlists[instrument].time_ns + eventlists[instrument].offset_ns for instrument in instruments])
+		order = times.argsort(kind = "mergesort")
+		rank = numpy.empty_like(order)
+		rank[order] = numpy.arange(len(order))
+		# no event can be coincident with an event more than this
+		# far from it in time
+		window = max(eventlists[instrument].dt_ns for instrument in instruments)
+
+		#
+		# find the coincident pairs, and for each event record the
+		# events coincident with it that precede it in the stream
+		#
+
+		earlier = collections.defaultdict(set)
+		for instrumenta, instrumentb in iterutils.choices(instruments, 2):
+			ia, ib = self.get_coinc_pairs(eventlists, event_comparefunc, (instrumenta, instrumentb), thresholds)
+			ia = ia + base[instrumenta]
+			ib = ib + base[instrumentb]
+			later = rank[ia] > rank[ib]
+			for x, y in itertools.izip(numpy.where(later, ia, ib).tolist(), numpy.where(later, ib, ia).tolist()):
+				earlier[x].add(y)
+
+		#
+		# sweep.  partial[x] is the list of coincs whose last event
+		# in the stream is x (including the single event x).
+		# every coinc ending at event y is either the single event
+		# or a coinc ending at an earlier event x coincident with y
+		# whose events are all coincident with y, so each coinc is
+		# constructed exactly once.  coincs contained in larger
+		# coincs are recorded in used, and only those that are not
+		# are reported.  an event's coincs are complete once the
+		# sweep has moved beyond the window from it
+		#
+
+		instrument_of = numpy.repeat(numpy.arange(len(instruments)), [len(eventlists[instrument]) for instrument in instruments])
+		events = [event for instrument in instruments for event in eventlists[instrument]]
+		n = len(offset_vector)
+		partial = {}
+		used = set()
+		buffers = [collections.deque() for instrument in instruments]
+
+		def finish(x):
+			for coinc in partial.pop(x):
+				if coinc in used:
+					used.remove(coinc)
+				elif len(coinc) > 1 and (include_small_coincs or len(coinc) == n):
+					yield tuple(events[y].event_id for y in sorted(coinc, key = lambda y: instrument_of[y]))
+
+		times = times.tolist()
+		for y in order.tolist():
+			t = times[y]
+			for buf in buffers:
+				while buf and buf[0][0] < t - window:
+					for coinc in finish(buf.popleft()[1]):
+						yield coinc
+			neighbours = earlier.pop(y, ())
+			coincs = [(y,)]
+			for x in sorted(neighbours, key = lambda x: rank[x]):
+				for coinc in partial[x]:
+					if neighbours.issuperset(coinc):
+						new_coinc = coinc + (y,)
+						if len(new_coinc) > 2:
+							used.update(new_coinc[:i] + new_coinc[i + 1:] for i in range(len(new_coinc)))
+						coincs.append(new_coinc)
+			partial[y] = coincs
+			buffers[instrument_of[y]].append((t, y))
+		for buf in buffers:
+			while buf:
+				for coinc in finish(buf.popleft()[1]):
+					yield coinc
+
+	def get_coincs(self, eventlists, event_comparefunc, thresholds, include_small_coincs = True, verbose = False):
+		"""
+		Generator yielding (node, coinc) tuples, where coinc is a
+		tuple of event IDs ordered alphabetically by instrument,
+		for each target offset vector.  See
+		TimeSlideGraph.get_coincs().
+		"""
+		if verbose:
+			print >>sys.stderr, "constructing coincs for target offset vectors ..."
+		for n, node in enumerate(self.head, start = 1):
+			if verbose:
+				print >>sys.stderr, "%d/%d: %s" % (n, len(self.head), str(node.offset_vector))
+			for coinc in self.sweep(eventlists, event_comparefunc, thresholds, node.offset_vector, include_small_coincs = include_small_coincs):
+				yield node, coinc
+
+
 #
 # =============================================================================
 #
@@ -657,26 +1327,164 @@ class TimeSlideGraph(object):
 #
 
 
+def instrument_bit(instruments, instrument):
+	"""
+	Return the position of instrument in the sorted list of
+	instrument names instruments, which is the bit representing it in
+	the instrument bit masks used by the bulk coinc row constructors
+	(see CoincTables.append_coincs()).
+	"""
+	return bisect.bisect_left(instruments, instrument)
+
+
+def instruments_from_bits(instruments, bits):
+	"""
+	Inverse of instrument_bit():  return the set of the names in the
+	sorted list instruments whose bits are set in the bit mask bits.
+	"""
+	return set(instrument for i, instrument in enumerate(instruments) if bits >> i & 1)
+
+
+class SQLiteTableSink(object):
+	"""
+	A write-only stand-in for a glue.ligolw table, used by CoincTables
+	in place of a table in the XML document.  Rows appended to it are
+	held in memory and inserted into the table of the same name in an
+	SQLite database with a single executemany() by .flush().  Rows may
+	still be modified after they are appended, so the sink never
+	flushes itself:  the owner calls .flush_full() once the rows it
+	has appended are complete, which writes them if block_size or more
+	are held, so the memory used does not grow with the number of rows
+	written.  The database table is created if needed, but without
+	constraints or indexes, so that the inserts do not have to maintain
+	them.  Call .build_indexes() once all of the rows have been written
+	(after .flush()).
+	"""
+	def __init__(self, connection, TableType, block_size = 10000):
+		self.connection = connection
+		self.TableType = TableType
+		self.RowType = TableType.RowType
+		self.tableName = ligolw_table.StripTableName(TableType.tableName)
+		self.block_size = block_size
+		self.next_id = TableType.next_id
+		self.rows = []
+		self.nrows = 0
+
+		columns = [(ligolw_table.StripColumnName(name), coltype) for name, coltype in TableType.validcolumns.items()]
+		self.columnnames = [name for name, coltype in columns]
+		self.ilwd_columns = [i for i, (name, coltype) in enumerate(columns) if coltype == u"ilwd:char"]
+		self.connection.execute("CREATE TABLE IF NOT EXISTS %s (%s)" % (self.tableName, ", ".join("%s %s" % (name, ligolwtypes.ToSQLiteType[coltype]) for name, coltype in columns)))
+		self.append_statement = "INSERT INTO %s (%s) VALUES (%s)" % (self.tableName, ", ".join(self.columnnames), ", ".join("?" * len(self.columnnames)))
+
+	def __len__(self):
+		return self.nrows
+
+	def sync_next_id(self, rows = ()):
+		"""
+		Advance .next_id past the IDs already in the database table
+		and those of the rows in the sequence rows (e.g., rows in
+		the XML document that are to be inserted into the database
+		later).  Returns the new .next_id.
+		"""
+		if self.next_id is not None:
+			column = self.next_id.column_name
+			n = [int(unicode(id).split(":")[-1]) for (id,) in self.connection.execute("SELECT %s FROM %s" % (column, self.tableName))]
+			n.extend(int(getattr(row, column)) for row in rows)
+			if n and max(n) >= int(self.next_id):
+				self.next_id = type(self.next_id)(max(n) + 1)
+		return self.next_id
+
+	def get_next_id(self):
+		id = self.next_id
+		self.next_id += 1
+		return id
+
+	def _row_to_cols(self, row):
+		values = [getattr(row, name) for name in self.columnnames]
+		for i in self.ilwd_columns:
+			if values[i] is not None:
+				values[i] = unicode(values[i])
+		return values
+
+	def append(self, row):
+		self.rows.append(row)
+		self.nrows += 1
+
+	def extend(self, rows):
+		rows = list(rows)
+		self.rows.extend(rows)
+		self.nrows += len(rows)
+
+	def flush(self):
+		"""
+		Insert the rows held in memory into the database.
+		"""
+		if self.rows:
+			self.connection.cursor().executemany(self.append_statement, itertools.imap(self._row_to_cols, self.rows))
+			del self.rows[:]
+
+	def flush_full(self):
+		"""
+		Insert the rows held in memory into the database if there
+		are block_size or more of them.
+		"""
+		if len(self.rows) >= self.block_size:
+			self.flush()
+
+	def build_indexes(self):
+		"""
+		Create the indexes glue.ligolw.dbtables defines for this
+		table, and a unique index on the table's ID column.
+		"""
+		how_to_index = dict(getattr(dbtables.TableByName.get(self.tableName), "how_to_index", None) or {})
+		if self.next_id is not None:
+			how_to_index.setdefault("%s_%s_index" % (self.tableName, self.next_id.column_name), (self.next_id.column_name,))
+		for index_name, cols in how_to_index.items():
+			unique = "UNIQUE " if self.next_id is not None and tuple(cols) == (self.next_id.column_name,) else ""
+			self.connection.execute("CREATE %sINDEX IF NOT EXISTS %s ON %s (%s)" % (unique, index_name, self.tableName, ", ".join(cols)))
+
+
 class CoincTables(object):
 	"""
 	A convenience interface to the XML document's coincidence tables,
 	allowing for easy addition of coincidence events.
+
+	If connection, an sqlite3 database connection, is not None then
+	the coinc_event and coinc_event_map rows are not added to the XML
+	document but streamed into that database through SQLiteTableSink
+	objects, block_size rows at a time.  The document is still used
+	for the time slides and to choose the coinc_event IDs, and should
+	itself be inserted into the database afterwards with its IDs
+	preserved.  The rows are written when they are complete, which
+	is signalled by calling .flush_full() (see .append_coinc() and
+	.append_coincs()).  .flush() must be called once all of the
+	coincs have been added, and .build_indexes() after that.
 	"""
-	def __init__(self, xmldoc):
-		# find the coinc table or create one if not found
-		try:
-			self.coinctable = lsctables.CoincTable.get_table(xmldoc)
-		except ValueError:
-			self.coinctable = lsctables.New(lsctables.CoincTable)
-			xmldoc.childNodes[0].appendChild(self.coinctable)
-		self.coinctable.sync_next_id()
+	def __init__(self, xmldoc, connection = None, block_size = 10000):
+		self.sinks = []
+		if connection is not None:
+			self.coinctable = SQLiteTableSink(connection, lsctables.CoincTable, block_size = block_size)
+			try:
+				self.coinctable.sync_next_id(lsctables.CoincTable.get_table(xmldoc))
+			except ValueError:
+				self.coinctable.sync_next_id()
+			self.coincmaptable = SQLiteTableSink(connection, lsctables.CoincMapTable, block_size = block_size)
+			self.sinks += [self.coinctable, self.coincmaptable]
+		else:
+			# find the coinc table or create one if not found
+			try:
+				self.coinctable = lsctables.CoincTable.get_table(xmldoc)
+			except ValueError:
+				self.coinctable = lsctables.New(lsctables.CoincTable)
+				xmldoc.childNodes[0].appendChild(self.coinctable)
+			self.coinctable.sync_next_id()
 
-		# find the coinc_map table or create one if not found
-		try:
-			self.coincmaptable = lsctables.CoincMapTable.get_table(xmldoc)
-		except ValueError:
-			self.coincmaptable = lsctables.New(lsctables.CoincMapTable)
-			xmldoc.childNodes[0].appendChild(self.coincmaptable)
+			# find the coinc_map table or create one if not found
+			try:
+				self.coincmaptable = lsctables.CoincMapTable.get_table(xmldoc)
+			except ValueError:
+				self.coincmaptable = lsctables.New(lsctables.CoincMapTable)
+				xmldoc.childNodes[0].appendChild(self.coincmaptable)
 
 		# find the time_slide table
 		self.time_slide_table = lsctables.TimeSlideTable.get_table(xmldoc)
@@ -723,6 +1531,80 @@ class CoincTables(object):
 			self.coincmaptable.append(coincmap)
 		return coinc
 
+	def flush(self):
+		"""
+		Write any rows held in memory by database sinks to the
+		database.  Does nothing if the rows are being added to the
+		XML document.
+		"""
+		for sink in self.sinks:
+			sink.flush()
+
+	def flush_full(self):
+		"""
+		Write the rows held in memory by database sinks to the
+		database if block_size or more have accumulated.  The rows
+		are not written as they are appended, because subclasses
+		fill in columns such as the instruments and the likelihood
+		after chaining to .append_coinc() or .append_coincs();  the
+		code that appends coincs must call this once they are
+		complete.  Does nothing if the rows are being added to the
+		XML document.
+		"""
+		for sink in self.sinks:
+			sink.flush_full()
+
+	def build_indexes(self):
+		"""
+		Index the database tables into which the rows have been
+		streamed.  Index creation is deferred to here, after all of
+		the rows have been written, because building an index once
+		is much faster than maintaining it through every insert.
+		Does nothing if the rows are being added to the XML
+		document.
+		"""
+		for sink in self.sinks:
+			sink.build_indexes()
+
+	def append_coincs(self, process_id, time_slide_id, coinc_def_id, coincs):
+		"""
+		Bulk form of .append_coinc().  coincs is a sequence of
+		tuples of event IDs (not events), each tuple being one
+		coincidence found at the offset vector time_slide_id.  The
+		coinc_event and coinc_event_map rows are constructed exactly
+		as .append_coinc() would, but are appended to their tables
+		in one batch.  The return value is the list of new
+		coinc_event rows, in the order of coincs.
+
+		Subclasses that override this method should first chain to
+		this method, and then compute their additional metadata for
+		all of the coincs at once.
+		"""
+		RowType = self.coinctable.RowType
+		CoincMapRowType = self.coincmaptable.RowType
+		get_next_id = self.coinctable.get_next_id
+		coinc_rows = []
+		coincmap_rows = []
+		for event_ids in coincs:
+			coinc = RowType()
+			coinc.process_id = process_id
+			coinc.coinc_def_id = coinc_def_id
+			coinc.coinc_event_id = coinc_event_id = get_next_id()
+			coinc.time_slide_id = time_slide_id
+			coinc.set_instruments(None)
+			coinc.nevents = len(event_ids)
+			coinc.likelihood = None
+			coinc_rows.append(coinc)
+			for event_id in event_ids:
+				coincmap = CoincMapRowType()
+				coincmap.coinc_event_id = coinc_event_id
+				coincmap.table_name = event_id.table_name
+				coincmap.event_id = event_id
+				coincmap_rows.append(coincmap)
+		self.coinctable.extend(coinc_rows)
+		self.coincmaptable.extend(coincmap_rows)
+		return coinc_rows
+
 
 #
 # =============================================================================
@@ -741,7 +1623,11 @@ class CoincSynthesizer(object):
 	rates related to the problem of doing so.
 	"""
 
-	def __init__(self, eventlists = None, segmentlists = None, delta_t = None, abundance_rel_accuracy = 1e-4):
+	# number of random vectors of \Delta ts drawn at once by the Monte
+	# Carlo integrator and by .plausible_toas()
+	mc_block_size = 1 << 16
+
+	def __init__(self, eventlists = None, segmentlists = None, delta_t = None, abundance_rel_accuracy = 1e-4, seed = None):
 		"""
 		eventlists is either a dictionary mapping instrument name
 		to a list of the events (arbitrary objects) seen in that
@@ -758,7 +1644,10 @@ class CoincSynthesizer(object):
 
 		abundance_rel_accuracy sets the fractional error tolerated
 		in the Monte Carlo integrator used to estimate the relative
-		abundances of the different kinds of coincs.
+		abundances of the different kinds of coincs.  seed, if not
+		None, seeds the random number generator used by the Monte
+		Carlo integrator and by .plausible_toas() to make their
+		results reproducible.
 
 		Example:
 
@@ -771,7 +1660,7 @@ class CoincSynthesizer(object):
 		>>> coinc_synth.tau
 		{frozenset(['V1', 'H1']): 0.028287979933844225, frozenset(['H1', 'L1']): 0.011012846152223924, frozenset(['V1', 'L1']): 0.027448341016726496}
 		>>> coinc_synth.rates
-		{frozenset(['V1', 'H1']): 0.0006034769052553435, frozenset(['V1', 'H1', 'L1']): 1.1793108172576082e-06, frozenset(['H1', 'L1']): 0.000293675897392638, frozenset(['V1', 'L1']): 0.00043917345626762395}
+		{frozenset(['V1', 'H1']): 0.0006034769052553435, frozenset(['V1', 'H1', 'L1']): 1.1793528336592311e-06, frozenset(['H1', 'L1']): 0.000293675897392638, frozenset(['V1', 'L1']): 0.00043917345626762395}
 		>>> coinc_synth.P_live
 		{frozenset(['V1', 'H1']): 0.0, frozenset(['V1', 'H1', 'L1']): 0.25, frozenset(['H1', 'L1']): 0.25, frozenset(['V1', 'L1']): 0.5}
 		"""
@@ -781,6 +1670,11 @@ class CoincSynthesizer(object):
 		# require a segment list for each list of events
 		assert set(self.eventlists) <= set(self.segmentlists)
 		self.abundance_rel_accuracy = abundance_rel_accuracy
+		self.random_state = numpy.random.RandomState(seed)
+		# mutual coincidence fractions depend only on the
+		# coincidence windows, so they are cached by window and
+		# survive .reset()
+		self._mutual_coinc_fractions = {}
 
 		self.verbose = False	# turn on for diagnostics
 
@@ -964,67 +1858,13 @@ class CoincSynthesizer(object):
 					print >>sys.stderr, "%s uncorrected mean event rate = %g Hz" % (",".join(sorted(key)), rate)
 
 		# if there are more than two instruments, correct for the
-		# probability of full N-way coincidence by computing the
-		# volume of the allowed parameter space by stone throwing.
-		# FIXME:  it might be practical to solve this with some
-		# sort of computational geometry library and convex hull
-		# volume calculator.
-		# FIXME:  in any case, these correction factors depend only
-		# on the coincidence windows and can be computed and saved
-		# when self.tau is updated allowing the rates, here, to be
-		# computed very quickly if only the single-instrument
-		# trigger rates have changed and not the coincidence
-		# windows.
+		# probability of full N-way coincidence (see
+		# .mutual_coinc_fraction())
 				if len(instruments) > 1:
-		# for each instrument 2...N, the interval within which an
-		# event is coincident with instrument 1
-					windows = tuple((-self.tau[frozenset((anchor, instrument))], +self.tau[frozenset((anchor, instrument))]) for instrument in instruments)
-		# pre-assemble a sequence of instrument index pairs and the
-		# maximum allowed \Delta t between them to avoid doing the
-		# work associated with assembling the sequence inside a
-		# loop
-					ijseq = tuple((i, j, self.tau[frozenset((instruments[i], instruments[j]))]) for (i, j) in iterutils.choices(range(len(instruments)), 2))
-		# compute the numerator and denominator of the fraction of
-		# events coincident with the anchor instrument that are
-		# also mutually coincident.  this is done by picking a
-		# vector of allowed \Delta ts and testing them against the
-		# coincidence windows.  the loop's exit criterion is
-		# arrived at as follows.  after d trials, the number of
-		# successful outcomes is a binomially-distributed RV with
-		# variance = d p (1 - p) <= d/4 where p is the probability
-		# of a successful outcome.  we quit when the ratio of the
-		# bound on the standard deviation of the number of
-		# successful outcomes to the actual number of successful
-		# outcomes falls below rel accuracy: \sqrt{d/4} / n < rel
-		# accuracy.  note that if the true probability is 0, so
-		# that n=0 identically, then the loop will never terminate;
-		# from the nature of the problem we know 0<p<1 so the loop
-		# will, eventually, terminate.  note that if instead of
-		# using the upper bound on the variance, we replace p with
-		# (n/d) and use that estimate of the variance the loop can
-		# be shown to require many fewer iterations to meet the
-		# desired accuracy, but that choice creates a rather strong
-		# bias that, to overcome, requires some extra hacks to
-		# force the loop to run for additional iterations.  this
-		# approach is cleaner.
-					math_sqrt = math.sqrt
-					random_uniform = random.uniform
-					epsilon = self.abundance_rel_accuracy
-					n, d = 0, 0
-					while math_sqrt(d) >= epsilon * n:
-						dt = tuple(random_uniform(*window) for window in windows)
-						if all(abs(dt[i] - dt[j]) <= maxdt for i, j, maxdt in ijseq):
-		# instead of adding 1 here and multiplying n by 2 in the
-		# loop exit test, we increment n by 2 and then fix it
-		# afterwards.
-							n += 2
-						d += 1
-		# fix n (see above)
-					n //= 2
-
-					rate *= float(n) / float(d)
+					fraction = self.mutual_coinc_fraction(anchor, instruments)
+					rate *= fraction
 					if self.verbose:
-						print >>sys.stderr, "	multi-instrument correction factor = %g" % (float(n)/float(d))
+						print >>sys.stderr, "	multi-instrument correction factor = %g" % fraction
 						print >>sys.stderr, "	%s mean event rate = %g Hz" % (",".join(sorted(key)), rate)
 
 				self._rates[key] = rate
@@ -1044,6 +1884,104 @@ class CoincSynthesizer(object):
 			return self._rates
 
 
+	def mutual_coinc_fraction(self, anchor, instruments):
+		"""
+		Return the fraction of the events from the instruments in
+		instruments (a sequence of at least two instrument names)
+		known to be coincident with an event from the instrument
+		anchor that are also mutually coincident, assuming the
+		\Delta t's between the events and the anchor are uniformly
+		distributed within their coincidence windows.  The result
+		depends only on the coincidence windows, and is cached by
+		their values so that it is not recomputed after .reset()
+		unless the windows have changed.
+
+		For three instruments (the anchor and two others) the
+		fraction is computed analytically, for more it is estimated
+		by Monte Carlo integration to the fractional accuracy set
+		by .abundance_rel_accuracy.
+		"""
+		instruments = tuple(instruments)
+		assert len(instruments) > 1
+		# for each instrument the interval within which an event
+		# is coincident with the anchor, and for each pair of
+		# instruments the maximum allowed \Delta t between them
+		taus = tuple(self.tau[frozenset((anchor, instrument))] for instrument in instruments)
+		ijseq = tuple((i, j, self.tau[frozenset((instruments[i], instruments[j]))]) for (i, j) in iterutils.choices(range(len(instruments)), 2))
+		key = taus, ijseq, self.abundance_rel_accuracy
+		try:
+			return self._mutual_coinc_fractions[key]
+		except KeyError:
+			pass
+
+		if len(instruments) == 2:
+		# the \Delta ts, x and y, are uniformly distributed in the
+		# rectangle |x| <= a, |y| <= b.  they are mutually
+		# coincident if |x - y| <= c.  the regions x - y > c and
+		# y - x > c in the rectangle are congruent, and the area of
+		# the first is the integral over x of the length of the
+		# interval -b <= y < x - c
+			(a, b), ((i, j, c),) = taus, ijseq
+			def H(s):
+				# integral from -inf to s of the length of
+				# the interval [0, min(u, 2b)] clipped at 0
+				if s <= 0.:
+					return 0.
+				if s <= 2. * b:
+					return s * s / 2.
+				return 2. * b * b + 2. * b * (s - 2. * b)
+			fraction = 1. - 2. * (H(a + b - c) - H(b - c - a)) / (4. * a * b)
+		else:
+		# compute the numerator and denominator of the fraction by
+		# picking vectors of allowed \Delta ts and testing them
+		# against the coincidence windows, a block of vectors at a
+		# time.  the loop's exit criterion is arrived at as
+		# follows.  after d trials, the number of successful
+		# outcomes is a binomially-distributed RV with variance = d
+		# p (1 - p) <= d/4 where p is the probability of a
+		# successful outcome.  we quit when the ratio of the bound
+		# on the standard deviation of the number of successful
+		# outcomes to the actual number of successful outcomes
+		# falls below rel accuracy: \sqrt{d/4} / n < rel accuracy.
+		# note that if the true probability is 0, so that n=0
+		# identically, then the loop will never terminate;  from
+		# the nature of the problem we know 0<p<1 so the loop will,
+		# eventually, terminate.  note that if instead of using the
+		# upper bound on the variance, we replace p with (n/d) and
+		# use that estimate of the variance the loop can be shown
+		# to require many fewer iterations to meet the desired
+		# accuracy, but that choice creates a rather strong bias
+		# that, to overcome, requires some extra hacks to force the
+		# loop to run for additional iterations.  this approach is
+		# cleaner.
+			epsilon = self.abundance_rel_accuracy
+			n, d = 0, 0
+			while math.sqrt(d / 4.) >= epsilon * n:
+				n += self._mutual_coincs(taus, ijseq, self.mc_block_size)[1].sum()
+				d += self.mc_block_size
+			fraction = float(n) / float(d)
+
+		self._mutual_coinc_fractions[key] = fraction
+		return fraction
+
+
+	def _mutual_coincs(self, taus, ijseq, count):
+		"""
+		Draw count random vectors of \Delta ts uniformly
+		distributed within the intervals [-tau, +tau] for the
+		values in taus.  Return the vectors, as rows of an array,
+		and a boolean array indicating which are mutually
+		coincident given the maximum allowed \Delta ts between
+		pairs of the vectors' components in ijseq.
+		"""
+		taus = numpy.array(taus, dtype = "double")
+		dt = self.random_state.uniform(-taus, +taus, size = (count, len(taus)))
+		coincident = numpy.ones((count,), dtype = "bool")
+		for i, j, maxdt in ijseq:
+			coincident &= abs(dt[:,i] - dt[:,j]) <= maxdt
+		return dt, coincident
+
+
 	@property
 	def mean_coinc_rate(self):
 		"""
@@ -1228,14 +2166,16 @@ class CoincSynthesizer(object):
 		>>> toas.next()
 		>>> toas.next()
 		"""
-		# this algorithm is documented in slideless_coinc_generator_rates()
+		# this algorithm is documented in .mutual_coinc_fraction().
+		# vectors of \Delta ts are drawn and tested a block at a
+		# time
 		instruments = tuple(instruments)
 		anchor, instruments = instruments[0], instruments[1:]
-		windows = tuple((-self.tau[frozenset((anchor, instrument))], +self.tau[frozenset((anchor, instrument))]) for instrument in instruments)
+		taus = tuple(self.tau[frozenset((anchor, instrument))] for instrument in instruments)
 		ijseq = tuple((i, j, self.tau[frozenset((instruments[i], instruments[j]))]) for (i, j) in iterutils.choices(range(len(instruments)), 2))
 		while True:
-			dt = tuple(random.uniform(*window) for window in windows)
-			if all(abs(dt[i] - dt[j]) <= maxdt for i, j, maxdt in ijseq):
+			dt, coincident = self._mutual_coincs(taus, ijseq, self.mc_block_size)
+			for dt in dt[coincident].tolist():
 				yield dict([(anchor, 0.0)] + zip(instruments, dt))
 
 
@@ -1444,6 +2384,144 @@ class TOATriangulator(object):
 		# done
 		return n, t0 + toa, chi2 / len(self.sigmas), dt
 
+	def batch(self, ts):
+		"""
+		Triangulate many signals at once.  ts is an (N, n) array of
+		arrival times, where n is the number of observation
+		locations, each row giving the arrival times of one signal
+		at the locations in the order in which they were provided
+		when the instance was created.  The units of the times must
+		be the same as the units used for the sigmas.
+
+		The return value is a tuple of arrays
+
+			(n, toa, chi2 / DOF, dt)
+
+		with shapes (N, 3), (N,), (N,) and (N,), the rows of which
+		are the values returned by the function call interface for
+		the corresponding rows of ts.  The arrival times are
+		handled as double-precision floats, so for the best
+		accuracy they should be given relative to some nearby
+		epoch and not as absolute GPS times.
+
+		Unlike the function call interface, which solves the
+		secular equation for each signal with
+		scipy.optimize.brentq(), the equations for all signals are
+		solved simultaneously by vectorized Newton iterations
+		safeguarded by bisection.
+
+		Example:
+
+		>>> n, toa, chi2_per_dof, dt = triangulator.batch(numpy.array([
+			[0.429688, 0.41333, 0.431885],
+			[0.429688, 0.42333, 0.431885]
+		]))
+		"""
+		ts = numpy.asarray(ts, dtype = "double")
+		if ts.ndim != 2 or ts.shape[1] != len(self.sigmas):
+			raise ValueError("arrival times must be an (N, %d) array" % len(self.sigmas))
+		N = len(ts)
+
+		# change of t co-ordinate to preserve precision
+		t0 = ts.min(axis = 1) if N else numpy.empty((0,), dtype = "double")
+		ts = ts - t0[:,numpy.newaxis]
+
+		weights = 1 / self.sigmas**2
+
+		# sigma^-2 -weighted mean of arrival times
+		tbar = numpy.dot(ts, weights) / weights.sum()
+		# the i-th column is ts - tbar for the i-th location
+		tau = ts - tbar[:,numpy.newaxis]
+
+		if len(self.rs) >= 3:
+			tau_prime = numpy.dot(tau, self.U)[:,:3]
+
+			if self.singular:
+				np = tau_prime / self.S
+				np2 = 1.0 - np[:,0]**2 - np[:,1]**2
+				np[:,2] = numpy.sqrt(numpy.clip(np2, 0.0, None))
+				unphysical = np2 < 0.0
+				np[unphysical] /= numpy.sqrt((np[unphysical]**2).sum(axis = 1))[:,numpy.newaxis]
+			else:
+				Stauprime = self.S * tau_prime
+				S2 = self.S * self.S
+
+				# the secular equation,
+				#
+				#	f(l) = |n'(l)|^2 - 1
+				#
+				# with n'(l) = S tau' / (S^2 + l), is convex
+				# and decreases monotonically from +inf to
+				# -1 on (-S_min^2, +inf), so it has exactly
+				# one root there (elements of S are ordered
+				# from greatest to least, so the last element
+				# of S is S_min).  it is solved for x = l +
+				# S_min^2, which preserves precision when the
+				# root is close to the pole.  because |n'| <=
+				# |S tau'| / x, the root is bracketed by 0 and
+				# |S tau'|
+				D = S2 - S2[-1]
+				x_lo = numpy.zeros((N,), dtype = "double")
+				x_hi = numpy.sqrt((Stauprime**2).sum(axis = 1))
+				x = x_hi / 2
+				active = numpy.ones((N,), dtype = "bool")
+				for i in range(200):
+					xa = x[active]
+					np = Stauprime[active] / (D + xa[:,numpy.newaxis])
+					f = (np**2).sum(axis = 1) - 1
+					df = -2 * (np**2 / (D + xa[:,numpy.newaxis])).sum(axis = 1)
+					# shrink the bracket
+					lo = numpy.where(f > 0, xa, x_lo[active])
+					hi = numpy.where(f > 0, x_hi[active], xa)
+					x_lo[active], x_hi[active] = lo, hi
+					# take the Newton step if it remains
+					# inside the bracket, otherwise bisect
+					with numpy.errstate(divide = "ignore", invalid = "ignore"):
+						new_x = xa - f / df
+					outside = ~((new_x > lo) & (new_x < hi))
+					new_x[outside] = (lo[outside] + hi[outside]) / 2
+					# stop when the step is negligible or
+					# the root has been found exactly
+					new_x[f == 0] = xa[f == 0]
+					converged = abs(new_x - xa) <= 4 * numpy.finfo(float).eps * abs(new_x)
+					x[active] = new_x
+					active[active] = ~converged
+					if not active.any():
+						break
+
+				# compute n'
+				np = Stauprime / (D + x[:,numpy.newaxis])
+
+			# compute n from n'
+			n = numpy.dot(np, self.VT)
+
+			# safety check the nomalization of the result
+			assert (abs((n**2).sum(axis = 1) - 1.0) < 1e-8).all()
+
+			# arrival times at each location relative to the
+			# arrival time at the origin
+			delays = numpy.dot(n, self.rs.T) / self.v
+
+			# arrival time at origin
+			toa = numpy.dot(ts - delays, weights) / weights.sum()
+
+			# chi^{2}
+			chi2 = (((numpy.dot(n, self.R.T) / self.v - tau) / self.sigmas)**2).sum(axis = 1)
+
+			# root-sum-square timing residual
+			dt = ts - toa[:,numpy.newaxis] - delays
+			dt = numpy.sqrt((dt**2).sum(axis = 1))
+		else:
+			# len(rs) == 2
+			# FIXME:  fill in n and toa (is chi2 right?)
+			n = numpy.zeros((N, 3), dtype = "double")
+			toa = numpy.zeros((N,), dtype = "double")
+			dt = numpy.clip(abs(ts[:,1] - ts[:,0]) - self.max_dt, 0, None)
+			chi2 = dt**2 / sum(self.sigmas**2)
+
+		# done
+		return n, t0 + toa, chi2 / len(self.sigmas), dt
+
 
 #
 # =============================================================================
@@ -1577,6 +2655,9 @@ class CoincParamsDistributions(object):
 		self.zero_lag_lnpdf_interp = {}
 		self.background_lnpdf_interp = {}
 		self.injection_lnpdf_interp = {}
+		self.zero_lag_lnpdf_table = {}
+		self.background_lnpdf_table = {}
+		self.injection_lnpdf_table = {}
 		self.process_id = process_id
 
 	def _rebuild_interpolators(self):
@@ -1587,19 +2668,26 @@ class CoincParamsDistributions(object):
 		self.zero_lag_lnpdf_interp.clear()
 		self.background_lnpdf_interp.clear()
 		self.injection_lnpdf_interp.clear()
-		def mkinterp(binnedarray):
+		self.zero_lag_lnpdf_table.clear()
+		self.background_lnpdf_table.clear()
+		self.injection_lnpdf_table.clear()
+		def mkln(binnedarray):
 			with numpy.errstate(invalid = "ignore"):
 				assert not (binnedarray.array < 0.).any()
 			binnedarray = binnedarray.copy()
 			with numpy.errstate(divide = "ignore"):
 				binnedarray.array = numpy.log(binnedarray.array)
-			return rate.InterpBinnedArray(binnedarray, fill_value = NegInf)
-		for key, binnedarray in self.zero_lag_pdf.items():
-			self.zero_lag_lnpdf_interp[key] = mkinterp(binnedarray)
-		for key, binnedarray in self.background_pdf.items():
-			self.background_lnpdf_interp[key] = mkinterp(binnedarray)
-		for key, binnedarray in self.injection_pdf.items():
-			self.injection_lnpdf_interp[key] = mkinterp(binnedarray)
+			return binnedarray
+		for interps, tables, pdfs in ((self.zero_lag_lnpdf_interp, self.zero_lag_lnpdf_table, self.zero_lag_pdf), (self.background_lnpdf_interp, self.background_lnpdf_table, self.background_pdf), (self.injection_lnpdf_interp, self.injection_lnpdf_table, self.injection_pdf)):
+			for key, binnedarray in pdfs.items():
+				binnedarray = mkln(binnedarray)
+				interps[key] = rate.InterpBinnedArray(binnedarray, fill_value = NegInf)
+				# the vectorized interpolator reproduces
+				# InterpBinnedArray() only in 1 and 2
+				# dimensions.  higher-dimensional PDFs are
+				# evaluated with the scalar interpolator
+				if len(binnedarray.bins) <= 2:
+					tables[key] = rate.InterpBinnedArrayTable(binnedarray, fill_value = NegInf)
 
 	@staticmethod
 	def addbinnedarrays(rate_target_dict, rate_source_dict, pdf_target_dict, pdf_source_dict):
@@ -1795,6 +2883,70 @@ class CoincParamsDistributions(object):
 		__getitem__ = self.injection_lnpdf_interp.__getitem__
 		return sum(__getitem__(name)(*value) for name, value in params.items())
 
+	def lnP_noise_batch(self, params):
+		"""
+		Vectorized form of .lnP_noise().  params is a dictionary
+		mapping parameter name to a tuple of arrays, the arrays
+		giving the co-ordinates of many points in that parameter's
+		space (the tuple for each parameter has the same form as
+		the tuples in the dictionaries returned by
+		self.coinc_params(), but with arrays in place of scalars).
+		The return value is an array of the natural logarithms of
+		the noise probability densities at the points.
+
+		PDFs of one and two dimensions are evaluated with
+		pre-computed interpolation tables (see
+		rate.InterpBinnedArrayTable), which give the same results
+		as the interpolators used by .lnP_noise() except next to
+		bins where the ln PDF is -inf:  there, including in the
+		-inf padding around the edges of the binning, the tables
+		give -inf where .lnP_noise() generally gives nan.  PDFs of
+		three or more dimensions are evaluated with .lnP_noise()'s
+		interpolators one point at a time.  If a sub-class
+		overrides .lnP_noise() but not this method, .lnP_noise() is
+		evaluated at each point in turn.
+		"""
+		if type(self).lnP_noise.im_func is not CoincParamsDistributions.lnP_noise.im_func:
+			return self._unvectorized(self.lnP_noise, params)
+		return self._lnpdf_batch(self.background_lnpdf_interp, self.background_lnpdf_table, params)
+
+	def lnP_signal_batch(self, params):
+		"""
+		Vectorized form of .lnP_signal().  See .lnP_noise_batch().
+		"""
+		if type(self).lnP_signal.im_func is not CoincParamsDistributions.lnP_signal.im_func:
+			return self._unvectorized(self.lnP_signal, params)
+		return self._lnpdf_batch(self.injection_lnpdf_interp, self.injection_lnpdf_table, params)
+
+	@staticmethod
+	def _lnpdf_batch(interps, tables, params):
+		"""
+		For internal use.  Sum the ln PDFs named in the dictionary
+		of parameter co-ordinate arrays params, using the
+		vectorized interpolator from tables where there is one and
+		the scalar interpolator from interps otherwise.
+		"""
+		result = 0.
+		for name, value in params.items():
+			try:
+				table = tables[name]
+			except KeyError:
+				interp = interps[name]
+				result = result + numpy.fromiter((interp(*point) for point in zip(*value)), dtype = "double", count = len(value[0]))
+			else:
+				result = result + table(*value)
+		return result
+
+	@staticmethod
+	def _unvectorized(func, params):
+		"""
+		For internal use.  Evaluate func() at each of the points in
+		the dictionary of parameter co-ordinate arrays params.
+		"""
+		names = params.keys()
+		columns = [zip(*params[name]) for name in names]
+		return numpy.fromiter((func(dict(zip(names, values))) for values in zip(*columns)), dtype = "double")
+
 	def get_xml_root(self, xml, name):
 		"""
 		Sub-classes can use this in their overrides of the
@@ -1921,9 +3073,15 @@ class LnLikelihoodRatio(object):
 	ratios from the measurements in a
 	snglcoinc.CoincParamsDistributions instance.
 	"""
+	# number of parameter choices drawn from the random sequence and
+	# evaluated together by .samples()
+	block_size = 1024
+
 	def __init__(self, coinc_param_distributions):
 		self.lnP_noise = coinc_param_distributions.lnP_noise
 		self.lnP_signal = coinc_param_distributions.lnP_signal
+		self.lnP_noise_batch = coinc_param_distributions.lnP_noise_batch
+		self.lnP_signal_batch = coinc_param_distributions.lnP_signal_batch
 
 	def __call__(self, *args, **kwargs):
 		"""
@@ -1973,6 +3131,59 @@ class LnLikelihoodRatio(object):
 				warnings.warn("inf/inf encountered")
 		return  lnP_signal - lnP_noise
 
+	@staticmethod
+	def stack_params(params_seq):
+		"""
+		Generator to convert a sequence of parameter value
+		dictionaries, each as returned by the .coinc_params()
+		method of a CoincParamsDistributions instance, to the form
+		accepted by its vectorized methods.  The dictionaries are
+		grouped by the set of parameters they contain, and for each
+		group a tuple (indexes, params) is yielded, where indexes
+		is a list of the positions in params_seq of the
+		dictionaries in the group and params is a dictionary
+		mapping each parameter name to a tuple of arrays of
+		co-ordinates.
+		"""
+		groups = {}
+		for n, params in enumerate(params_seq):
+			groups.setdefault(frozenset(params), []).append(n)
+		for names, indexes in groups.items():
+			yield indexes, dict((name, tuple(numpy.array(column, dtype = "double") for column in zip(*(params_seq[n][name] for n in indexes)))) for name in names)
+
+	def batch(self, params_seq, **kwargs):
+		"""
+		Return an array of the natural logarithms of the likelihood
+		ratios for a sequence of parameter value dictionaries, each
+		as would be passed to the function call interface.  The
+		dictionaries are grouped by the parameters they contain,
+		and each group is evaluated in one call to the vectorized
+		.lnP_noise_batch() and .lnP_signal_batch() methods of the
+		CoincParamsDistributions instance.  The special cases are
+		handled as described in .__call__().  The vectorized
+		methods accept only the parameters, so if any key-word
+		arguments are given the likelihood ratio is evaluated with
+		.__call__() one parameter dictionary at a time.
+		"""
+		params_seq = tuple(params_seq)
+		if kwargs or type(self).__call__.im_func is not LnLikelihoodRatio.__call__.im_func:
+			# key-word arguments, or sub-class has its own
+			# definition of the likelihood ratio
+			return numpy.fromiter((self(params, **kwargs) for params in params_seq), dtype = "double", count = len(params_seq))
+		result = numpy.empty((len(params_seq),), dtype = "double")
+		for indexes, params in self.stack_params(params_seq):
+			lnP_noise = self.lnP_noise_batch(params)
+			lnP_signal = self.lnP_signal_batch(params)
+			with numpy.errstate(invalid = "ignore"):
+				lnL = lnP_signal - lnP_noise
+			# see .__call__() for description of special cases
+			both_zero = numpy.isneginf(lnP_noise) & numpy.isneginf(lnP_signal)
+			lnL[both_zero] = NegInf
+			if (numpy.isposinf(lnP_noise) & numpy.isposinf(lnP_signal)).any():
+				warnings.warn("inf/inf encountered")
+			result[indexes] = lnL
+		return result
+
 	def samples(self, random_params_seq, **kwargs):
 		"""
 		Generator that yields an unending sequence of 3-element
@@ -1993,15 +3204,32 @@ class LnLikelihoodRatio(object):
 		an .lnP_signal() methods of the CoincParamsDistributions
 		object with which this object is associated, followed by
 		any (optional) key-word arguments.
+
+		The parameter values are drawn from random_params_seq and
+		evaluated .block_size at a time using the vectorized
+		.lnP_noise_batch() and .lnP_signal_batch() methods.  Those
+		accept only the parameters, so if key-word arguments are
+		given .lnP_noise() and .lnP_signal() are called for each
+		choice of parameters instead.
 		"""
-		lnP_noise_func = self.lnP_noise
-		lnP_signal_func = self.lnP_signal
-		isinf = math.isinf
-		for params, lnP_params in random_params_seq:
-			lnP_noise = lnP_noise_func(params, **kwargs)
-			lnP_signal = lnP_signal_func(params, **kwargs)
-			# see above for description of special cases
-			if isinf(lnP_noise) and isinf(lnP_signal) and lnP_noise < 0. and lnP_signal < 0.:
-				yield NegInf, lnP_signal - lnP_params, lnP_noise - lnP_params
+		random_params_seq = iter(random_params_seq)
+		while True:
+			block = tuple(itertools.islice(random_params_seq, self.block_size))
+			if not block:
+				break
+			params_seq, lnP_params = zip(*block)
+			lnP_noise = numpy.empty((len(block),), dtype = "double")
+			lnP_signal = numpy.empty((len(block),), dtype = "double")
+			if kwargs:
+				lnP_noise[:] = [self.lnP_noise(params, **kwargs) for params in params_seq]
+				lnP_signal[:] = [self.lnP_signal(params, **kwargs) for params in params_seq]
 			else:
-				yield lnP_signal - lnP_noise, lnP_signal - lnP_params, lnP_noise - lnP_params
+				for indexes, params in self.stack_params(params_seq):
+					lnP_noise[indexes] = self.lnP_noise_batch(params)
+					lnP_signal[indexes] = self.lnP_signal_batch(params)
+			for lnP_noise, lnP_signal, lnP_params in itertools.izip(lnP_noise.tolist(), lnP_signal.tolist(), lnP_params):
+				# see above for description of special cases
+				if math.isinf(lnP_noise) and math.isinf(lnP_signal) and lnP_noise < 0. and lnP_signal < 0.:
+					yield NegInf, lnP_signal - lnP_params, lnP_noise - lnP_params
+				else:
+					yield lnP_signal - lnP_noise, lnP_signal - lnP_params, lnP_noise - lnP_params
@@ -0,0 +1,442 @@
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+#
+# =============================================================================
+#
+#                                   Preamble
+#
+# =============================================================================
+#
+
+
+"""
+Streaming, column-projected reading of trigger tables from LIGO Light
+Weight XML files.
+
+The usual way of reading triggers is to load each document in full,
+extract the table and then discard the rows that are not wanted.  The
+content handlers made here only build the requested table, skip the
+tokens of columns that are not requested (using the table's loadcolumns
+attribute), and test each row as soon as the parser has completed it, so
+rows outside the time window [start, end) are never kept.  The rows that
+pass are either appended to the table as usual or copied into one list
+per column, from which a numpy structured array is built, in which case
+the table stays empty and memory use is set by the surviving triggers
+only.
+
+Example:
+
+>>> triggers = read_triggers(filenames, "sngl_inspiral", start = 968654552, end = 968655552, columns = ["end_time", "end_time_ns", "snr", "chisq"], asarray = True, nprocs = 4)
+>>> loud = triggers[triggers["snr"] > 8]
+>>> table = totable(loud, "sngl_inspiral")
+"""
+
+
+import itertools
+import multiprocessing
+import sys
+
+
+import numpy
+
+
+from glue.ligolw import ilwd
+from glue.ligolw import ligolw
+from glue.ligolw import lsctables
+from glue.ligolw import table
+from glue.ligolw import utils
+from pylal import git_version
+
+
+__version__ = "git id %s" % git_version.id
+__date__ = git_version.date
+
+
+#
+# =============================================================================
+#
+#                                  Utilities
+#
+# =============================================================================
+#
+
+
+#
+# the column holding the integer seconds of the time of a row, by table.
+# the nanoseconds are in the column of the same name with "_ns" appended
+#
+
+
+TimeColumns = {
+	"sngl_inspiral": "end_time",
+	"sngl_burst": "peak_time",
+	"sngl_ringdown": "start_time",
+	"multi_inspiral": "end_time",
+	"multi_burst": "peak_time",
+	"coinc_inspiral": "end_time",
+	"coinc_ringdown": "start_time",
+	"sim_inspiral": "geocent_end_time",
+	"sim_burst": "time_geocent_gps",
+	"sim_ringdown": "geocent_start_time"
+}
+
+
+def table_type(tablename):
+	"""
+	Return the lsctables table class for the given table name, which may
+	or may not carry the ":table" suffix.
+	"""
+	return lsctables.TableByName[table.StripTableName(tablename)]
+
+
+def time_columns(TableType):
+	"""
+	Return the names of the integer seconds and nanoseconds columns
+	holding the time of a row of TableType.
+	"""
+	try:
+		tcol = TimeColumns[table.StripTableName(TableType.tableName)]
+	except KeyError:
+		raise ValueError("time column of %s table not known" % TableType.tableName)
+	return tcol, "%s_ns" % tcol
+
+
+def window_func(TableType, start = None, end = None):
+	"""
+	Return a function of a row of TableType that returns True if the
+	row's time lies in [start, end), or None if neither start nor end
+	is given.  The time is computed from the integer seconds and
+	nanoseconds columns directly, without building LIGOTimeGPS
+	objects.
+	"""
+	if start is None and end is None:
+		return None
+	tcol, tcol_ns = time_columns(TableType)
+	start = float(start) if start is not None else float("-inf")
+	end = float(end) if end is not None else float("+inf")
+	def window(row):
+		return start <= getattr(row, tcol) + getattr(row, tcol_ns) * 1e-9 < end
+	return window
+
+
+def _dtype(llwtype):
+	"""
+	numpy type for the values of a column of the given LIGO Light
+	Weight type.  Columns that are not numeric, including ilwd:char
+	IDs, are stored as strings.
+	"""
+	if llwtype in ("real_4", "real_8"):
+		return "float64"
+	if llwtype.startswith("int_"):
+		return "int64"
+	return "str"
+
+
+def _structured(TableType, names, columns):
+	"""
+	Build a structured array from a sequence of column names and a
+	matching sequence of sequences of values.
+	"""
+	return _fromcolumns(names, [numpy.array(column, dtype = _dtype(TableType.validcolumns[name])) for name, column in zip(names, columns)])
+
+
+def _fromcolumns(names, columns):
+	"""
+	Build a structured array from a sequence of names and a matching
+	sequence of arrays.
+	"""
+	array = numpy.empty(len(columns[0]) if columns else 0, dtype = [(str(name), column.dtype) for name, column in zip(names, columns)])
+	for name, column in zip(names, columns):
+		array[name] = column
+	return array
+
+
+#
+# =============================================================================
+#
+#                               Content Handler
+#
+# =============================================================================
+#
+
+
+def StreamContentHandler(tablename, start = None, end = None, columns = None, filterfunc = None, asarray = False):
+	"""
+	Return a content handler class that extracts only the table named
+	tablename from a document, loading only the given columns (default
+	is the table's loadcolumns) and keeping only the rows whose time is
+	in [start, end) and, if filterfunc is given, for which
+	filterfunc(row) is True.
+
+	If asarray is True the table is left empty, and the values of the
+	kept rows are collected instead in the table's .stream_columns
+	attribute, a dictionary mapping column name to a list of values.
+	ilwd:char IDs are collected as strings.
+
+	Example:
+
+	>>> handler = StreamContentHandler("sngl_inspiral", start = 968654552, end = 968655552, columns = ["end_time", "end_time_ns", "snr"])
+	>>> xmldoc = utils.load_filename(filename, contenthandler = handler)
+	"""
+	TableType = table_type(tablename)
+	window = window_func(TableType, start, end)
+	if window is not None and filterfunc is not None:
+		keep = lambda row: window(row) and filterfunc(row)
+	else:
+		keep = window or filterfunc
+
+	if columns is None:
+		columns = TableType.loadcolumns
+	if columns is not None:
+		columns = list(columns)
+		if window is not None:
+			tcol = TimeColumns[table.StripTableName(TableType.tableName)]
+			columns.extend(col for col in (tcol, "%s_ns" % tcol) if col not in columns)
+
+	class StreamTable(TableType):
+		loadcolumns = columns
+
+		def _stream_columns(self):
+			names = [name for name in self.columnnames if columns is None or name in columns]
+			self.stream_columns = dict((name, []) for name in names)
+			self._stream_appends = [(name, self.stream_columns[name].append, TableType.validcolumns[name] == "ilwd:char") for name in names]
+
+		def append(self, row):
+			if keep is not None and not keep(row):
+				return
+			if not asarray:
+				TableType.append(self, row)
+				return
+			if not hasattr(self, "_stream_appends"):
+				self._stream_columns()
+			for name, append, is_ilwd in self._stream_appends:
+				value = getattr(row, name)
+				append(str(value) if is_ilwd else value)
+
+	class ContentHandler(ligolw.PartialLIGOLWContentHandler):
+		def __init__(self, document):
+			def filterfunc(name, attrs):
+				return name == ligolw.Table.tagName and attrs.has_key("Name") and table.CompareTableNames(attrs.get("Name"), TableType.tableName) == 0
+			ligolw.PartialLIGOLWContentHandler.__init__(self, document, filterfunc)
+
+		def startTable(self, *args):
+			# the attributes are the last argument in all versions
+			# of the content handler interface
+			return StreamTable(args[-1])
+
+	return ContentHandler
+
+
+#
+# =============================================================================
+#
+#                                   Readers
+#
+# =============================================================================
+#
+
+
+def load_triggers(filename, tablename, start = None, end = None, columns = None, filterfunc = None, asarray = False, sort = False, verbose = False):
+	"""
+	Read the table named tablename from a LIGO Light Weight XML file,
+	given by name or as a file object, using StreamContentHandler, see
+	that function for the meaning of the arguments.  Returns a table of
+	TableType, or a numpy structured array if asarray is True.  If sort
+	is True the triggers are put in time order.  A file that does not
+	contain the table gives an empty result.
+	"""
+	TableType = table_type(tablename)
+	loadcolumns = columns
+	if sort:
+		# the time columns are needed to sort the triggers
+		tcols = time_columns(TableType)
+		if loadcolumns is None:
+			loadcolumns = TableType.loadcolumns
+		if loadcolumns is not None:
+			loadcolumns = list(loadcolumns) + [col for col in tcols if col not in loadcolumns]
+	handler = StreamContentHandler(tablename, start = start, end = end, columns = loadcolumns, filterfunc = filterfunc, asarray = asarray)
+	if hasattr(filename, "read"):
+		xmldoc, digest = utils.load_fileobj(filename, gz = getattr(filename, "name", "").endswith(".gz"), contenthandler = handler)
+	else:
+		xmldoc = utils.load_filename(filename, verbose = verbose, gz = (filename or "stdin").endswith(".gz"), contenthandler = handler)
+	tables = table.getTablesByName(xmldoc, TableType.tableName)
+
+	if not asarray:
+		# move the rows to a plain table, so that rows appended
+		# later are not filtered
+		result = lsctables.New(TableType, columns = _loaded_columns(tables, TableType))
+		for tbl in tables:
+			result.extend(tbl)
+		xmldoc.unlink()
+		if sort:
+			tcol, tcol_ns = tcols
+			result.sort(key = lambda row: (getattr(row, tcol), getattr(row, tcol_ns)))
+		return result
+
+	if columns is None:
+		columns = TableType.loadcolumns
+	names = _loaded_columns(tables, TableType)
+	values = dict((name, list(itertools.chain(*(tbl.stream_columns[name] for tbl in tables if hasattr(tbl, "stream_columns"))))) for name in names)
+	xmldoc.unlink()
+	if sort and tables:
+		tcol, tcol_ns = tcols
+		order = numpy.lexsort((numpy.array(values[tcol_ns], dtype = "int64"), numpy.array(values[tcol], dtype = "int64")))
+		values = dict((name, [column[i] for i in order]) for name, column in values.items())
+	if columns is not None:
+		names = [name for name in names if name in columns]
+	return _structured(TableType, names, [values[name] for name in names])
+
+
+def _loaded_columns(tables, TableType):
+	"""
+	Return the names of the columns loaded into the first of the list of
+	tables, or of TableType's loadcolumns (or all of its columns) if the
+	list is empty.
+	"""
+	if tables:
+		loadcolumns = type(tables[0]).loadcolumns
+		return [name for name in tables[0].columnnames if loadcolumns is None or name in loadcolumns]
+	if TableType.loadcolumns is not None:
+		return list(TableType.loadcolumns)
+	return list(TableType.validcolumns)
+
+
+def _load_triggers(args):
+	"""
+	For internal use by read_triggers().  Unpack the arguments for
+	load_triggers(), reading the file as an array.
+	"""
+	filename, tablename, start, end, columns, sort = args
+	return load_triggers(filename, tablename, start = start, end = end, columns = columns, asarray = True, sort = sort)
+
+
+def _union(seqs):
+	"""
+	Return the distinct elements of a sequence of sequences, in the
+	order in which they first appear.
+	"""
+	result = []
+	for seq in seqs:
+		result.extend(x for x in seq if x not in result)
+	return result
+
+
+def concatenate(arrays):
+	"""
+	Concatenate structured arrays of triggers field by field, so that
+	string fields of different widths are combined correctly.  The
+	result has the union of the arrays' fields;  a field missing from
+	some of the arrays is filled with zeros or empty strings for their
+	triggers.  Empty arrays are skipped, as files without the table give
+	all of the table's columns.
+	"""
+	nonempty = [array for array in arrays if len(array)]
+	if len(nonempty) <= 1:
+		return (nonempty or arrays)[0]
+	arrays = nonempty
+	names = _union(array.dtype.names for array in arrays)
+	dtypes = {}
+	for array in arrays:
+		for name in array.dtype.names:
+			dtypes.setdefault(name, array.dtype[name])
+	columns = [numpy.concatenate([array[name] if name in array.dtype.names else numpy.zeros(len(array), dtype = dtypes[name]) for array in arrays]) for name in names]
+	return _fromcolumns(names, columns)
+
+
+def read_triggers(filenames, tablename, start = None, end = None, columns = None, filterfunc = None, asarray = False, sort = False, nprocs = 1, verbose = False):
+	"""
+	Read the table named tablename from each of a list of LIGO Light
+	Weight XML files, keeping only the given columns and the rows whose
+	time is in [start, end) and for which filterfunc(row) is True.
+
+	Returns a single table, or a single numpy structured array if asarray
+	is True, with the union of the columns read from the files.  If nprocs
+	> 1 the files are read by a pool of that many worker processes.  The
+	workers return arrays, from which the rows of the table are then
+	built with totable(), and filterfunc, which cannot be sent to the
+	workers, is applied to those rows.  The triggers are in the order of
+	the files either way;  if sort is True the triggers of each file are
+	put in time order.
+	"""
+	TableType = table_type(tablename)
+
+	if nprocs > 1:
+		pool = multiprocessing.Pool(nprocs)
+		try:
+			arrays = []
+			for n, array in enumerate(pool.imap(_load_triggers, [(filename, tablename, start, end, columns, sort) for filename in filenames]), 1):
+				if verbose:
+					print >>sys.stderr, "%d/%d: %d triggers" % (n, len(filenames), len(array))
+				arrays.append(array)
+		finally:
+			pool.close()
+			pool.join()
+		if arrays:
+			array = concatenate(arrays)
+		else:
+			array = _structured(TableType, _loaded_columns([], TableType), [])
+		if asarray and filterfunc is None:
+			return array
+		result = totable(array, tablename)
+		if filterfunc is not None:
+			keep = [filterfunc(row) for row in result]
+			if asarray:
+				return array[numpy.array(keep, dtype = "bool")]
+			result[:] = [row for row, k in zip(result, keep) if k]
+		return result
+
+	results = []
+	for n, filename in enumerate(filenames, 1):
+		if verbose:
+			print >>sys.stderr, "%d/%d:" % (n, len(filenames)),
+		results.append(load_triggers(filename, tablename, start = start, end = end, columns = columns, filterfunc = filterfunc, asarray = asarray, sort = sort, verbose = verbose))
+
+	if asarray:
+		if results:
+			return concatenate(results)
+		return _structured(TableType, _loaded_columns([], TableType), [])
+
+	if len(results) == 1:
+		return results[0]
+	result = lsctables.New(TableType, columns = _union(tbl.columnnames for tbl in results))
+	for tbl in results:
+		result.extend(tbl)
+	return result
+
+
+def totable(array, tablename):
+	"""
+	Build a table from a structured array made by one of the readers
+	above, with one row per element and the array's fields as columns.
+	ilwd:char IDs stored as strings are converted back.
+	"""
+	TableType = table_type(tablename)
+	names = array.dtype.names
+	result = lsctables.New(TableType, columns = list(names))
+	values = []
+	for name in names:
+		column = array[name].tolist()
+		if TableType.validcolumns[name] == "ilwd:char":
+			column = map(ilwd.ilwdchar, column)
+		values.append(column)
+	RowType = result.RowType
+	append = result.append
+	for rowvalues in itertools.izip(*values):
+		row = RowType()
+		for name, value in zip(names, rowvalues):
+			setattr(row, name, value)
+		append(row)
+	return result
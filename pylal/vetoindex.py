@@ -0,0 +1,204 @@
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+#
+# =============================================================================
+#
+#                                   Preamble
+#
+# =============================================================================
+#
+
+
+"""
+Vectorized segment membership tests.
+
+The veto code paths test one trigger at a time for membership in a
+glue.segments.segmentlist, which is a bisection through Python objects
+per event.  The classes here convert a segmentlist (or a segmentlistdict)
+into sorted arrays of segment boundaries once, after which the
+membership of arrays of millions of times can be tested with
+numpy.searchsorted().  Membership follows the glue.segments convention
+that segments are half-open, i.e. t is in [a, b) if a <= t < b.
+
+Example:
+
+>>> from glue import segments
+>>> index = VetoIndex(segments.segmentlist([segments.segment(0, 10), segments.segment(20, 30)]))
+>>> index.mask([-1., 0., 9.5, 10., 25.]).tolist()
+[False, True, True, False, True]
+>>> index.mask([-1., 0., 9.5, 10., 25.], offset = 1.).tolist()
+[True, True, False, False, True]
+"""
+
+
+import numpy
+
+
+from glue import segments
+from glue.ligolw import lsctables
+from pylal import git_version
+
+
+__version__ = "git id %s" % git_version.id
+__date__ = git_version.date
+
+
+#
+# =============================================================================
+#
+#                                  Utilities
+#
+# =============================================================================
+#
+
+
+# sentinels used in place of infinite segment boundaries when the
+# boundaries are stored as integer nanoseconds
+NS_MIN = numpy.iinfo("int64").min
+NS_MAX = numpy.iinfo("int64").max
+
+
+def boundary_ns(x):
+	"""
+	Convert a segment boundary to integer nanoseconds.  Infinite
+	boundaries are mapped to the extreme values of a 64-bit integer.
+	"""
+	if x == segments.NegInfinity:
+		return NS_MIN
+	if x == segments.PosInfinity:
+		return NS_MAX
+	return lsctables.LIGOTimeGPS(x).ns()
+
+
+def segment_boundaries(seglist):
+	"""
+	Return a tuple of two sorted float64 arrays containing the start
+	and end times of the segments in seglist, after coalescing.  The
+	segmentlist is not modified.
+	"""
+	seglist = segments.segmentlist(seglist).coalesce()
+	return numpy.array([float(seg[0]) for seg in seglist], dtype = "double"), numpy.array([float(seg[1]) for seg in seglist], dtype = "double")
+
+
+def segment_boundaries_ns(seglist):
+	"""
+	Return a tuple of two sorted int64 arrays containing the start and
+	end times, in integer nanoseconds, of the segments in seglist,
+	after coalescing.  The segmentlist is not modified.
+	"""
+	seglist = segments.segmentlist(seglist).coalesce()
+	return numpy.array([boundary_ns(seg[0]) for seg in seglist], dtype = "int64"), numpy.array([boundary_ns(seg[1]) for seg in seglist], dtype = "int64")
+
+
+def _mask(starts, ends, times):
+	# index of the last segment starting at or before each time.  the
+	# segments are disjoint, so a time is inside a segment if and only
+	# if it is inside that one
+	i = starts.searchsorted(times, side = "right") - 1
+	if not len(ends):
+		return numpy.zeros(i.shape, dtype = "bool")
+	return (i >= 0) & (times < ends[numpy.maximum(i, 0)])
+
+
+#
+# =============================================================================
+#
+#                                 Veto Index
+#
+# =============================================================================
+#
+
+
+class VetoIndex(object):
+	"""
+	Sorted arrays of the boundaries of the segments in a segmentlist,
+	for testing the membership of arrays of times.  Two
+	representations are kept:  float64 seconds, for use with times
+	that are already floats, and int64 nanoseconds, for use with the
+	integer nanosecond times of the event list classes in
+	pylal.snglcoinc.  Testing float times against the float64
+	boundaries gives the same answer as testing float(t) in seglist.
+	"""
+	def __init__(self, seglist):
+		self.starts, self.ends = segment_boundaries(seglist)
+		self.starts_ns, self.ends_ns = segment_boundaries_ns(seglist)
+
+	def __len__(self):
+		return len(self.starts)
+
+	def mask(self, times, offset = 0.0):
+		"""
+		Return an array of booleans, True for each time in the
+		sequence times that, after adding offset, lies in one of the
+		segments.  offset can be a scalar or an array of the same
+		length as times (e.g., a per-event time-slide offset).
+		"""
+		times = numpy.asarray(times, dtype = "double") + offset
+		return _mask(self.starts, self.ends, times)
+
+	def mask_ns(self, times_ns, offset_ns = 0):
+		"""
+		Same as .mask() but times and the offset are in integer
+		nanoseconds.
+		"""
+		times_ns = numpy.asarray(times_ns, dtype = "int64") + offset_ns
+		return _mask(self.starts_ns, self.ends_ns, times_ns)
+
+
+class VetoIndexDict(dict):
+	"""
+	A dictionary of VetoIndex objects, indexed by instrument,
+	initialized from a glue.segments.segmentlistdict.
+	"""
+	def __init__(self, seglistdict):
+		super(VetoIndexDict, self).__init__((instrument, VetoIndex(seglist)) for instrument, seglist in seglistdict.items())
+
+	def mask(self, instrument, times, offset = 0.0):
+		"""
+		Return an array of booleans, True for each time from the
+		given instrument that, after adding offset, lies in that
+		instrument's segments.  Instruments for which there are no
+		segments veto nothing.
+		"""
+		if instrument not in self:
+			return numpy.zeros(numpy.shape(times), dtype = "bool")
+		return self[instrument].mask(times, offset)
+
+	def mask_ns(self, instrument, times_ns, offset_ns = 0):
+		"""
+		Same as .mask() but times and the offset are in integer
+		nanoseconds.
+		"""
+		if instrument not in self:
+			return numpy.zeros(numpy.shape(times_ns), dtype = "bool")
+		return self[instrument].mask_ns(times_ns, offset_ns)
+
+	def mask_any(self, times, offsets):
+		"""
+		Return an array of booleans, True for each time that lies in
+		the segments of any of the instruments once that
+		instrument's time-slide offset has been added.  offsets is a
+		dictionary mapping instrument to a scalar or an array of
+		per-event offsets;  only the instruments named in offsets are
+		tested.  This is the test for a multi-detector trigger
+		whose time is vetoed if any of the detectors that contributed
+		to it was vetoed at its shifted time.
+		"""
+		times = numpy.asarray(times, dtype = "double")
+		result = numpy.zeros(times.shape, dtype = "bool")
+		for instrument, offset in offsets.items():
+			result |= self.mask(instrument, times, offset)
+		return result
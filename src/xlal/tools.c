@@ -29,6 +29,7 @@
 #include <Python.h>
 #include <structmember.h>
 #include <string.h>
+#include <numpy/arrayobject.h>
 #include <lal/DetectorSite.h>
 #include <misc.h>
 #include <tools.h>
@@ -303,6 +304,87 @@ static PyObject *pylal_XLALCalculateEThincaParameter(PyObject *self, PyObject *a
 	return PyFloat_FromDouble(result);
 }
 
+static PyObject *pylal_XLALCalculateEThincaParameterArray(PyObject *self, PyObject *args)
+{
+	static InspiralAccuracyList accuracyparams;
+	static int accuracyparams_set = 0;
+	/* end, offset, tau0, tau3, Gamma for the first events then the
+	 * same for the second events */
+	static const int types[10] = {NPY_INT64, NPY_INT64, NPY_FLOAT64, NPY_FLOAT64, NPY_FLOAT64, NPY_INT64, NPY_INT64, NPY_FLOAT64, NPY_FLOAT64, NPY_FLOAT64};
+	static const int ndims[10] = {1, 1, 1, 1, 2, 1, 1, 1, 1, 2};
+	const char *ifo1, *ifo2;
+	PyObject *objs[10];
+	PyArrayObject *arrays[10] = {NULL,};
+	PyArrayObject *result = NULL;
+	SnglInspiralTable row1, row2;
+	npy_intp n, i;
+	int j;
+
+	if(!PyArg_ParseTuple(args, "sOOOOOsOOOOO:XLALCalculateEThincaParameterArray", &ifo1, &objs[0], &objs[1], &objs[2], &objs[3], &objs[4], &ifo2, &objs[5], &objs[6], &objs[7], &objs[8], &objs[9]))
+		return NULL;
+
+	for(j = 0; j < 10; j++) {
+		arrays[j] = (PyArrayObject *) PyArray_FromAny(objs[j], PyArray_DescrFromType(types[j]), ndims[j], ndims[j], NPY_CONTIGUOUS | NPY_ALIGNED, NULL);
+		if(!arrays[j])
+			goto done;
+	}
+	n = PyArray_DIM(arrays[0], 0);
+	for(j = 0; j < 10; j++)
+		if(PyArray_DIM(arrays[j], 0) != n || (ndims[j] == 2 && PyArray_DIM(arrays[j], 1) != 10)) {
+			PyErr_SetString(PyExc_ValueError, "XLALCalculateEThincaParameterArray() arrays must have the same length, and metric arrays must have shape (n, 10)");
+			goto done;
+		}
+
+	if(!accuracyparams_set) {
+		memset(&accuracyparams, 0, sizeof(accuracyparams));
+		XLALPopulateAccuracyParams(&accuracyparams);
+		accuracyparams_set = 1;
+	}
+
+	memset(&row1, 0, sizeof(row1));
+	memset(&row2, 0, sizeof(row2));
+	strncpy(row1.ifo, ifo1, LIGOMETA_IFO_MAX - 1);
+	strncpy(row2.ifo, ifo2, LIGOMETA_IFO_MAX - 1);
+
+	result = (PyArrayObject *) PyArray_SimpleNew(1, &n, NPY_FLOAT64);
+	if(!result)
+		goto done;
+
+	{
+	const npy_int64 *end1 = PyArray_DATA(arrays[0]), *offset1 = PyArray_DATA(arrays[1]);
+	const double *tau0_1 = PyArray_DATA(arrays[2]), *tau3_1 = PyArray_DATA(arrays[3]), *Gamma1 = PyArray_DATA(arrays[4]);
+	const npy_int64 *end2 = PyArray_DATA(arrays[5]), *offset2 = PyArray_DATA(arrays[6]);
+	const double *tau0_2 = PyArray_DATA(arrays[7]), *tau3_2 = PyArray_DATA(arrays[8]), *Gamma2 = PyArray_DATA(arrays[9]);
+	double *ethinca = PyArray_DATA(result);
+
+	for(i = 0; i < n; i++) {
+		XLALINT8NSToGPS(&row1.end_time, end1[i] + offset1[i]);
+		row1.tau0 = tau0_1[i];
+		row1.tau3 = tau3_1[i];
+		XLALINT8NSToGPS(&row2.end_time, end2[i] + offset2[i]);
+		row2.tau0 = tau0_2[i];
+		row2.tau3 = tau3_2[i];
+		for(j = 0; j < 10; j++) {
+			row1.Gamma[j] = Gamma1[10 * i + j];
+			row2.Gamma[j] = Gamma2[10 * i + j];
+		}
+
+		ethinca[i] = XLALCalculateEThincaParameter(&row1, &row2, &accuracyparams);
+
+		/* failure to converge == not coincident */
+		if(XLAL_IS_REAL8_FAIL_NAN(ethinca[i])) {
+			XLALClearErrno();
+			ethinca[i] = Py_HUGE_VAL;
+		}
+	}
+	}
+
+done:
+	for(j = 0; j < 10; j++)
+		Py_XDECREF(arrays[j]);
+	return (PyObject *) result;
+}
+
 
 /*
  * sngl_ringdown related coincidence stuff.
@@ -360,6 +442,7 @@ static PyObject *pylal_XLAL3DRinca(PyObject *self, PyObject *args)
 static struct PyMethodDef methods[] = {
 	{"XLALSnglInspiralTimeError", pylal_XLALSnglInspiralTimeError, METH_VARARGS, "XLALSnglInspiralTimeError(row, threshold)\n\nFrom a sngl_inspiral event compute the \\Delta t interval corresponding to the given e-thinca threshold."},
 	{"XLALCalculateEThincaParameter", pylal_XLALCalculateEThincaParameter, METH_VARARGS, "XLALCalculateEThincaParameter(row1, row2)\n\nTakes two SnglInspiralTable objects and\ncalculates the overlap factor between them."},
+	{"XLALCalculateEThincaParameterArray", pylal_XLALCalculateEThincaParameterArray, METH_VARARGS, "XLALCalculateEThincaParameterArray(ifo1, end1, offset1, tau0_1, tau3_1, Gamma1, ifo2, end2, offset2, tau0_2, tau3_2, Gamma2)\n\nVectorized version of XLALCalculateEThincaParameter().  For n pairs of\nevents from instruments ifo1 and ifo2, takes arrays of end times and time\nshifts (integer nanoseconds), tau0s, tau3s, and (n, 10) arrays of metric\ncomponents (Gamma0 ... Gamma9), and returns an array of the n overlap\nfactors.  Pairs for which the calculation fails to converge are assigned\n+inf."},
 	{"XLALRingdownTimeError", pylal_XLALRingdownTimeError, METH_VARARGS, "XLALRingdownTimeError(row, ds^2)\n\nFrom a sngl_ringdown event compute the \\Delta t interval corresponding to the given ds^2 threshold."},
 	{"XLAL3DRinca", pylal_XLAL3DRinca, METH_VARARGS, "XLAL3DRinca(row1, row)\n\nTakes two SnglRingdown objects and\ncalculates the distance, ds^2, between them."},
 	{NULL,}
@@ -372,6 +455,7 @@ PyMODINIT_FUNC inittools(void)
 	if(!module)
 		goto nomodule;
 
+	import_array();
 	pylal_snglinspiraltable_import();
 	pylal_snglringdowntable_import();
 
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+"""
+Benchmark script comparing the sql and array clustering engines of
+ligolw_cbc_cluster_coincs (pylal.ligolw_sqlutils.cluster_coincs_sql and
+pylal.ligolw_sqlutils.cluster_coincs_by_window) on a synthetic database.
+"""
+
+import sqlite3
+import sys
+from timeit import default_timer
+
+import numpy as np
+
+from pylal import ligolw_sqlutils as sqlutils
+
+
+def make_database(count_coincs, count_esids, seed = 0):
+	"""
+	Build an in-memory database holding a coinc_inspiral table and an
+	experiment_map table, with every coinc mapped to one or two esids
+	the way zero-lag coincs are mapped to all_data and playground.
+	"""
+	rng = np.random.RandomState(seed)
+	connection = sqlite3.connect(":memory:")
+	connection.execute("CREATE TABLE coinc_inspiral (coinc_event_id INTEGER, ifos TEXT, end_time INTEGER, end_time_ns INTEGER, snr REAL)")
+	connection.execute("CREATE TABLE experiment_map (experiment_summ_id INTEGER, coinc_event_id INTEGER)")
+	times = np.sort(rng.uniform(0, count_coincs / 10., count_coincs))
+	ifos = rng.choice(["H1,L1", "H1,V1", "H1,L1,V1"], count_coincs)
+	snrs = rng.gamma(4., 2., count_coincs).round(1)
+	connection.executemany("INSERT INTO coinc_inspiral VALUES (?, ?, ?, ?, ?)", ((n, ifos[n], 900000000 + int(times[n]), int((times[n] % 1.) * 1e9), float(snrs[n])) for n in xrange(count_coincs)))
+	connection.executemany("INSERT INTO experiment_map VALUES (?, ?)", ((int(rng.randint(count_esids)), n) for n in xrange(count_coincs)))
+	connection.executemany("INSERT INTO experiment_map VALUES (?, ?)", ((count_esids, n) for n in xrange(0, count_coincs, 3)))
+	connection.commit()
+	return connection
+
+
+# the self-join stops at the first better coinc it finds, so it is cheap
+# when most coincs lose;  a stat with many ties (such as a quantized FAR)
+# makes every coinc scan its whole window.  the array engine's cost does
+# not depend on either
+stats = {
+	"snr": "coinc_inspiral.snr",
+	"quantized": "round(coinc_inspiral.snr / 10.)"
+}
+
+sqlquery = """
+	SELECT
+		experiment_map.experiment_summ_id AS esid,
+		experiment_map.coinc_event_id AS ceid,
+		coinc_inspiral.ifos AS ifos,
+		coinc_inspiral.end_time * 1e9 + coinc_inspiral.end_time_ns AS gps_time,
+		0 AS param_grouping,
+		%s AS ranking_stat
+	FROM
+		coinc_inspiral
+	JOIN
+		experiment_map
+	ON
+		experiment_map.coinc_event_id == coinc_inspiral.coinc_event_id"""
+
+
+def survivors(connection):
+	return sorted(connection.execute("SELECT experiment_summ_id, coinc_event_id FROM experiment_map"))
+
+
+for stat in ("snr", "quantized"):
+	for window in (10., 100.):
+		for count_coincs in (1000, 10000, 50000):
+			for rank_by in ("MAX", "MIN"):
+				results = {}
+				for name, func in (("sql", sqlutils.cluster_coincs_sql), ("array", sqlutils.cluster_coincs_by_window)):
+					connection = make_database(count_coincs, 1)
+					start = default_timer()
+					func(connection, sqlquery % stats[stat], window * 1e9, rank_by = rank_by)
+					results[name] = (default_timer() - start, survivors(connection))
+					connection.close()
+				if results["sql"][1] != results["array"][1]:
+					raise AssertionError("engines disagree for %s, %g s window, %d coincs, rank_by = %s" % (stat, window, count_coincs, rank_by))
+				print >>sys.stderr, "%9s, %3g s window, %5d coincs, %s: %5d survive, sql %.3f s, array %.3f s" % (stat, window, count_coincs, rank_by, len(results["sql"][1]), results["sql"][0], results["array"][0])
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the
+# Free Software Foundation; either version 2 of the License, or (at your
+# option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+#
+"""
+Unit test suite for pylal.snglcluster.
+"""
+
+
+import unittest
+import numpy as np
+from pylal.snglcluster import cluster_events, cluster_events_by_time
+
+
+def time(event):
+	return event[0]
+
+
+def loudest(a, b):
+	if b[1] >= a[1]:
+		return b
+	return a
+
+
+def merge(a, b):
+	return ((a[0] * a[1] + b[0] * b[1]) / (a[1] + b[1]), a[1] + b[1])
+
+
+class TestClusterByTime(unittest.TestCase):
+
+	def setUp(self):
+		count_trials = 2000
+		times = np.cumsum(np.random.exponential(1., count_trials))
+		# quantized values so there are ties
+		vals = np.random.random_integers(1, 20, count_trials).astype(float)
+		self.indata = zip(times.tolist(), vals.tolist())
+		self.window = 3.
+
+	def cluster_events(self, clusterfunc):
+		events = list(self.indata)
+		testfunc = lambda a, b: abs(time(a) - time(b)) >= self.window and cmp(time(a), time(b))
+		cluster_events(events, testfunc, clusterfunc, sortfunc = lambda a, b: cmp(time(a), time(b)), bailoutfunc = testfunc)
+		return events
+
+	def test_loudest(self):
+		"""Compare keep-the-loudest clustering with cluster_events()."""
+		self.assertEqual(list(cluster_events_by_time(self.indata, time, self.window, loudest)), self.cluster_events(loudest))
+
+	def test_merge(self):
+		"""Compare averaging clustering with cluster_events()."""
+		self.assertEqual(list(cluster_events_by_time(self.indata, time, self.window, merge)), self.cluster_events(merge))
+
+	def test_generator(self):
+		"""Cluster events from a generator."""
+		self.assertEqual(list(cluster_events_by_time(iter(self.indata), time, self.window, loudest)), self.cluster_events(loudest))
+
+	def test_order(self):
+		"""Out-of-order events are an error."""
+		self.assertRaises(ValueError, list, cluster_events_by_time(self.indata[::-1], time, self.window, loudest))
+
+
+if __name__ == '__main__':
+	suite = unittest.main()